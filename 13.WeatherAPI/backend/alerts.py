@@ -0,0 +1,303 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Alert Rules — declarative, vectorized alert evaluation.
+
+Each alert type is one AlertRule over columns of the daily frame (all cities ×
+all days), evaluated in a single lazy Polars query. New alerts are then
+deduplicated against alerts already active in Supabase, and active alerts the
+latest forecast no longer supports are retired.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import polars as pl
+from supabase import Client
+
+from config import THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+ALERT_COLUMNS = [
+    "city_id", "alert_type", "severity", "title", "description",
+    "value", "threshold", "starts_at", "expires_at", "is_active",
+]
+ALERT_SCHEMA = {
+    **{column: pl.Utf8 for column in ALERT_COLUMNS},
+    "value": pl.Float64, "threshold": pl.Float64, "is_active": pl.Boolean,
+}
+DEDUP_KEY = ["city_id", "alert_type", "starts_at", "severity"]
+RETIRE_BATCH = 200           # alert ids per UPDATE ... IN (...) request
+PAGE_SIZE = 1000             # PostgREST default max rows per response
+
+
+def _fmt(column: str, decimals: int) -> pl.Expr:
+    """Number → text with fixed decimals, like f"{value:.{decimals}f}"."""
+    rounded = pl.col(column).fill_null(0).round(decimals)
+    return (rounded.cast(pl.Int64) if decimals == 0 else rounded).cast(pl.Utf8)
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    alert_type: str
+    condition: pl.Expr
+    severity: pl.Expr
+    title: pl.Expr
+    description: pl.Expr
+    value: pl.Expr
+    threshold: float | None
+
+
+# ============================================
+# Rule Table (Rajasthan-Specific)
+# ============================================
+CITY = pl.col("city_name")
+DATE = pl.col("date")
+AQI = pl.col("aqi_max")
+
+ALERT_RULES: list[AlertRule] = [
+    AlertRule(
+        alert_type="heatwave",
+        condition=pl.col("temp_max") > THRESHOLDS["heatwave_temp"],
+        severity=pl.when(pl.col("temp_max") > THRESHOLDS["extreme_heat_temp"]).then(pl.lit("extreme")).otherwise(pl.lit("high")),
+        title=pl.format(
+            "🔥 {}Heatwave Alert — {}",
+            pl.when(pl.col("temp_max") > THRESHOLDS["extreme_heat_temp"]).then(pl.lit("Severe ")).otherwise(pl.lit("")),
+            CITY,
+        ),
+        description=pl.format(
+            "Temperature expected to reach {}°C on {}. Stay hydrated, avoid outdoor exposure between 11 AM - 4 PM.",
+            _fmt("temp_max", 1), DATE,
+        ),
+        value=pl.col("temp_max"),
+        threshold=THRESHOLDS["heatwave_temp"],
+    ),
+    AlertRule(
+        alert_type="cold_wave",
+        condition=pl.col("temp_min") <= THRESHOLDS["cold_wave_temp"],
+        severity=pl.lit("high"),
+        title=pl.format("❄️ Cold Wave Alert — {}", CITY),
+        description=pl.format(
+            "Minimum temperature expected to drop to {}°C on {}. Keep warm at night and protect crops from frost.",
+            _fmt("temp_min", 1), DATE,
+        ),
+        value=pl.col("temp_min"),
+        threshold=THRESHOLDS["cold_wave_temp"],
+    ),
+    AlertRule(
+        alert_type="dust_storm",
+        condition=pl.col("is_dust_storm_risk"),
+        severity=pl.lit("high"),
+        title=pl.format("🏜️ Dust Storm Risk — {}", CITY),
+        description=pl.format(
+            "High dust concentration ({} µg/m³) with strong winds ({} km/h). Thar Desert dust advisory in effect.",
+            _fmt("dust_mean", 0), _fmt("wind_speed_max", 0),
+        ),
+        value=pl.col("dust_mean").fill_null(0),
+        threshold=THRESHOLDS["dust_storm_dust"],
+    ),
+    AlertRule(
+        alert_type="heavy_rain",
+        condition=pl.col("precipitation_sum") > THRESHOLDS["heavy_rain_mm"],
+        severity=pl.when(pl.col("precipitation_sum") > THRESHOLDS["very_heavy_rain_mm"]).then(pl.lit("extreme")).otherwise(pl.lit("high")),
+        title=pl.format(
+            "🌧️ {}Heavy Rain — {}",
+            pl.when(pl.col("precipitation_sum") > THRESHOLDS["very_heavy_rain_mm"]).then(pl.lit("Very ")).otherwise(pl.lit("")),
+            CITY,
+        ),
+        description=pl.format(
+            "Expected rainfall: {}mm on {}. Waterlogging and flash floods possible.",
+            _fmt("precipitation_sum", 1), DATE,
+        ),
+        value=pl.col("precipitation_sum"),
+        threshold=THRESHOLDS["heavy_rain_mm"],
+    ),
+    AlertRule(
+        alert_type="thunderstorm",
+        condition=pl.col("weather_code").is_in(THRESHOLDS["thunderstorm_codes"]),
+        severity=pl.when(pl.col("weather_code") == 99).then(pl.lit("extreme")).otherwise(pl.lit("high")),
+        title=pl.format("⛈️ Thunderstorm Warning — {}", CITY),
+        description=pl.format(
+            "Thunderstorms expected on {}. Stay indoors during lightning and avoid open fields and trees.",
+            DATE,
+        ),
+        value=pl.col("weather_code").cast(pl.Float64),
+        threshold=None,
+    ),
+    AlertRule(
+        alert_type="fog",
+        condition=(pl.col("visibility_min") < THRESHOLDS["fog_visibility"]) | pl.col("weather_code").is_in([45, 48]),
+        severity=pl.lit("moderate"),
+        title=pl.format("🌫️ Dense Fog — {}", CITY),
+        description=pl.format(
+            "Visibility may drop to {} m on {}. Drive slowly with low-beam lights; expect flight and train delays.",
+            _fmt("visibility_min", 0), DATE,
+        ),
+        value=pl.col("visibility_min"),
+        threshold=THRESHOLDS["fog_visibility"],
+    ),
+    AlertRule(
+        alert_type="hazardous_aqi",
+        condition=AQI > THRESHOLDS["hazardous_aqi"],
+        severity=pl.lit("extreme"),
+        title=pl.format("☠️ Hazardous Air Quality — {}", CITY),
+        description=pl.format(
+            "US AQI: {}. Health emergency! Avoid all outdoor activity. Wear N95 masks if going outside.",
+            _fmt("aqi_max", 0),
+        ),
+        value=AQI,
+        threshold=THRESHOLDS["hazardous_aqi"],
+    ),
+    AlertRule(
+        alert_type="very_poor_aqi",
+        condition=(AQI > THRESHOLDS["very_poor_aqi"]) & (AQI <= THRESHOLDS["hazardous_aqi"]),
+        severity=pl.lit("high"),
+        title=pl.format("😷 Very Poor Air Quality — {}", CITY),
+        description=pl.format("US AQI: {}. Unhealthy for everyone. Reduce outdoor activities.", _fmt("aqi_max", 0)),
+        value=AQI,
+        threshold=THRESHOLDS["very_poor_aqi"],
+    ),
+    AlertRule(
+        alert_type="poor_aqi",
+        condition=(AQI > THRESHOLDS["poor_aqi"]) & (AQI <= THRESHOLDS["very_poor_aqi"]),
+        severity=pl.lit("moderate"),
+        title=pl.format("⚠️ Moderate Air Quality Concern — {}", CITY),
+        description=pl.format("US AQI: {}. Sensitive groups should reduce outdoor exertion.", _fmt("aqi_max", 0)),
+        value=AQI,
+        threshold=THRESHOLDS["poor_aqi"],
+    ),
+    AlertRule(
+        alert_type="high_uv",
+        condition=pl.col("uv_index_max") > THRESHOLDS["high_uv"],
+        severity=pl.lit("moderate"),
+        title=pl.format("☀️ Very High UV Index — {}", CITY),
+        description=pl.format(
+            "UV Index: {}. Apply SPF 30+ sunscreen, wear protective clothing.", _fmt("uv_index_max", 1)
+        ),
+        value=pl.col("uv_index_max"),
+        threshold=THRESHOLDS["high_uv"],
+    ),
+]
+
+
+# ============================================
+# Evaluation
+# ============================================
+def daily_visibility(hourly: pl.DataFrame) -> pl.DataFrame:
+    """Minimum hourly visibility per city and day (the daily API has no visibility)."""
+    if hourly.is_empty() or "visibility" not in hourly.columns:
+        return pl.DataFrame(schema={"city_id": pl.Utf8, "date": pl.Utf8, "visibility_min": pl.Float64})
+    return hourly.group_by(
+        "city_id", pl.col("recorded_at").str.slice(0, 10).alias("date")
+    ).agg(pl.col("visibility").min().alias("visibility_min"))
+
+
+def _day_bounds() -> list[pl.Expr]:
+    return [
+        pl.format("{}T00:00:00Z", DATE).alias("starts_at"),
+        pl.format("{}T23:59:59Z", DATE).alias("expires_at"),
+    ]
+
+
+def evaluate_rules(daily: pl.DataFrame, rules: list[AlertRule] = ALERT_RULES) -> pl.DataFrame:
+    """
+    Evaluate every rule over all cities × days in one lazy query.
+
+    `daily` is the concatenated daily_aggregates frame plus `city_name` and
+    `visibility_min` columns.
+    """
+    if daily.is_empty():
+        return pl.DataFrame(schema=ALERT_SCHEMA)
+
+    frame = daily.rechunk().lazy().with_columns(*_day_bounds())
+    return pl.concat(
+        [
+            frame.filter(rule.condition.fill_null(False)).select(
+                "city_id",
+                pl.lit(rule.alert_type).alias("alert_type"),
+                rule.severity.alias("severity"),
+                rule.title.alias("title"),
+                rule.description.alias("description"),
+                rule.value.cast(pl.Float64).alias("value"),
+                pl.lit(rule.threshold, dtype=pl.Float64).alias("threshold"),
+                "starts_at",
+                "expires_at",
+                pl.lit(True).alias("is_active"),
+            )
+            for rule in rules
+        ],
+        how="vertical_relaxed",
+    ).collect()
+
+
+# ============================================
+# Deduplication Against Active Alerts
+# ============================================
+def load_active_alerts(client: Client, city_ids: list[str]) -> pl.DataFrame:
+    """Active, unexpired alerts for the given cities (paged; filtered locally to keep URLs short)."""
+    schema = {"id": pl.Utf8, "city_id": pl.Utf8, "alert_type": pl.Utf8, "starts_at": pl.Utf8, "severity": pl.Utf8}
+    now = datetime.now(timezone.utc).isoformat()
+    rows, offset = [], 0
+    while True:
+        page = client.table("alerts").select(
+            "id, city_id, alert_type, starts_at, severity"
+        ).eq("is_active", True).gte("expires_at", now).order("id").range(
+            offset, offset + PAGE_SIZE - 1
+        ).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+
+    # Normalize Postgres timestamptz text ("2025-05-01T00:00:00+00:00") to our "...Z" form
+    return pl.DataFrame(rows, schema=schema).filter(pl.col("city_id").is_in(city_ids)).with_columns(
+        (pl.col("starts_at").str.slice(0, 19) + "Z").alias("starts_at")
+    )
+
+
+def drop_expired(new_alerts: pl.DataFrame) -> pl.DataFrame:
+    """Drop alerts for days already over (past days the forecast response still carries)."""
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return new_alerts.filter(pl.col("expires_at") >= now)
+
+
+def evaluated_days(daily: pl.DataFrame) -> pl.DataFrame:
+    """City/day pairs the rules were evaluated over and that are not over yet (city_id, starts_at)."""
+    if daily.is_empty():
+        return pl.DataFrame(schema={"city_id": pl.Utf8, "starts_at": pl.Utf8})
+    days = daily.select("city_id", *_day_bounds())
+    return drop_expired(days).select("city_id", "starts_at").unique()
+
+
+def reconcile_alerts(
+    new_alerts: pl.DataFrame, active: pl.DataFrame, evaluated: pl.DataFrame
+) -> tuple[pl.DataFrame, list[str]]:
+    """
+    Split into (alerts to insert, ids of active alerts to retire).
+
+    An alert already active with the same city, type, day and severity is not
+    inserted again. An active rule-generated alert for an evaluated city/day
+    (`evaluated`, from evaluated_days) that the new evaluation no longer
+    produces (cleared or changed severity) is retired — including days on
+    which no rule fires at all.
+    """
+    to_insert = new_alerts.join(active.select(DEDUP_KEY), on=DEDUP_KEY, how="anti")
+
+    rule_types = [rule.alert_type for rule in ALERT_RULES]
+    stale = (
+        active.filter(pl.col("alert_type").is_in(rule_types))
+        .join(evaluated, on=["city_id", "starts_at"], how="semi")
+        .join(new_alerts.select(DEDUP_KEY), on=DEDUP_KEY, how="anti")
+    )
+    return to_insert, stale["id"].to_list()
+
+
+def retire_alerts(client: Client, alert_ids: list[str]) -> None:
+    for start in range(0, len(alert_ids), RETIRE_BATCH):
+        try:
+            client.table("alerts").update({"is_active": False}).in_(
+                "id", alert_ids[start:start + RETIRE_BATCH]
+            ).execute()
+        except Exception as e:
+            logger.error(f"❌ Failed to retire stale alerts: {e}")
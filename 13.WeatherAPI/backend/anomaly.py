@@ -0,0 +1,204 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Anomaly Detection — streaming per-city, per-hour-of-day baselines.
+
+Each (city, metric, hour of day) keeps an exponentially weighted mean and
+variance in a small Parquet state file next to the response cache. Every run
+scores only the observed hours it has not seen before against that baseline
+(O(1) per row: one join, one update), flags values more than ANOMALY_Z_SCORE
+standard deviations out as `anomaly` alerts, and folds them into the
+baseline. Nothing is recomputed from history.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from alerts import ALERT_SCHEMA
+from cache import _atomic_write
+from config import (
+    ANOMALY_ALERT_HOURS,
+    ANOMALY_EWMA_ALPHA,
+    ANOMALY_METRICS,
+    ANOMALY_MIN_SAMPLES,
+    ANOMALY_Z_SCORE,
+    TIMEZONE,
+)
+
+logger = logging.getLogger(__name__)
+
+BASELINE_KEY = ["city_id", "metric", "hour"]
+BASELINE_SCHEMA = {
+    "city_id": pl.Utf8, "metric": pl.Utf8, "hour": pl.Int8,
+    "mean": pl.Float64, "var": pl.Float64, "n": pl.Int32,
+}
+WATERMARK_SCHEMA = {"city_id": pl.Utf8, "metric": pl.Utf8, "last_seen": pl.Utf8}
+OBSERVATION_SCHEMA = {
+    "city_id": pl.Utf8, "city_name": pl.Utf8, "metric": pl.Utf8, "recorded_at": pl.Utf8, "value": pl.Float64,
+}
+
+
+def _metric_attr(index: int, dtype: pl.DataType) -> pl.Expr:
+    """Per-row lookup of one ANOMALY_METRICS field by the `metric` column."""
+    return pl.col("metric").replace_strict(
+        {metric: spec[index] for metric, spec in ANOMALY_METRICS.items()}, return_dtype=dtype
+    )
+
+
+class AnomalyDetector:
+    """Scores new observed hours against persisted EWMA baselines and raises anomaly alerts."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory) / "anomaly"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.baselines = self._load("baselines", BASELINE_SCHEMA)
+        self.watermarks = self._load("watermarks", WATERMARK_SCHEMA)
+        self.scored = 0
+        self._observations: list[pl.DataFrame] = []
+        self._lock = threading.Lock()
+
+    def _load(self, name: str, schema: dict) -> pl.DataFrame:
+        path = self.directory / f"{name}.parquet"
+        if path.exists():
+            try:
+                return pl.read_parquet(path).cast(schema)
+            except Exception as e:
+                logger.warning(f"⚠️ Ignoring unreadable anomaly state {path.name}: {e}")
+        return pl.DataFrame(schema=schema)
+
+    def add(self, city_name: str, *frames: pl.DataFrame) -> None:
+        """Queue one city's hourly weather / AQI frames (long format, tracked metrics only)."""
+        long = [
+            frame.unpivot(
+                on=[m for m in ANOMALY_METRICS if m in frame.columns],
+                index=["city_id", "recorded_at"], variable_name="metric", value_name="value",
+            ).with_columns(pl.lit(city_name).alias("city_name"))
+            for frame in frames
+            if not frame.is_empty() and any(m in frame.columns for m in ANOMALY_METRICS)
+        ]
+        if long:
+            with self._lock:
+                self._observations.extend(long)
+
+    def evaluate(self) -> pl.DataFrame:
+        """Score and fold every queued observed hour newer than the city's watermark; returns alerts."""
+        with self._lock:
+            frames, self._observations = self._observations, []
+        if not frames:
+            return pl.DataFrame(schema=ALERT_SCHEMA)
+
+        now = datetime.now(ZoneInfo(TIMEZONE)).strftime("%Y-%m-%dT%H:%M")
+        fresh = (
+            pl.concat(frames, how="vertical_relaxed").select(OBSERVATION_SCHEMA.keys()).cast(OBSERVATION_SCHEMA)
+            .drop_nulls("value")
+            .filter(pl.col("recorded_at") <= now)
+            .unique(["city_id", "metric", "recorded_at"])
+            .join(self.watermarks, on=["city_id", "metric"], how="left")
+            .filter(pl.col("last_seen").is_null() | (pl.col("recorded_at") > pl.col("last_seen")))
+            .drop("last_seen")
+            .with_columns(pl.col("recorded_at").str.slice(11, 2).cast(pl.Int8).alias("hour"))
+            .sort("recorded_at")
+            # Several days of the same hour (first run, after an outage) fold in day order
+            .with_columns(pl.int_range(pl.len()).over(BASELINE_KEY).alias("_round"))
+        )
+        if fresh.is_empty():
+            return pl.DataFrame(schema=ALERT_SCHEMA)
+
+        scored = []
+        for round_no in range(fresh["_round"].max() + 1):
+            batch = fresh.filter(pl.col("_round") == round_no).join(self.baselines, on=BASELINE_KEY, how="left")
+            std = pl.col("var").sqrt().clip(lower_bound=_metric_attr(2, pl.Float64))
+            batch = batch.with_columns(std.alias("std")).with_columns(
+                pl.when(pl.col("n") >= ANOMALY_MIN_SAMPLES)
+                .then((pl.col("value") - pl.col("mean")) / pl.col("std"))
+                .alias("z")
+            )
+            scored.append(batch)
+            self._fold(batch)
+
+        self.watermarks = pl.concat([
+            self.watermarks,
+            fresh.group_by("city_id", "metric").agg(pl.col("recorded_at").max().alias("last_seen")),
+        ]).group_by("city_id", "metric").agg(pl.col("last_seen").max())
+        self.scored += len(fresh)
+        return anomaly_alerts(pl.concat(scored, how="vertical_relaxed"))
+
+    def _fold(self, batch: pl.DataFrame) -> None:
+        """EWMA update of each touched baseline; outliers are clipped to ±z·σ before folding in."""
+        a = ANOMALY_EWMA_ALPHA
+        limit = ANOMALY_Z_SCORE * pl.col("std")
+        x = pl.col("value").clip(pl.col("mean") - limit, pl.col("mean") + limit)
+        delta = x - pl.col("mean")
+        updated = batch.select(
+            *BASELINE_KEY,
+            pl.when(pl.col("n").is_null()).then(pl.col("value")).otherwise(pl.col("mean") + a * delta).alias("mean"),
+            pl.when(pl.col("n").is_null()).then(0.0).otherwise((1 - a) * (pl.col("var") + a * delta**2)).alias("var"),
+            (pl.col("n").fill_null(0) + 1).cast(pl.Int32).alias("n"),
+        )
+        self.baselines = pl.concat([
+            self.baselines.join(updated.select(BASELINE_KEY), on=BASELINE_KEY, how="anti"),
+            updated,
+        ])
+
+    def commit(self, failed: dict[str, int]) -> None:
+        """Persist baselines and watermarks for the next run, unless this run's alerts failed to write."""
+        if failed.get("alerts"):
+            logger.warning(f"⚠️ Keeping previous anomaly baselines ({failed['alerts']} alert rows failed to write)")
+            return
+        for name, frame in (("baselines", self.baselines), ("watermarks", self.watermarks)):
+            _atomic_write(self.directory / f"{name}.parquet", frame.write_parquet)
+
+
+def anomaly_alerts(scored: pl.DataFrame) -> pl.DataFrame:
+    """Alert rows for scored hours beyond ANOMALY_Z_SCORE, strongest per city, metric and day."""
+    flags_drops = _metric_attr(3, pl.Boolean)
+    label = _metric_attr(0, pl.Utf8)
+    unit = _metric_attr(1, pl.Utf8)
+    rising = pl.col("z") > 0
+    hits = (
+        scored.filter((pl.col("z") >= ANOMALY_Z_SCORE) | (flags_drops & (pl.col("z") <= -ANOMALY_Z_SCORE)))
+        .with_columns(pl.col("recorded_at").str.slice(0, 10).alias("_day"))
+        .sort(pl.col("z").abs(), descending=True)
+        .unique(["city_id", "metric", "_day"], keep="first", maintain_order=True)
+    )
+    if hits.is_empty():
+        return pl.DataFrame(schema=ALERT_SCHEMA)
+
+    # Open-Meteo hours are local; alerts are stored in UTC
+    starts = (
+        pl.col("recorded_at").str.to_datetime("%Y-%m-%dT%H:%M", strict=False)
+        .dt.replace_time_zone(TIMEZONE).dt.convert_time_zone("UTC")
+    )
+    return hits.rechunk().select(
+        "city_id",
+        pl.lit("anomaly").alias("alert_type"),
+        pl.when(pl.col("z").abs() >= 2 * ANOMALY_Z_SCORE).then(pl.lit("high")).otherwise(pl.lit("moderate"))
+        .alias("severity"),
+        pl.format(
+            "{} Unusual {} {} — {}",
+            pl.when(rising).then(pl.lit("📈")).otherwise(pl.lit("📉")),
+            label,
+            pl.when(rising).then(pl.lit("Spike")).otherwise(pl.lit("Drop")),
+            pl.col("city_name"),
+        ).alias("title"),
+        pl.format(
+            "{} {} {} at {} is {}σ {} the usual {} {} for this hour.",
+            label,
+            pl.when(rising).then(pl.lit("reached")).otherwise(pl.lit("fell to")),
+            pl.col("value").round(1).cast(pl.Utf8) + " " + unit,
+            pl.col("recorded_at").str.replace("T", " "),
+            pl.col("z").abs().round(1).cast(pl.Utf8),
+            pl.when(rising).then(pl.lit("above")).otherwise(pl.lit("below")),
+            pl.col("mean").round(1).cast(pl.Utf8),
+            unit,
+        ).alias("description"),
+        pl.col("value"),
+        (pl.col("mean") + pl.col("z").sign() * ANOMALY_Z_SCORE * pl.col("std")).alias("threshold"),
+        starts.dt.strftime("%Y-%m-%dT%H:%M:%SZ").alias("starts_at"),
+        (starts + timedelta(hours=ANOMALY_ALERT_HOURS)).dt.strftime("%Y-%m-%dT%H:%M:%SZ").alias("expires_at"),
+        pl.lit(True).alias("is_active"),
+    )
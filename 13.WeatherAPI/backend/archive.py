@@ -0,0 +1,232 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Local Archive — partitioned Parquet history + analytical queries.
+
+Every run appends the frames it upserts to a Hive-style Parquet dataset on
+local disk:
+
+    <archive>/<table>/city_id=<uuid>/year=<yyyy>/month=<m>/<run>.parquet
+
+Rows carry `archived_at` (the run time); a later run's copy of the same key
+(a refreshed forecast) supersedes earlier ones, and busy partitions are
+compacted down to one file. Queries prune partitions by city and year, push
+the remaining filters into the Parquet scan, and never touch Postgres.
+
+Usage:
+    python archive.py heatwaves --by decade
+    python archive.py sql "SELECT city_name, avg(temp_max) FROM daily_aggregates GROUP BY 1"
+    python archive.py compact
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import polars as pl
+
+from config import ARCHIVE_COMPACT_FILES, ARCHIVE_DIR, ARCHIVE_TABLES
+from tiers import TIER_TIME_COLUMNS
+from writer import TABLE_CONFLICT_KEYS
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMNS = ["city_id", "year", "month"]
+HIVE_SCHEMA = {"city_id": pl.Utf8, "year": pl.Int32, "month": pl.Int32}
+
+
+def _latest_per_key(frame: pl.LazyFrame, table: str, within_partition: bool = False) -> pl.LazyFrame:
+    """Keep each key's most recently archived row (partition columns are implied inside one partition)."""
+    keys = [k for k in TABLE_CONFLICT_KEYS[table].split(",") if not (within_partition and k in HIVE_SCHEMA)]
+    return frame.filter(pl.col("archived_at") == pl.col("archived_at").max().over(keys))
+
+
+# ============================================
+# Writing
+# ============================================
+class ParquetArchive:
+    """Collects one run's frames (from worker threads) and appends them as Parquet partitions."""
+
+    def __init__(self, root: str, run_at: datetime | None = None):
+        self.root = Path(root)
+        self.run_at = run_at or datetime.now(timezone.utc)
+        self.run_id = self.run_at.strftime("%Y%m%dT%H%M%S%fZ")
+        self.archived: dict[str, int] = dict.fromkeys(ARCHIVE_TABLES, 0)
+        self._buffers: dict[str, list[pl.DataFrame]] = {table: [] for table in ARCHIVE_TABLES}
+        self._lock = threading.Lock()
+
+    def add(self, table: str, records: pl.DataFrame, city_name: str) -> int:
+        """Queue one city's rows for `table`; returns the number of rows queued."""
+        if table not in self._buffers or records.is_empty():
+            return 0
+        with self._lock:
+            self._buffers[table].append(records.with_columns(pl.lit(city_name).alias("city_name")))
+        return len(records)
+
+    def flush(self) -> dict[str, int]:
+        """Write every queued table, one file per city/year/month partition touched by this run."""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {table: [] for table in ARCHIVE_TABLES}
+        for table, frames in buffers.items():
+            if not frames:
+                continue
+            time_col = TIER_TIME_COLUMNS[table]
+            records = pl.concat(frames, how="diagonal_relaxed").with_columns(
+                pl.col(time_col).str.slice(0, 4).cast(pl.Int32, strict=False).alias("year"),
+                pl.col(time_col).str.slice(5, 2).cast(pl.Int32, strict=False).alias("month"),
+                pl.lit(self.run_at).cast(pl.Datetime("us", "UTC")).alias("archived_at"),
+            ).drop_nulls(["year", "month"])
+            partitions = records.partition_by(PARTITION_COLUMNS, as_dict=True, include_key=False)
+            for (city_id, year, month), part in partitions.items():
+                directory = self.root / table / f"city_id={city_id}" / f"year={year}" / f"month={month}"
+                directory.mkdir(parents=True, exist_ok=True)
+                part.write_parquet(directory / f"{self.run_id}.parquet")
+                if len(list(directory.glob("*.parquet"))) > ARCHIVE_COMPACT_FILES:
+                    _compact_partition(directory, table)
+            self.archived[table] += len(records)
+        return dict(self.archived)
+
+
+def _compact_partition(directory: Path, table: str) -> None:
+    """Replace a partition's part files with one file holding the latest row per key."""
+    files = sorted(directory.glob("*.parquet"))
+    if len(files) < 2:
+        return
+    merged = _latest_per_key(
+        pl.concat([pl.scan_parquet(f, hive_partitioning=False) for f in files], how="diagonal_relaxed"),
+        table,
+        within_partition=True,
+    ).collect()
+    # Newest input name keeps the file order meaningful; the dot prefix hides it from scans until renamed
+    target = directory / files[-1].name
+    partial = directory / f".{files[-1].name}.partial"
+    merged.write_parquet(partial)
+    for f in files:
+        f.unlink()
+    os.replace(partial, target)
+
+
+def compact(root: str = ARCHIVE_DIR) -> int:
+    """Compact every partition with more than one part file; returns partitions compacted."""
+    compacted = 0
+    for table in ARCHIVE_TABLES:
+        for directory in sorted((Path(root) / table).glob("city_id=*/year=*/month=*")):
+            if len(list(directory.glob("*.parquet"))) > 1:
+                _compact_partition(directory, table)
+                compacted += 1
+    return compacted
+
+
+# ============================================
+# Querying
+# ============================================
+def _partition_value(path: Path, name: str) -> str:
+    return next(p.split("=", 1)[1] for p in path.parts if p.startswith(f"{name}="))
+
+
+def scan(
+    table: str,
+    root: str = ARCHIVE_DIR,
+    city_ids: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> pl.LazyFrame:
+    """
+    Lazy scan of one archived table, latest copy of each row.
+
+    City and year filters prune partitions before any file is opened; the
+    `start`/`end` bounds (ISO dates, inclusive) are pushed into the Parquet
+    reader and checked against row-group statistics.
+    """
+    time_col = TIER_TIME_COLUMNS[table]
+    first_year = int(start[:4]) if start else None
+    last_year = int(end[:4]) if end else None
+    city_dirs = [f"city_id={city_id}" for city_id in city_ids] if city_ids else ["city_id=*"]
+
+    files = []
+    for city_dir in city_dirs:
+        for path in (Path(root) / table).glob(f"{city_dir}/year=*/month=*/*.parquet"):
+            year = int(_partition_value(path, "year"))
+            if (first_year and year < first_year) or (last_year and year > last_year):
+                continue
+            files.append(path)
+    if not files:
+        raise FileNotFoundError(f"no archived {table} partitions under {root} match the filters")
+
+    # The newest file has the current column set; older files get nulls for columns added since
+    newest = max(files, key=lambda p: p.name)
+    schema = {name: dtype for name, dtype in pl.read_parquet_schema(newest).items() if name not in HIVE_SCHEMA}
+    frame = pl.scan_parquet(
+        files, hive_partitioning=True, hive_schema=HIVE_SCHEMA, schema=schema,
+        missing_columns="insert", extra_columns="ignore",
+    )
+    if start:
+        frame = frame.filter(pl.col(time_col) >= start)
+    if end:
+        frame = frame.filter(pl.col(time_col) <= (end if time_col == "date" else f"{end}T23:59"))
+    return _latest_per_key(frame, table)
+
+
+def heatwave_frequency(
+    root: str = ARCHIVE_DIR, by: str = "decade", city_ids: list[str] | None = None
+) -> pl.DataFrame:
+    """Heatwave days per city and decade (or year), as a count and a share of archived days."""
+    period = (pl.col("year") // 10 * 10) if by == "decade" else pl.col("year")
+    return (
+        scan("daily_aggregates", root, city_ids)
+        .group_by("city_name", period.alias(by))
+        .agg(
+            pl.len().alias("days"),
+            pl.col("is_heatwave").sum().alias("heatwave_days"),
+            pl.col("temp_max").max().alias("temp_max"),
+        )
+        .with_columns((pl.col("heatwave_days") / pl.col("days") * 100).round(1).alias("heatwave_pct"))
+        .sort("city_name", by)
+        .collect()
+    )
+
+
+def sql(query: str, root: str = ARCHIVE_DIR) -> pl.DataFrame:
+    """Run a SQL query over the archived tables (each registered as a lazy scan)."""
+    context = pl.SQLContext()
+    for table in ARCHIVE_TABLES:
+        if (Path(root) / table).is_dir():
+            try:
+                context.register(table, scan(table, root))
+            except FileNotFoundError:
+                continue
+    return context.execute(query, eager=True)
+
+
+# ============================================
+# CLI
+# ============================================
+def main():
+    parser = argparse.ArgumentParser(description="Query the local Parquet archive")
+    parser.add_argument("--root", default=ARCHIVE_DIR, help="archive directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    heat = commands.add_parser("heatwaves", help="heatwave frequency per city")
+    heat.add_argument("--by", choices=["decade", "year"], default="decade")
+    heat.add_argument("--city-id", action="append", dest="city_ids")
+    query = commands.add_parser("sql", help="SQL over the archived tables")
+    query.add_argument("query")
+    commands.add_parser("compact", help="merge part files in every partition")
+    args = parser.parse_args()
+
+    pl.Config.set_tbl_rows(100)
+    try:
+        if args.command == "heatwaves":
+            print(heatwave_frequency(args.root, args.by, args.city_ids))
+        elif args.command == "sql":
+            print(sql(args.query, args.root))
+        else:
+            print(f"🗜️ Compacted {compact(args.root)} partitions")
+    except FileNotFoundError as e:
+        sys.exit(f"❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Historical Backfill — years of archive data for newly added cities.
+
+The requested range is split into BACKFILL_CHUNK_DAYS chunks. A few chunks
+are downloaded ahead at a time, under a requests-per-minute limit, from the
+Open-Meteo archive (reanalysis weather) and air-quality APIs. They are stored
+in date order through the same Polars processing as a forecast run:
+
+- daily_aggregates, plus hourly rows still inside their tier retention (all of
+  them unless PIPELINE_PRUNE_HOURLY=1), go to Supabase.
+- Every row goes to the local Parquet archive.
+- The days are rolled up into historical_stats / yearly_stats.
+
+A per-city checkpoint records the last stored day, so an interrupted
+backfill resumes after it.
+
+The scheduled rollup only moves forward, so the backfilled days would fall
+behind its watermark once a city has had a scheduled run. Each stored chunk
+instead rebuilds that city's monthly and yearly stats for the chunk's years
+from daily_aggregates (RollupEngine.rebuild).
+
+Usage:
+    python backfill.py --start 2015-01-01                  # every custom city
+    python backfill.py --city Churu --start 2020-01-01 --end 2024-12-31
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import httpx
+import polars as pl
+
+import preprocess
+from archive import ParquetArchive
+from cache import _atomic_write
+from config import (
+    AIR_QUALITY_API_URL,
+    AQI_HISTORY_START,
+    ARCHIVE_DIR,
+    BACKFILL_CHUNK_DAYS,
+    BACKFILL_CONCURRENCY,
+    BACKFILL_LAG_DAYS,
+    BACKFILL_REQUESTS_PER_MINUTE,
+    CACHE_DIR,
+    DAILY_WEATHER_VARS,
+    DEFAULT_CITIES,
+    FORECAST_ONLY_VARS,
+    HISTORICAL_API_URL,
+    HOURLY_AQI_VARS,
+    HOURLY_WEATHER_VARS,
+    TIMEZONE,
+    CityConfig,
+)
+from metrics import StageMetrics
+from rollup import RollupEngine
+from tiers import TIER_TIME_COLUMNS, hourly_pruning_allowed, retention_days
+from writer import BulkWriter
+
+logger = logging.getLogger(__name__)
+
+HISTORICAL_WEATHER_PARAMS = {
+    "hourly": ",".join(v for v in HOURLY_WEATHER_VARS if v not in FORECAST_ONLY_VARS),
+    "daily": ",".join(v for v in DAILY_WEATHER_VARS if v not in FORECAST_ONLY_VARS),
+    "timezone": TIMEZONE,
+}
+HISTORICAL_AQI_PARAMS = {
+    "hourly": ",".join(HOURLY_AQI_VARS),
+    "timezone": TIMEZONE,
+}
+
+
+class RateLimiter:
+    """Spaces requests evenly to stay under a requests-per-minute budget."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def date_chunks(start: date, end: date, days: int = BACKFILL_CHUNK_DAYS) -> list[tuple[date, date]]:
+    """Split [start, end] (inclusive) into consecutive ranges of at most `days` days."""
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + timedelta(days=days - 1))
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+# ============================================
+# Checkpoints
+# ============================================
+def _load_checkpoint(path: Path, start: date) -> date | None:
+    """Last stored day of an earlier backfill from the same start date, if any."""
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if state.get("start") != start.isoformat():
+        logger.info(f"↩️ Checkpoint {path.name} is for a backfill from {state.get('start')}; starting over")
+        return None
+    return date.fromisoformat(state["done_through"])
+
+
+def _save_checkpoint(path: Path, start: date, end: date, done_through: date) -> None:
+    state = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "done_through": done_through.isoformat(),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    _atomic_write(path, lambda tmp: tmp.write_text(json.dumps(state), encoding="utf-8"))
+
+
+# ============================================
+# Download
+# ============================================
+async def download_chunk(
+    client: httpx.AsyncClient,
+    limiter: RateLimiter,
+    city: CityConfig,
+    start: date,
+    end: date,
+    metrics: StageMetrics,
+) -> tuple[date, date, dict, dict | None]:
+    """Archive weather (and air quality, where the archive covers it) for one city and date range."""
+    location = {"latitude": city.latitude, "longitude": city.longitude}
+    with metrics.time("fetch"):
+        await limiter.wait()
+        weather = await preprocess.fetch_api(client, HISTORICAL_API_URL, {
+            **location, **HISTORICAL_WEATHER_PARAMS,
+            "start_date": start.isoformat(), "end_date": end.isoformat(),
+        })
+        aqi = None
+        if end.isoformat() >= AQI_HISTORY_START:
+            await limiter.wait()
+            aqi = await preprocess.fetch_api(client, AIR_QUALITY_API_URL, {
+                **location, **HISTORICAL_AQI_PARAMS,
+                "start_date": max(start.isoformat(), AQI_HISTORY_START), "end_date": end.isoformat(),
+            })
+    return start, end, weather, aqi
+
+
+# ============================================
+# Store
+# ============================================
+def _within_retention(records: pl.DataFrame, table: str, archive_dir: str | None) -> pl.DataFrame:
+    """Rows prune_expired_tiers would keep; older hourly history lives only in the Parquet archive."""
+    days = retention_days(table, hourly_pruning_allowed(archive_dir))
+    if days is None or records.is_empty():
+        return records
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M")
+    return records.filter(pl.col(TIER_TIME_COLUMNS[table]) >= cutoff)
+
+
+def store_chunk(
+    city_id: str,
+    city_cfg: CityConfig,
+    weather_raw: dict,
+    aqi_raw: dict | None,
+    writer: BulkWriter,
+    rollup: RollupEngine,
+    archive_dir: str | None,
+    metrics: StageMetrics,
+) -> int:
+    """Process one downloaded chunk, write and archive it, and roll its days up. Runs in a worker thread."""
+    with metrics.time("process", city=city_cfg.name):
+        hourly = preprocess.process_hourly_weather(weather_raw, city_id)
+        aqi = preprocess.process_air_quality(aqi_raw, city_id) if aqi_raw else pl.DataFrame()
+        daily = preprocess.process_daily_aggregates(weather_raw, aqi, city_id, hourly)
+
+    def check_written(failed_before: int) -> None:
+        # Keep the checkpoint before this chunk; rerunning rewrites it (upserts are idempotent)
+        if (failed := sum(writer.failed.values()) - failed_before):
+            raise RuntimeError(f"{failed} rows could not be written")
+
+    failed_before = sum(writer.failed.values())
+    writer.add("weather_data", _within_retention(hourly, "weather_data", archive_dir))
+    writer.add("air_quality_data", _within_retention(aqi, "air_quality_data", archive_dir))
+    writer.add("daily_aggregates", daily)
+    writer.flush()
+    check_written(failed_before)
+    # Only days that reached daily_aggregates are rolled up; the rebuild also
+    # counts any days the scheduled rollup already folded into these years
+    if not daily.is_empty():
+        years = {int(day[:4]) for day in daily["date"].to_list()}
+        rollup.rebuild(city_id, city_cfg.name, years)
+    check_written(failed_before)
+
+    if archive_dir:
+        archive = ParquetArchive(archive_dir)
+        archive.add("weather_data", hourly, city_cfg.name)
+        archive.add("air_quality_data", aqi, city_cfg.name)
+        archive.add("daily_aggregates", daily, city_cfg.name)
+        with metrics.time("archive"):
+            archive.flush()
+    return len(daily)
+
+
+async def backfill_city(
+    client: httpx.AsyncClient,
+    city_id: str,
+    city_cfg: CityConfig,
+    start: date,
+    end: date,
+    state_dir: str,
+    archive_dir: str | None = ARCHIVE_DIR,
+    limiter: RateLimiter | None = None,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    metrics: StageMetrics | None = None,
+) -> int:
+    """
+    Backfill one city from `start` to `end` (inclusive), resuming from its checkpoint.
+
+    Up to `concurrency` chunks are downloaded ahead; chunks are stored strictly
+    in date order, so the checkpoint only ever advances.
+    Returns the number of days stored by this call.
+    """
+    limiter = limiter or RateLimiter(BACKFILL_REQUESTS_PER_MINUTE)
+    metrics = metrics or StageMetrics()
+    checkpoint = Path(state_dir) / "backfill" / f"{city_id}.json"
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    done_through = _load_checkpoint(checkpoint, start)
+    first = max(start, done_through + timedelta(days=1)) if done_through else start
+    chunks = date_chunks(first, end)
+    if not chunks:
+        logger.info(f"✅ {city_cfg.name} already backfilled through {done_through}")
+        return 0
+    if done_through:
+        logger.info(f"↪️ {city_cfg.name}: resuming after {done_through}")
+
+    writer = BulkWriter(preprocess.supabase, stages=metrics)
+    rollup = RollupEngine(preprocess.supabase, writer)
+    pending: deque[asyncio.Task] = deque()
+    stored = 0
+
+    async def store_next() -> None:
+        nonlocal stored
+        chunk_start, chunk_end, weather_raw, aqi_raw = await pending.popleft()
+        stored += await asyncio.to_thread(
+            store_chunk, city_id, city_cfg, weather_raw, aqi_raw, writer, rollup, archive_dir, metrics
+        )
+        _save_checkpoint(checkpoint, start, end, chunk_end)
+        logger.info(f"📥 {city_cfg.name}: {chunk_start} → {chunk_end} stored ({stored} days so far)")
+
+    try:
+        for chunk_start, chunk_end in chunks:
+            pending.append(asyncio.create_task(
+                download_chunk(client, limiter, city_cfg, chunk_start, chunk_end, metrics)
+            ))
+            if len(pending) >= concurrency:
+                await store_next()
+        while pending:
+            await store_next()
+    finally:
+        for task in pending:
+            task.cancel()
+    return stored
+
+
+# ============================================
+# CLI
+# ============================================
+def main():
+    today = datetime.now(ZoneInfo(TIMEZONE)).date()
+    latest = today - timedelta(days=BACKFILL_LAG_DAYS)
+    parser = argparse.ArgumentParser(description="Backfill historical weather and AQI from the Open-Meteo archive")
+    parser.add_argument("--city", action="append", dest="cities", metavar="NAME",
+                        help="city name from the cities table (repeatable; default: every custom city)")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first day, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, default=latest,
+                        help=f"last day, YYYY-MM-DD (default: {BACKFILL_LAG_DAYS} days ago)")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="chunks downloaded ahead")
+    parser.add_argument("--requests-per-minute", type=float, default=BACKFILL_REQUESTS_PER_MINUTE)
+    parser.add_argument("--state-dir", default=CACHE_DIR or ".cache", help="checkpoint directory")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help='Parquet archive ("" disables)')
+    args = parser.parse_args()
+
+    if preprocess.supabase is None:
+        sys.exit("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set!")
+    end = min(args.end, latest)
+    if args.start > end:
+        sys.exit(f"❌ --start must be on or before {end}")
+
+    all_cities = preprocess.resolve_cities(preprocess.get_city_id_map())
+    if args.cities:
+        by_name = {cfg.name: (city_id, cfg) for city_id, cfg in all_cities}
+        unknown = [name for name in args.cities if name not in by_name]
+        if unknown:
+            sys.exit(f"❌ Unknown cities: {', '.join(unknown)}")
+        cities = [by_name[name] for name in args.cities]
+    else:
+        default_names = {c.name for c in DEFAULT_CITIES}
+        cities = [(city_id, cfg) for city_id, cfg in all_cities if cfg.name not in default_names]
+        if not cities:
+            sys.exit("❌ No custom cities to backfill; pass --city")
+
+    async def run() -> dict[str, int]:
+        limiter = RateLimiter(args.requests_per_minute)
+        metrics = StageMetrics()
+        days: dict[str, int] = {}
+        async with httpx.AsyncClient() as client:
+            for city_id, cfg in cities:
+                logger.info(f"🗓️ Backfilling {cfg.name}: {args.start} → {end}")
+                try:
+                    days[cfg.name] = await backfill_city(
+                        client, city_id, cfg, args.start, end, args.state_dir,
+                        args.archive_dir or None, limiter, args.concurrency, metrics,
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Backfill of {cfg.name} stopped (rerun to resume): {e}")
+        metrics.log_report(logger)
+        return days
+
+    days = asyncio.run(run())
+    logger.info(f"✅ Backfilled {sum(days.values())} days for {len(days)} of {len(cities)} cities")
+    if len(days) < len(cities):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Benchmark — record builder throughput (rows/sec).
+
+Compares the original per-row builders against the columnar Polars builders
+in preprocess.py on synthetic Open-Meteo payloads. No network or Supabase needed.
+
+Usage:
+    python benchmark.py --cities 1000 --days 16
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+
+from config import HOURLY_WEATHER_VARS, DAILY_WEATHER_VARS, HOURLY_AQI_VARS, MINUTELY_15_VARS, THRESHOLDS
+from preprocess import process_hourly_weather, process_air_quality, process_daily_aggregates
+
+
+# ============================================
+# Synthetic Open-Meteo Payloads
+# ============================================
+def make_weather_payload(
+    days: int, seed: int = 0, start: datetime = datetime(2025, 5, 1), minutely_15: bool = False
+) -> dict:
+    """Build a forecast response shaped like Open-Meteo's /v1/forecast (optionally with minutely_15)."""
+    rng = random.Random(seed)
+    hours = days * 24
+    hourly = {"time": [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]}
+    for var in HOURLY_WEATHER_VARS:
+        if var == "weather_code":
+            hourly[var] = [rng.choice([0, 1, 2, 3, 45, 61, 95]) for _ in range(hours)]
+        else:
+            hourly[var] = [round(rng.uniform(0, 50), 1) for _ in range(hours)]
+    daily = {"time": [(start + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(days)]}
+    for var in DAILY_WEATHER_VARS:
+        if var in ("sunrise", "sunset"):
+            daily[var] = [f"{t}T06:00" for t in daily["time"]]
+        elif var == "weather_code":
+            daily[var] = [rng.choice([0, 3, 61, 95]) for _ in range(days)]
+        else:
+            daily[var] = [round(rng.uniform(20, 48), 1) for _ in range(days)]
+    payload = {"hourly": hourly, "daily": daily}
+    if minutely_15:
+        steps = hours * 4
+        block = {"time": [(start + timedelta(minutes=15 * q)).strftime("%Y-%m-%dT%H:%M") for q in range(steps)]}
+        for var in MINUTELY_15_VARS:
+            if var == "weather_code":
+                block[var] = [rng.choice([0, 1, 2, 3, 45, 61, 95]) for _ in range(steps)]
+            else:
+                block[var] = [round(rng.uniform(0, 50), 1) for _ in range(steps)]
+        payload["minutely_15"] = block
+    return payload
+
+
+def make_aqi_payload(days: int, seed: int = 0, start: datetime = datetime(2025, 5, 1)) -> dict:
+    """Build an air quality response shaped like Open-Meteo's /v1/air-quality."""
+    rng = random.Random(seed)
+    hours = days * 24
+    hourly = {"time": [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]}
+    for var in HOURLY_AQI_VARS:
+        hourly[var] = [round(rng.uniform(5, 320), 1) for _ in range(hours)]
+    return {"hourly": hourly}
+
+
+# ============================================
+# Original Row-Loop Builders (baseline)
+# ============================================
+def legacy_process_hourly_weather(raw: dict, city_id: str) -> list[dict]:
+    hourly = raw.get("hourly", {})
+    if not hourly or "time" not in hourly:
+        return []
+    now = datetime.now(timezone.utc)
+    records = []
+    for i, time_str in enumerate(hourly["time"]):
+        record = {"city_id": city_id, "recorded_at": time_str}
+        for var in HOURLY_WEATHER_VARS:
+            default = 0 if var in ("precipitation", "rain") else None
+            record[var] = hourly.get(var, [default])[i] if i < len(hourly.get(var, [])) else default
+        record["is_forecast"] = datetime.fromisoformat(time_str) > now.replace(tzinfo=None)
+        records.append(record)
+    return pl.DataFrame(records).to_dicts()
+
+
+def legacy_process_air_quality(raw: dict, city_id: str) -> list[dict]:
+    hourly = raw.get("hourly", {})
+    if not hourly or "time" not in hourly:
+        return []
+    records = []
+    for i, time_str in enumerate(hourly["time"]):
+        record = {"city_id": city_id, "recorded_at": time_str}
+        for var in HOURLY_AQI_VARS:
+            record[var] = hourly.get(var, [None])[i] if i < len(hourly.get(var, [])) else None
+        records.append(record)
+    return pl.DataFrame(records).to_dicts()
+
+
+def legacy_process_daily_aggregates(weather_raw: dict, aqi_records: list[dict], city_id: str) -> list[dict]:
+    daily = weather_raw.get("daily", {})
+    if not daily or "time" not in daily:
+        return []
+    aqi_daily_stats = {}
+    if aqi_records:
+        aqi_df = pl.DataFrame(aqi_records).with_columns(pl.col("recorded_at").str.slice(0, 10).alias("date"))
+        for row in aqi_df.group_by("date").agg([
+            pl.col("us_aqi").mean().alias("aqi_mean"),
+            pl.col("us_aqi").max().alias("aqi_max"),
+            pl.col("pm2_5").mean().alias("pm2_5_mean"),
+            pl.col("pm10").mean().alias("pm10_mean"),
+            pl.col("dust").mean().alias("dust_mean"),
+        ]).to_dicts():
+            aqi_daily_stats[row["date"]] = row
+
+    def col(name, i, default=None):
+        return daily.get(name, [default])[i] if i < len(daily.get(name, [])) else default
+
+    records = []
+    for i, date_str in enumerate(daily["time"]):
+        aqi_stats = aqi_daily_stats.get(date_str, {})
+        temp_max, precip, wind = col("temperature_2m_max", i), col("precipitation_sum", i, 0), col("wind_speed_10m_max", i)
+        dust = aqi_stats.get("dust_mean")
+        records.append({
+            "city_id": city_id, "date": date_str, "temp_max": temp_max,
+            "temp_min": col("temperature_2m_min", i), "temp_mean": None,
+            "apparent_temp_max": col("apparent_temperature_max", i),
+            "apparent_temp_min": col("apparent_temperature_min", i),
+            "precipitation_sum": precip, "precipitation_hours": col("precipitation_hours", i, 0),
+            "rain_sum": col("rain_sum", i, 0),
+            "precipitation_probability_max": col("precipitation_probability_max", i),
+            "wind_speed_max": wind, "wind_gusts_max": col("wind_gusts_10m_max", i),
+            "wind_direction_dominant": col("wind_direction_10m_dominant", i),
+            "weather_code": col("weather_code", i), "sunrise": col("sunrise", i),
+            "sunset": col("sunset", i), "uv_index_max": col("uv_index_max", i),
+            "aqi_mean": aqi_stats.get("aqi_mean"), "aqi_max": aqi_stats.get("aqi_max"),
+            "pm2_5_mean": aqi_stats.get("pm2_5_mean"), "pm10_mean": aqi_stats.get("pm10_mean"),
+            "dust_mean": dust,
+            "is_heatwave": temp_max is not None and temp_max > THRESHOLDS["heatwave_temp"],
+            "is_dust_storm_risk": (dust is not None and dust > THRESHOLDS["dust_storm_dust"]
+                                   and wind is not None and wind > THRESHOLDS["dust_storm_wind"]),
+            "is_heavy_rain": precip is not None and precip > THRESHOLDS["heavy_rain_mm"],
+        })
+    return records
+
+
+# ============================================
+# Runner
+# ============================================
+def run_legacy(payloads: list[tuple[dict, dict]]) -> int:
+    rows = 0
+    for i, (weather, aqi) in enumerate(payloads):
+        city_id = f"city-{i}"
+        hourly = legacy_process_hourly_weather(weather, city_id)
+        aqi_records = legacy_process_air_quality(aqi, city_id)
+        daily = legacy_process_daily_aggregates(weather, aqi_records, city_id)
+        rows += len(hourly) + len(aqi_records) + len(daily)
+    return rows
+
+
+def run_columnar(payloads: list[tuple[dict, dict]], to_dicts: bool) -> int:
+    rows = 0
+    for i, (weather, aqi) in enumerate(payloads):
+        city_id = f"city-{i}"
+        hourly = process_hourly_weather(weather, city_id)
+        aqi_records = process_air_quality(aqi, city_id)
+        daily = process_daily_aggregates(weather, aqi_records, city_id, hourly)
+        if to_dicts:
+            # What the Supabase upsert boundary pays on top of the builders
+            hourly.to_dicts(), aqi_records.to_dicts(), daily.to_dicts()
+        rows += len(hourly) + len(aqi_records) + len(daily)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark weather record builders")
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"Generating {args.cities} cities × {args.days}-day payloads...")
+    templates = [(make_weather_payload(args.days, seed), make_aqi_payload(args.days, seed)) for seed in range(8)]
+    payloads = [templates[i % len(templates)] for i in range(args.cities)]
+
+    print(f"{'builder':<28}{'rows':>12}{'seconds':>10}{'rows/sec':>14}")
+    for label, fn in [
+        ("row loop (before)", run_legacy),
+        ("columnar (after)", lambda p: run_columnar(p, to_dicts=False)),
+        ("columnar + to_dicts", lambda p: run_columnar(p, to_dicts=True)),
+    ]:
+        start = time.perf_counter()
+        rows = fn(payloads)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28}{rows:>12,}{elapsed:>10.2f}{rows / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
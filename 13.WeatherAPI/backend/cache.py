@@ -0,0 +1,179 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Local Cache — Open-Meteo response cache + snapshot diff for incremental upserts.
+
+ResponseCache: on-disk JSON responses keyed by (city, API, variable set, window),
+reused while younger than the TTL; older entries are deleted when it opens.
+
+SnapshotDiff: remembers a hash of every row the last successful run wrote, so
+only new or changed rows are sent to Supabase.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from config import CityConfig, RESPONSE_CACHE_TTL_SECONDS, TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# Tables diffed against the last snapshot → natural key (matches the upsert conflict target)
+SNAPSHOT_KEYS: dict[str, list[str]] = {
+    "weather_data_15min": ["city_id", "recorded_at", "is_forecast"],
+    "weather_data": ["city_id", "recorded_at", "is_forecast"],
+    "air_quality_data": ["city_id", "recorded_at"],
+    "daily_aggregates": ["city_id", "date"],
+}
+
+
+def _atomic_write(path: Path, write) -> None:
+    """Write via a temp file + rename so an interrupted run never leaves half a file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+# ============================================
+# Response Cache
+# ============================================
+class ResponseCache:
+    """On-disk cache of per-city Open-Meteo payloads."""
+
+    def __init__(self, directory: str | Path, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS):
+        self.directory = Path(directory) / "responses"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.prune()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def prune(self) -> int:
+        """Delete entries past the TTL (all of them when disabled), e.g. previous days' windows."""
+        removed = 0
+        cutoff = time.time() - max(self.ttl_seconds, 0)
+        for path in self.directory.glob("*.json"):
+            try:
+                if path.stat().st_mtime <= cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def key(self, url: str, city: CityConfig, params: dict) -> str:
+        """Cache key: city, API, variable set and forecast window (local start date + params)."""
+        window_start = datetime.now(ZoneInfo(TIMEZONE)).date().isoformat()
+        parts = {
+            "city": [city.name, city.latitude, city.longitude],
+            "api": url,
+            "params": {k: ",".join(sorted(str(v).split(","))) for k, v in sorted(params.items())},
+            "window_start": window_start,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        path = self.directory / f"{key}.json"
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                self.misses += 1
+                return None
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return payload
+
+    def put(self, key: str, payload: dict) -> None:
+        if not self.enabled:
+            return
+        try:
+            _atomic_write(
+                self.directory / f"{key}.json",
+                lambda tmp: tmp.write_text(json.dumps(payload), encoding="utf-8"),
+            )
+        except OSError as e:
+            logger.warning(f"⚠️ Could not cache response: {e}")
+
+
+# ============================================
+# Snapshot Diff
+# ============================================
+class SnapshotDiff:
+    """
+    Filters processed frames down to rows that differ from the last persisted run.
+
+    Each table's snapshot holds the natural key plus a row hash for every row the
+    previous run produced. `commit` only replaces a table's snapshot when all of
+    its writes succeeded, so failed rows are re-sent next time. Row hashes are
+    only stable within one Polars version; after an upgrade the first run simply
+    re-sends everything.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory) / "snapshots"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.unchanged: Counter[str] = Counter()
+        self._previous: dict[str, dict[str, pl.DataFrame]] = {}
+        self._current: dict[str, dict[str, pl.DataFrame]] = {table: {} for table in SNAPSHOT_KEYS}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        for table in SNAPSHOT_KEYS:
+            path = self.directory / f"{table}.parquet"
+            if not path.exists():
+                continue
+            try:
+                snapshot = pl.read_parquet(path)
+            except Exception as e:
+                logger.warning(f"⚠️ Ignoring unreadable snapshot {path.name}: {e}")
+                continue
+            self._previous[table] = {
+                (key[0] if isinstance(key, tuple) else key): frame
+                for key, frame in snapshot.partition_by("city_id", as_dict=True).items()
+            }
+
+    def filter(self, table: str, city_id: str, df: pl.DataFrame) -> pl.DataFrame:
+        """Return only the rows of `df` that are new or changed since the last snapshot."""
+        if df.is_empty():
+            return df
+
+        hashed = df.with_columns(df.hash_rows().alias("_row_hash"))
+        with self._lock:
+            self._current[table][city_id] = hashed.select(*SNAPSHOT_KEYS[table], "_row_hash")
+            previous = self._previous.get(table, {}).get(city_id)
+
+        if previous is None:
+            return df
+        changed = hashed.join(previous.select("_row_hash"), on="_row_hash", how="anti").drop("_row_hash")
+        with self._lock:
+            self.unchanged[table] += len(df) - len(changed)
+        return changed
+
+    def commit(self, failed: dict[str, int]) -> None:
+        """Persist this run's snapshots for every table that had no failed writes."""
+        for table, cities in self._current.items():
+            if not cities:
+                continue
+            if failed.get(table):
+                logger.warning(f"⚠️ Keeping previous {table} snapshot ({failed[table]} rows failed to write)")
+                continue
+            merged = {**self._previous.get(table, {}), **cities}
+            snapshot = pl.concat(list(merged.values()), how="vertical_relaxed")
+            _atomic_write(self.directory / f"{table}.parquet", snapshot.write_parquet)
@@ -3,6 +3,7 @@ Rajasthan Weather & Air Quality Monitor
 Configuration — Cities, API endpoints, thresholds, and constants.
 """
 
+import os
 from dataclasses import dataclass
 
 # ============================================
@@ -29,6 +30,7 @@ DEFAULT_CITIES: list[CityConfig] = [
 # ============================================
 WEATHER_API_URL = "https://api.open-meteo.com/v1/forecast"
 AIR_QUALITY_API_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+HISTORICAL_API_URL = "https://archive-api.open-meteo.com/v1/archive"   # reanalysis (backfill.py)
 
 # ============================================
 # Weather API Parameters
@@ -95,6 +97,7 @@ THRESHOLDS = {
     "cold_wave_temp": 4.0,           # °C — cold wave for Rajasthan
     "dust_storm_dust": 150.0,        # µg/m³ — high dust concentration
     "dust_storm_wind": 40.0,         # km/h — strong winds for dust
+    "dust_exposure": 100.0,          # µg/m³ — hourly dust counted as exposure
     "heavy_rain_mm": 50.0,           # mm/day — heavy rainfall
     "very_heavy_rain_mm": 100.0,     # mm/day — very heavy rainfall
     "poor_aqi": 101,                 # US AQI — unhealthy for sensitive
@@ -102,6 +105,7 @@ THRESHOLDS = {
     "hazardous_aqi": 301,            # US AQI — hazardous
     "high_uv": 8.0,                  # UV Index — very high
     "fog_visibility": 1000,          # meters — fog condition
+    "rainy_day_mm": 2.5,             # mm/day — IMD rainy day
     "thunderstorm_codes": [95, 96, 99],  # WMO weather codes
 }
 
@@ -178,3 +182,106 @@ RETRY_DELAY_SECONDS = 2
 REQUEST_TIMEOUT_SECONDS = 30
 FORECAST_DAYS = 7
 TIMEZONE = "Asia/Kolkata"
+
+# ============================================
+# Pipeline Scheduling
+# ============================================
+MAX_CONCURRENT_FETCHES = 8       # batches fetched in parallel (env: PIPELINE_CONCURRENCY)
+CITIES_PER_REQUEST = 50          # locations per Open-Meteo request (env: FETCH_BATCH_SIZE)
+STORE_WORKERS = 2                # process + upsert workers draining the fetch queue
+BULK_CHUNK_BYTES = 512 * 1024    # target JSON body size per Supabase upsert
+# Reuse cached Open-Meteo responses younger than this (env: PIPELINE_RESPONSE_CACHE_TTL;
+# 0 disables). Kept below the fastest refresh (the daemon's 30 min for alerting cities),
+# so it only saves refetches for reruns, never serves a scheduled run the previous data.
+RESPONSE_CACHE_TTL_SECONDS = 15 * 60
+
+# ============================================
+# Resolution Tiers (15-minute raw → hourly → daily)
+# ============================================
+# Open-Meteo minutely_15 variables for the raw tier (env: PIPELINE_MINUTELY_15=1)
+MINUTELY_15_VARS = [
+    "temperature_2m",
+    "apparent_temperature",
+    "relative_humidity_2m",
+    "dewpoint_2m",
+    "precipitation",
+    "rain",
+    "wind_speed_10m",
+    "wind_direction_10m",
+    "wind_gusts_10m",
+    "weather_code",
+    "visibility",
+]
+
+# Days of history kept per tier (None = forever); keep in sync with weather_series() in schema.sql.
+# The hourly tiers (weather_data, air_quality_data) are only pruned with PIPELINE_PRUNE_HOURLY=1.
+TIER_RETENTION_DAYS: dict[str, int | None] = {
+    "weather_data_15min": 7,
+    "weather_data": 90,
+    "air_quality_data": 90,
+    "daily_aggregates": None,
+}
+
+# ============================================
+# Spatial Interpolation (backend/spatial.py)
+# ============================================
+RAJASTHAN_BOUNDS = (23.0, 69.5, 30.2, 78.3)   # lat_min, lon_min, lat_max, lon_max
+SPATIAL_CELL_DEGREES = 0.5       # grid index cell size (~50 km)
+IDW_NEIGHBORS = 8                # nearest cities blended per point
+IDW_POWER = 2.0                  # inverse-distance weight exponent
+MAX_INTERPOLATION_POINTS = 10_000  # per request (heat-map tile grids)
+
+# ============================================
+# Daemon Mode (python daemon.py)
+# ============================================
+DAEMON_TICK_SECONDS = 60                 # how often the scheduler looks for due cities
+DAEMON_REFRESH_SECONDS = 2 * 3600        # default per-city refresh cadence (same as the cron)
+DAEMON_ALERT_REFRESH_SECONDS = 30 * 60   # faster cadence for cities with active alerts
+CITY_MAP_REFRESH_SECONDS = 6 * 3600      # reload the cities table this often
+HEALTH_PORT = 8080                       # GET /health (env: HEALTH_PORT)
+HTTP_MAX_CONNECTIONS = 20                # pooled Open-Meteo connections kept warm
+
+# ============================================
+# Local State (env overrides; "" disables)
+# ============================================
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Response cache + upsert snapshots, anomaly baselines, last retention prune
+CACHE_DIR = os.getenv("PIPELINE_CACHE_DIR", os.path.join(_BACKEND_DIR, ".cache"))
+# Parquet archive of every run's rows — the only copy of hourly history past its
+# Supabase retention, so it must live on storage that outlasts the run
+ARCHIVE_DIR = os.getenv("PIPELINE_ARCHIVE_DIR", os.path.join(_BACKEND_DIR, "archive"))
+# Opt in to deleting hourly weather/AQI rows past TIER_RETENTION_DAYS (off: kept forever)
+PRUNE_HOURLY_TIERS = os.getenv("PIPELINE_PRUNE_HOURLY", "").lower() in ("1", "true", "yes")
+
+# ============================================
+# Local Parquet Archive (backend/archive.py)
+# ============================================
+# Tables appended to the archive every run
+ARCHIVE_TABLES = ["weather_data_15min", "weather_data", "air_quality_data", "daily_aggregates"]
+ARCHIVE_COMPACT_FILES = 24       # merge a city/year/month partition once it holds more part files
+
+# ============================================
+# Anomaly Detection (backend/anomaly.py)
+# ============================================
+# Hourly metric → (label, unit, minimum σ, also flag sudden drops)
+ANOMALY_METRICS: dict[str, tuple[str, str, float, bool]] = {
+    "temperature_2m": ("Temperature", "°C", 1.0, True),
+    "pm2_5": ("PM2.5", "µg/m³", 5.0, False),
+}
+ANOMALY_EWMA_ALPHA = 0.1         # weight of each new day in a city's hour-of-day baseline
+ANOMALY_Z_SCORE = 4.0            # |value − baseline| / σ that raises an anomaly alert (2× → high)
+ANOMALY_MIN_SAMPLES = 14         # days of history an hour-of-day baseline needs before scoring
+ANOMALY_ALERT_HOURS = 6          # how long an anomaly alert stays active
+
+# ============================================
+# Historical Backfill (backend/backfill.py)
+# ============================================
+BACKFILL_CHUNK_DAYS = 92         # days per archive request
+BACKFILL_CONCURRENCY = 4         # chunks downloaded ahead of the one being stored
+BACKFILL_REQUESTS_PER_MINUTE = 30  # Open-Meteo weighs long multi-variable ranges as several calls
+BACKFILL_LAG_DAYS = 5            # reanalysis trails real time by about this many days
+AQI_HISTORY_START = "2022-08-01"   # first day of the global air-quality archive
+# Forecast-only variables the archive API does not serve (left null in backfilled rows)
+FORECAST_ONLY_VARS = {
+    "precipitation_probability", "precipitation_probability_max", "visibility", "uv_index", "uv_index_max",
+}
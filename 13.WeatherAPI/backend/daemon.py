@@ -0,0 +1,357 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Daemon Mode — long-running scheduler with warm connections.
+
+`python daemon.py` keeps one pooled HTTP/2 client, the Supabase
+client and the resolved city list alive between runs instead of paying for
+startup, imports and the city lookup every time. Each city has its own
+refresh cadence (faster while it has active alerts). The same small HTTP
+server answers GET /health for container health checks, GET /metrics with
+the last cycle's metrics in Prometheus text format, plus POST /interpolate
+and GET /grid from a spatial index rebuilt after every cycle.
+"""
+
+import asyncio
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+import preprocess
+from alerts import load_active_alerts
+from metrics import StageMetrics
+from spatial import SpatialIndex
+from config import (
+    CITY_MAP_REFRESH_SECONDS,
+    DAEMON_ALERT_REFRESH_SECONDS,
+    DAEMON_REFRESH_SECONDS,
+    DAEMON_TICK_SECONDS,
+    HEALTH_PORT,
+    HTTP_MAX_CONNECTIONS,
+    MAX_INTERPOLATION_POINTS,
+    RAJASTHAN_BOUNDS,
+    REQUEST_TIMEOUT_SECONDS,
+    CityConfig,
+)
+
+logger = logging.getLogger(__name__)
+
+UNHEALTHY_AFTER_FAILURES = 3     # consecutive failed cycles before /health returns 503
+STALLED_CYCLE_SECONDS = DAEMON_ALERT_REFRESH_SECONDS  # a single cycle running longer than this is stuck
+MAX_REQUEST_BYTES = 1024 * 1024  # largest /interpolate body read
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None   # httpx[http2] extra
+
+
+def create_http_client(http2: bool = HTTP2_AVAILABLE) -> httpx.AsyncClient:
+    """Keep-alive connection pool for Open-Meteo, multiplexed over HTTP/2 when available."""
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=REQUEST_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=DAEMON_TICK_SECONDS * 2,
+        ),
+    )
+
+
+# ============================================
+# Per-City Schedule
+# ============================================
+class CitySchedule:
+    """Next refresh time per city; cities with active alerts use the faster cadence."""
+
+    def __init__(
+        self,
+        refresh_seconds: float = DAEMON_REFRESH_SECONDS,
+        alert_refresh_seconds: float = DAEMON_ALERT_REFRESH_SECONDS,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.alert_refresh_seconds = alert_refresh_seconds
+        self.next_due: dict[str, float] = {}
+        self.last_refreshed: dict[str, float] = {}
+        self.alerting: set[str] = set()
+
+    def interval(self, city_id: str) -> float:
+        return self.alert_refresh_seconds if city_id in self.alerting else self.refresh_seconds
+
+    def sync(self, city_ids: list[str], now: float) -> None:
+        """Track exactly these cities; newly added ones are due immediately."""
+        for city_id in set(self.next_due) - set(city_ids):
+            self.next_due.pop(city_id)
+            self.last_refreshed.pop(city_id, None)
+        for city_id in city_ids:
+            self.next_due.setdefault(city_id, now)
+
+    def due(self, now: float) -> list[str]:
+        return [city_id for city_id, at in self.next_due.items() if at <= now]
+
+    def mark_refreshed(self, city_ids: list[str], now: float, interval: float | None = None) -> None:
+        for city_id in city_ids:
+            self.last_refreshed[city_id] = now
+            self.next_due[city_id] = now + (interval if interval is not None else self.interval(city_id))
+
+    def set_alerting(self, city_ids: set[str]) -> None:
+        """Switch cadences; a city that just started alerting is pulled forward."""
+        self.alerting = city_ids & set(self.next_due)
+        for city_id in self.alerting:
+            last = self.last_refreshed.get(city_id)
+            if last is not None:
+                self.next_due[city_id] = min(self.next_due[city_id], last + self.alert_refresh_seconds)
+
+
+# ============================================
+# Daemon
+# ============================================
+class PipelineDaemon:
+    """Runs the pipeline for due cities on every tick until SIGTERM/SIGINT."""
+
+    def __init__(self, tick_seconds: float = DAEMON_TICK_SECONDS, health_port: int = HEALTH_PORT):
+        self.tick_seconds = tick_seconds
+        self.health_port = health_port
+        self.schedule = CitySchedule()
+        self.client = create_http_client()
+        self.cities: dict[str, CityConfig] = {}
+        self.cities_loaded_at: float | None = None
+        self.started_at = datetime.now(timezone.utc)
+        self.tick_started_at: float | None = None         # set while a tick is in progress
+        self.last_tick_completed_at: float | None = None
+        self.last_cycle: dict = {}
+        self.last_metrics: StageMetrics | None = None
+        self.consecutive_failures = 0
+        self.spatial: SpatialIndex | None = None
+        self._stop = asyncio.Event()
+
+    def stop(self) -> None:
+        if not self._stop.is_set():
+            logger.info("🛑 Shutdown requested — finishing the current cycle")
+            self._stop.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError):  # not available on Windows
+                loop.add_signal_handler(sig, self.stop)
+
+        server = await asyncio.start_server(self._handle_http, host="0.0.0.0", port=self.health_port)
+        logger.info(
+            f"🛰️ Daemon started: tick {self.tick_seconds:g}s, health on :{self.health_port}/health, "
+            f"HTTP/2 {'on' if HTTP2_AVAILABLE else 'off'}"
+        )
+        try:
+            async with self.client:
+                while not self._stop.is_set():
+                    await self._tick()
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._stop.wait(), timeout=self.tick_seconds)
+        finally:
+            server.close()
+            await server.wait_closed()
+            logger.info("👋 Daemon stopped")
+
+    # ----------------------------------------
+    # Scheduling
+    # ----------------------------------------
+    async def _tick(self) -> None:
+        self.tick_started_at = time.monotonic()
+        try:
+            await self._run_tick(self.tick_started_at)
+        finally:
+            self.tick_started_at = None
+            self.last_tick_completed_at = time.monotonic()
+
+    async def _run_tick(self, now: float) -> None:
+        if self.cities_loaded_at is None or now - self.cities_loaded_at >= CITY_MAP_REFRESH_SECONDS:
+            await self._refresh_cities(now)
+
+        due = [city_id for city_id in self.schedule.due(now) if city_id in self.cities]
+        if not due:
+            return
+
+        started = time.perf_counter()
+        stages = StageMetrics()
+        try:
+            result = await preprocess.run_pipeline(
+                cities=[(city_id, self.cities[city_id]) for city_id in due], client=self.client, stages=stages
+            )
+        except Exception as e:
+            logger.error(f"❌ Pipeline cycle failed: {e}")
+            self.last_metrics = stages
+            self.consecutive_failures += 1
+            # Retry on the fast cadence rather than every tick
+            self.schedule.mark_refreshed(due, time.monotonic(), self.schedule.alert_refresh_seconds)
+            return
+
+        self.schedule.mark_refreshed(due, time.monotonic())
+        self.last_metrics = stages
+        failed = sum((result or {}).get("failed", {}).values())
+        self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+        self.last_cycle = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(time.perf_counter() - started, 2),
+            "cities": len(due),
+            **(result or {}),
+        }
+        await self._refresh_alerting()
+        await self._refresh_spatial()
+
+    async def _refresh_cities(self, now: float) -> None:
+        city_map = await asyncio.to_thread(preprocess.get_city_id_map)
+        if not city_map:
+            logger.warning("⚠️ City map refresh returned nothing; keeping the previous list")
+            return
+        cities = await asyncio.to_thread(preprocess.resolve_cities, city_map)
+        self.cities = dict(cities)
+        self.cities_loaded_at = now
+        self.schedule.sync(list(self.cities), now)
+        logger.info(f"📍 City map refreshed: {len(self.cities)} cities")
+
+    async def _refresh_alerting(self) -> None:
+        try:
+            active = await asyncio.to_thread(load_active_alerts, preprocess.supabase, list(self.cities))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load active alerts for scheduling: {e}")
+            return
+        self.schedule.set_alerting(set(active["city_id"].to_list()))
+
+    # ----------------------------------------
+    # Health Endpoint
+    # ----------------------------------------
+    def health(self) -> dict:
+        now = time.monotonic()
+        if self.tick_started_at is not None:
+            # A long cycle is fine; only one that outlives the fastest refresh cadence is stuck
+            stalled = now - self.tick_started_at > STALLED_CYCLE_SECONDS
+        else:
+            stalled = self.last_tick_completed_at is None or now - self.last_tick_completed_at > self.tick_seconds * 3
+        healthy = not stalled and self.consecutive_failures < UNHEALTHY_AFTER_FAILURES
+        next_due = min(self.schedule.next_due.values(), default=None)
+        return {
+            "status": "ok" if healthy else "unhealthy",
+            "started_at": self.started_at.isoformat(),
+            "cities": len(self.cities),
+            "alerting_cities": len(self.schedule.alerting),
+            "next_run_in_seconds": round(max(0.0, next_due - now), 1) if next_due is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "cycle_running_seconds": round(now - self.tick_started_at, 1) if self.tick_started_at is not None else None,
+            "last_cycle": self.last_cycle,
+        }
+
+    def metrics(self) -> str:
+        """Prometheus exposition: the last finished cycle's metrics plus daemon status gauges."""
+        health = self.health()
+        status = StageMetrics()
+        status.set("healthy", int(health["status"] == "ok"))
+        status.set("cities", health["cities"])
+        status.set("alerting_cities", health["alerting_cities"])
+        status.set("consecutive_failures", self.consecutive_failures)
+        cycle = self.last_metrics.to_prometheus() if self.last_metrics is not None else ""
+        return cycle + status.to_prometheus(prefix="pipeline_daemon")
+
+    # ----------------------------------------
+    # Spatial Interpolation Endpoints
+    # ----------------------------------------
+    def interpolate(self, body: dict) -> tuple[str, dict]:
+        """POST /interpolate {"points": [[lat, lon], ...]} → estimates per point."""
+        if self.spatial is None:
+            return "503 Service Unavailable", {"error": "spatial index not built yet"}
+        try:
+            points = [(float(lat), float(lon)) for lat, lon in body["points"]]
+            result = self.spatial.interpolate(points)
+        except (KeyError, TypeError, ValueError) as e:
+            return "400 Bad Request", {"error": str(e)}
+        return "200 OK", {"points": result.to_dicts()}
+
+    def grid(self, query: dict[str, list[str]]) -> tuple[str, dict]:
+        """GET /grid?step=0.1[&bbox=lat_min,lon_min,lat_max,lon_max] → heat-map grid."""
+        if self.spatial is None:
+            return "503 Service Unavailable", {"error": "spatial index not built yet"}
+        try:
+            step = float(query.get("step", ["0.25"])[0])
+            bbox = query.get("bbox")
+            bounds = tuple(float(v) for v in bbox[0].split(",")) if bbox else RAJASTHAN_BOUNDS
+            if step <= 0 or len(bounds) != 4:
+                raise ValueError("step must be > 0 and bbox needs 4 values")
+            rows = (bounds[2] - bounds[0]) / step + 1
+            cols = (bounds[3] - bounds[1]) / step + 1
+            if rows * cols > MAX_INTERPOLATION_POINTS:
+                raise ValueError(f"grid exceeds {MAX_INTERPOLATION_POINTS} points; use a larger step")
+            result = self.spatial.grid(step, bounds)
+        except ValueError as e:
+            return "400 Bad Request", {"error": str(e)}
+        return "200 OK", {"step": step, "bbox": list(bounds), "points": result.to_dicts()}
+
+    async def _refresh_spatial(self) -> None:
+        try:
+            self.spatial = await asyncio.to_thread(SpatialIndex.from_supabase, preprocess.supabase)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not rebuild the spatial index: {e}")
+
+    # ----------------------------------------
+    # HTTP
+    # ----------------------------------------
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await asyncio.wait_for(reader.readline(), timeout=5)).decode("latin-1")
+            parts = request_line.split()
+            method, target = (parts[0], parts[1]) if len(parts) > 1 else ("", "")
+            headers = {}
+            while (line := await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = min(int(headers.get("content-length") or 0), MAX_REQUEST_BYTES)
+            raw_body = await asyncio.wait_for(reader.readexactly(length), timeout=5) if length else b""
+
+            url = urlparse(target)
+            content_type = "application/json"
+            if url.path in ("/health", "/healthz"):
+                body = self.health()
+                status = "200 OK" if body["status"] == "ok" else "503 Service Unavailable"
+            elif url.path == "/interpolate" and method == "POST":
+                try:
+                    request = json.loads(raw_body or b"{}")
+                except ValueError:
+                    status, body = "400 Bad Request", {"error": "body must be JSON"}
+                else:
+                    status, body = await asyncio.to_thread(self.interpolate, request)
+            elif url.path == "/grid" and method == "GET":
+                status, body = await asyncio.to_thread(self.grid, parse_qs(url.query))
+            elif url.path == "/metrics" and method == "GET":
+                status, body = "200 OK", self.metrics()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body, status = {"error": "not found"}, "404 Not Found"
+            payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_daemon() -> None:
+    await PipelineDaemon(health_port=int(os.getenv("HEALTH_PORT", HEALTH_PORT))).run()
+
+
+# ============================================
+# Entry Point
+# ============================================
+# Started as its own script so preprocess is imported once, as a module,
+# rather than running as __main__ and being imported a second time here.
+if __name__ == "__main__":
+    if preprocess.supabase is None:
+        logger.error("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set!")
+        sys.exit(1)
+    asyncio.run(run_daemon())
@@ -0,0 +1,71 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Derived Metrics — comfort and exposure indices from the hourly frames.
+
+Everything here is a Polars expression, so the indices are computed for all
+hours of a city in one vectorized pass and folded into daily_aggregates by
+the same group_by that builds the daily AQI stats.
+"""
+
+import polars as pl
+
+from config import THRESHOLDS
+
+T = pl.col("temperature_2m")
+RH = pl.col("relative_humidity_2m")
+
+
+def heat_index_c(t: pl.Expr = T, rh: pl.Expr = RH) -> pl.Expr:
+    """
+    NWS heat index (°C) from air temperature (°C) and relative humidity (%).
+
+    Steadman's simple formula below ~80 °F, otherwise the Rothfusz regression
+    with the NWS low- and high-humidity adjustments.
+    """
+    f = t * 9 / 5 + 32
+    simple = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + rh * 0.094)
+    rothfusz = (
+        -42.379 + 2.04901523 * f + 10.14333127 * rh - 0.22475541 * f * rh
+        - 0.00683783 * f**2 - 0.05481717 * rh**2 + 0.00122874 * f**2 * rh
+        + 0.00085282 * f * rh**2 - 0.00000199 * f**2 * rh**2
+    )
+    adjusted = (
+        pl.when((rh < 13) & (f >= 80) & (f <= 112))
+        .then(rothfusz - (13 - rh) / 4 * ((17 - (f - 95).abs()) / 17).sqrt())
+        .when((rh > 85) & (f >= 80) & (f <= 87))
+        .then(rothfusz + (rh - 85) / 10 * (87 - f) / 5)
+        .otherwise(rothfusz)
+    )
+    hi_f = pl.when((simple + f) / 2 < 80).then(simple).otherwise(adjusted)
+    return (hi_f - 32) * 5 / 9
+
+
+def wbgt_c(t: pl.Expr = T, rh: pl.Expr = RH) -> pl.Expr:
+    """
+    Approximate shaded wet-bulb globe temperature (°C), Australian BoM formula.
+
+    Uses only temperature and humidity (no radiation or wind), so it reads
+    low in full sun; good for comparing days and cities.
+    """
+    vapour_pressure = rh / 100 * 6.105 * (17.27 * t / (237.7 + t)).exp()
+    return 0.567 * t + 0.393 * vapour_pressure + 3.94
+
+
+def _hours(condition: pl.Expr) -> pl.Expr:
+    return condition.fill_null(False).sum().cast(pl.Int64)
+
+
+# Per-day aggregations over hourly weather (grouped by date)
+DAILY_WEATHER_DERIVED = [
+    T.mean().round(2).alias("temp_mean"),
+    heat_index_c().max().round(2).alias("heat_index_max"),
+    wbgt_c().max().round(2).alias("wbgt_max"),
+]
+
+# Per-day aggregations over hourly AQI; band hours are cumulative (≥ band start)
+DAILY_AQI_DERIVED = [
+    _hours(pl.col("us_aqi") >= THRESHOLDS["poor_aqi"]).alias("hours_poor_aqi"),
+    _hours(pl.col("us_aqi") >= THRESHOLDS["very_poor_aqi"]).alias("hours_very_poor_aqi"),
+    _hours(pl.col("us_aqi") >= THRESHOLDS["hazardous_aqi"]).alias("hours_hazardous_aqi"),
+    _hours(pl.col("dust") >= THRESHOLDS["dust_exposure"]).alias("dust_exposure_hours"),
+]
@@ -0,0 +1,206 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Pipeline Metrics — per-stage latency histograms and labeled run metrics.
+
+Besides the stage histograms, a run records labeled values (fetch latency,
+retries and failures per city and API, rows per city and table, upsert
+latency, payload bytes and failures per table). Everything renders as
+Prometheus text exposition, written to a node_exporter textfile after a
+one-shot run or served from the daemon's GET /metrics.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS: tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "pipeline"
+# HELP text per labeled metric; every value describes the last run
+METRIC_HELP = {
+    "fetch_seconds": "Open-Meteo request time per city and API (a batched request counts for each of its cities).",
+    "fetch_retries": "Retries of fetch_api per city and API.",
+    "fetch_failures": "Open-Meteo fetches that failed after retries, per city and API.",
+    "process_seconds": "Processing time per city.",
+    "process_calls": "Processing passes per city.",
+    "rows_processed": "Rows produced per city and table (before the unchanged-row diff).",
+    "store_seconds": "Upsert time per table, summed over chunks and retries.",
+    "store_calls": "Upsert requests per table, including retries.",
+    "upsert_payload_bytes": "Estimated JSON bytes sent per table.",
+    "upsert_failed_rows": "Rows that could not be written after retries, per table.",
+    "rows_written": "Rows written per table.",
+    "run_duration_seconds": "Wall-clock duration of the run.",
+    "last_run_timestamp_seconds": "Unix time the run finished.",
+    # Daemon status (pipeline_daemon_*)
+    "healthy": "1 while /health reports ok.",
+    "cities": "Cities scheduled by the daemon.",
+    "alerting_cities": "Cities on the fast refresh cadence because of active alerts.",
+    "consecutive_failures": "Pipeline cycles that failed in a row.",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class LatencyHistogram:
+    """Collects latency samples for one pipeline stage."""
+
+    def __init__(self, name: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.samples: list[float] = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    @property
+    def total(self) -> float:
+        return sum(self.samples)
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile, q in [0, 100]."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+        return ordered[rank]
+
+    def bucket_counts(self) -> list[tuple[float, int]]:
+        """Cumulative counts per upper bound (Prometheus style), ending with +Inf."""
+        counts = []
+        for bound in (*self.buckets, float("inf")):
+            counts.append((bound, sum(1 for s in self.samples if s <= bound)))
+        return counts
+
+
+class StageMetrics:
+    """Latency histograms keyed by stage name (fetch, process, store, ...) plus labeled run values."""
+
+    def __init__(self):
+        self.stages: dict[str, LatencyHistogram] = {}
+        self.values: dict[str, dict[Labels, float]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = LatencyHistogram(stage)
+            return self.stages[stage]
+
+    @contextmanager
+    def time(self, stage: str, **labels: str):
+        """Observe the block in the stage histogram; with labels, also add it to `<stage>_seconds`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram(stage).observe(elapsed)
+            if labels:
+                self.inc(f"{stage}_seconds", elapsed, **labels)
+                self.inc(f"{stage}_calls", 1, **labels)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add to a labeled value (created at 0)."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a labeled value."""
+        with self._lock:
+            self.values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """JSON-friendly count/total/p50/p95 per stage (health endpoint, replay harness)."""
+        return {
+            name: {
+                "count": hist.count,
+                "total": round(hist.total, 4),
+                "p50": round(hist.percentile(50), 4),
+                "p95": round(hist.percentile(95), 4),
+            }
+            for name, hist in self.stages.items()
+        }
+
+    def log_report(self, logger: logging.Logger) -> None:
+        """Log p50/p95/max plus a compact bucket histogram for every stage."""
+        for name, hist in self.stages.items():
+            if not hist.count:
+                continue
+            logger.info(
+                f"   ⏱️ {name:<10} n={hist.count:<5} p50={hist.percentile(50):.2f}s "
+                f"p95={hist.percentile(95):.2f}s max={max(hist.samples):.2f}s total={hist.total:.1f}s"
+            )
+            previous = 0
+            buckets = []
+            for bound, cumulative in hist.bucket_counts():
+                if cumulative > previous:
+                    label = "+Inf" if bound == float("inf") else f"≤{bound:g}s"
+                    buckets.append(f"{label}:{cumulative - previous}")
+                previous = cumulative
+            logger.info(f"      {' '.join(buckets)}")
+
+    # ----------------------------------------
+    # Prometheus export
+    # ----------------------------------------
+    def to_prometheus(self, prefix: str = METRIC_PREFIX) -> str:
+        """Prometheus text exposition (0.0.4) of the stage histograms and every labeled value."""
+        lines = []
+        with self._lock:
+            stages = dict(self.stages)
+            values = {name: dict(series) for name, series in self.values.items()}
+        if stages:
+            lines.append(f"# HELP {prefix}_stage_latency_seconds Latency of each pipeline stage in the last run.")
+            lines.append(f"# TYPE {prefix}_stage_latency_seconds histogram")
+        for name, hist in stages.items():
+            labels = (("stage", name),)
+            for bound, cumulative in hist.bucket_counts():
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{prefix}_stage_latency_seconds_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{prefix}_stage_latency_seconds_sum{_format_labels(labels)} {_format_value(hist.total)}")
+            lines.append(f"{prefix}_stage_latency_seconds_count{_format_labels(labels)} {hist.count}")
+
+        # Values restart with every run, so they are exposed as gauges rather than counters
+        for name in sorted(values):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name.replace('_', ' ').capitalize() + '.')}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in sorted(values[name].items()):
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_textfile(self, path: str | Path) -> None:
+        """Write the exposition for node_exporter's textfile collector (temp file + rename)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, path)
@@ -9,9 +9,12 @@ Designed to run as a scheduled cron job every 2-3 hours.
 """
 
 import asyncio
+import contextlib
+import contextvars
 import logging
 import os
 import sys
+import time
 from datetime import datetime, timezone, timedelta
 from typing import Any
 
@@ -28,13 +31,38 @@ from config import (
     HOURLY_WEATHER_VARS,
     DAILY_WEATHER_VARS,
     HOURLY_AQI_VARS,
+    MINUTELY_15_VARS,
     THRESHOLDS,
     MAX_RETRIES,
     REQUEST_TIMEOUT_SECONDS,
     FORECAST_DAYS,
     TIMEZONE,
+    MAX_CONCURRENT_FETCHES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    CITIES_PER_REQUEST,
+    STORE_WORKERS,
+    CACHE_DIR,
+    ARCHIVE_DIR,
     CityConfig,
 )
+from metrics import StageMetrics
+from writer import BulkWriter
+from cache import ResponseCache, SnapshotDiff
+from rollup import RollupEngine
+from archive import ParquetArchive
+from anomaly import AnomalyDetector
+from snapshot import CitySnapshots
+from derived import DAILY_AQI_DERIVED, DAILY_WEATHER_DERIVED
+from tiers import downsample_to_hourly, hourly_pruning_allowed, merge_downsampled, prune_expired_tiers
+from alerts import (
+    daily_visibility,
+    drop_expired,
+    evaluate_rules,
+    evaluated_days,
+    load_active_alerts,
+    reconcile_alerts,
+    retire_alerts,
+)
 
 # ============================================
 # Logging Setup
@@ -53,24 +81,41 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    logger.error("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set!")
-    sys.exit(1)
-
-# Initialize Supabase client with service_role key (bypasses RLS)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", MAX_CONCURRENT_FETCHES))
+FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", CITIES_PER_REQUEST))
+RESPONSE_CACHE_TTL = int(os.getenv("PIPELINE_RESPONSE_CACHE_TTL", RESPONSE_CACHE_TTL_SECONDS))
+# Also ingest Open-Meteo minutely_15 data into the weather_data_15min raw tier
+MINUTELY_15_ENABLED = os.getenv("PIPELINE_MINUTELY_15", "").lower() in ("1", "true", "yes")
+# Prometheus textfile written after each one-shot run (e.g. node_exporter's textfile directory)
+METRICS_FILE = os.getenv("PIPELINE_METRICS_FILE", "")
+
+# Initialize Supabase client with service_role key (bypasses RLS).
+# Left as None without credentials so the processing functions stay importable
+# (benchmarks); the entry point refuses to run without it.
+supabase: Client | None = (
+    create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    if SUPABASE_URL and SUPABASE_SERVICE_KEY else None
+)
 
 # ============================================
 # API Fetching with Retries
 # ============================================
+# Retry counter of the fetch_locations call running in the current task
+_fetch_retries: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar("fetch_retries", default=None)
+
+
+def _before_retry_sleep(retry_state) -> None:
+    counter = _fetch_retries.get()
+    if counter is not None:
+        counter[0] += 1
+    logger.warning(f"⚠️ Retry {retry_state.attempt_number}/{MAX_RETRIES} after error...")
+
+
 @retry(
     stop=stop_after_attempt(MAX_RETRIES),
     wait=wait_exponential(multiplier=1, min=2, max=10),
     retry=retry_if_exception_type((httpx.HTTPError, httpx.TimeoutException)),
-    before_sleep=lambda retry_state: logger.warning(
-        f"⚠️ Retry {retry_state.attempt_number}/{MAX_RETRIES} after error..."
-    ),
+    before_sleep=_before_retry_sleep,
 )
 async def fetch_api(client: httpx.AsyncClient, url: str, params: dict) -> dict:
     """Fetch data from Open-Meteo API with retry logic."""
@@ -79,517 +124,670 @@ async def fetch_api(client: httpx.AsyncClient, url: str, params: dict) -> dict:
     return response.json()
 
 
-async def fetch_weather_data(client: httpx.AsyncClient, city: CityConfig) -> dict | None:
-    """Fetch hourly + daily weather forecast for a city."""
-    params = {
-        "latitude": city.latitude,
-        "longitude": city.longitude,
-        "hourly": ",".join(HOURLY_WEATHER_VARS),
-        "daily": ",".join(DAILY_WEATHER_VARS),
-        "timezone": TIMEZONE,
-        "forecast_days": FORECAST_DAYS,
+WEATHER_PARAMS = {
+    "hourly": ",".join(HOURLY_WEATHER_VARS),
+    "daily": ",".join(DAILY_WEATHER_VARS),
+    "timezone": TIMEZONE,
+    "forecast_days": FORECAST_DAYS,
+}
+if MINUTELY_15_ENABLED:
+    WEATHER_PARAMS["minutely_15"] = ",".join(MINUTELY_15_VARS)
+
+AQI_PARAMS = {
+    "hourly": ",".join(HOURLY_AQI_VARS),
+    "timezone": TIMEZONE,
+    "forecast_days": FORECAST_DAYS,
+}
+
+
+async def fetch_locations(
+    client: httpx.AsyncClient,
+    url: str,
+    params: dict,
+    cities: list[CityConfig],
+    label: str,
+    cache: ResponseCache | None = None,
+    metrics: StageMetrics | None = None,
+) -> list[dict | None]:
+    """
+    Fetch several cities in one Open-Meteo request.
+
+    Open-Meteo accepts comma-separated latitude/longitude lists and answers with
+    a JSON array in the same order (a single object for one location). Cities
+    with a fresh cached response are not requested again. Returns one payload
+    per city; cities in a failed request get None. With `metrics`, request
+    time, retries and failures are recorded for every requested city.
+    """
+    payloads: list[dict | None] = [None] * len(cities)
+    keys = [cache.key(url, city, params) for city in cities] if cache else []
+    if cache:
+        payloads = [cache.get(key) for key in keys]
+
+    missing = [i for i, payload in enumerate(payloads) if payload is None]
+    cached_count = len(cities) - len(missing)
+    if not missing:
+        logger.info(f"💾 {label} served from cache for {len(cities)} cities")
+        return payloads
+
+    to_fetch = [cities[i] for i in missing]
+    batch_params = {
+        "latitude": ",".join(str(c.latitude) for c in to_fetch),
+        "longitude": ",".join(str(c.longitude) for c in to_fetch),
+        **params,
     }
+    names = ", ".join(c.name for c in to_fetch)
+    retries = [0]
+    token = _fetch_retries.set(retries)
+    start = time.perf_counter()
+    failed = True
     try:
-        data = await fetch_api(client, WEATHER_API_URL, params)
-        logger.info(f"✅ Weather data fetched for {city.name}")
-        return data
+        data = await fetch_api(client, url, batch_params)
+        fetched = data if isinstance(data, list) else [data]
+        if len(fetched) != len(to_fetch):
+            logger.error(f"❌ {label} response had {len(fetched)} locations for {len(to_fetch)} cities: {names}")
+            return payloads
+        failed = False
     except Exception as e:
-        logger.error(f"❌ Failed to fetch weather for {city.name}: {e}")
-        return None
+        logger.error(f"❌ Failed to fetch {label} for {names}: {e}")
+        return payloads
+    finally:
+        _fetch_retries.reset(token)
+        if metrics is not None:
+            elapsed = time.perf_counter() - start
+            for city in to_fetch:
+                metrics.inc("fetch_seconds", elapsed, city=city.name, api=label)
+                metrics.inc("fetch_retries", retries[0], city=city.name, api=label)
+                metrics.inc("fetch_failures", int(failed), city=city.name, api=label)
+
+    for i, payload in zip(missing, fetched):
+        payloads[i] = payload
+        if cache:
+            cache.put(keys[i], payload)
+    logger.info(f"✅ {label} data fetched for {names}" + (f" (+{cached_count} cached)" if cached_count else ""))
+    return payloads
+
+
+async def fetch_weather_batch(
+    client: httpx.AsyncClient,
+    cities: list[CityConfig],
+    cache: ResponseCache | None = None,
+    metrics: StageMetrics | None = None,
+) -> list[dict | None]:
+    """Fetch hourly + daily weather forecasts for a batch of cities."""
+    return await fetch_locations(client, WEATHER_API_URL, WEATHER_PARAMS, cities, "Weather", cache, metrics)
+
+
+async def fetch_air_quality_batch(
+    client: httpx.AsyncClient,
+    cities: list[CityConfig],
+    cache: ResponseCache | None = None,
+    metrics: StageMetrics | None = None,
+) -> list[dict | None]:
+    """Fetch hourly air quality data for a batch of cities."""
+    return await fetch_locations(client, AIR_QUALITY_API_URL, AQI_PARAMS, cities, "AQI", cache, metrics)
+
+
+async def fetch_weather_data(client: httpx.AsyncClient, city: CityConfig) -> dict | None:
+    """Fetch hourly + daily weather forecast for a city."""
+    return (await fetch_weather_batch(client, [city]))[0]
 
 
 async def fetch_air_quality_data(client: httpx.AsyncClient, city: CityConfig) -> dict | None:
     """Fetch hourly air quality data for a city."""
-    params = {
-        "latitude": city.latitude,
-        "longitude": city.longitude,
-        "hourly": ",".join(HOURLY_AQI_VARS),
-        "timezone": TIMEZONE,
-        "forecast_days": FORECAST_DAYS,
-    }
-    try:
-        data = await fetch_api(client, AIR_QUALITY_API_URL, params)
-        logger.info(f"✅ AQI data fetched for {city.name}")
-        return data
-    except Exception as e:
-        logger.error(f"❌ Failed to fetch AQI for {city.name}: {e}")
-        return None
+    return (await fetch_air_quality_batch(client, [city]))[0]
 
 
 # ============================================
 # Data Processing with Polars
 # ============================================
-def process_hourly_weather(raw: dict, city_id: str) -> list[dict]:
-    """Process raw hourly weather data into database-ready records."""
+# (db column, Open-Meteo variable, default for short arrays, dtype)
+HOURLY_WEATHER_COLUMNS: list[tuple[str, str, Any, pl.DataType]] = [
+    (var, var, 0 if var in ("precipitation", "rain") else None,
+     pl.Int64 if var == "weather_code" else pl.Float64)
+    for var in HOURLY_WEATHER_VARS
+]
+
+MINUTELY_15_COLUMNS: list[tuple[str, str, Any, pl.DataType]] = [
+    (var, var, 0 if var in ("precipitation", "rain") else None,
+     pl.Int64 if var == "weather_code" else pl.Float64)
+    for var in MINUTELY_15_VARS
+]
+
+HOURLY_AQI_COLUMNS: list[tuple[str, str, Any, pl.DataType]] = [
+    (var, var, None, pl.Float64) for var in HOURLY_AQI_VARS
+]
+
+DAILY_WEATHER_COLUMNS: list[tuple[str, str, Any, pl.DataType]] = [
+    ("temp_max", "temperature_2m_max", None, pl.Float64),
+    ("temp_min", "temperature_2m_min", None, pl.Float64),
+    ("apparent_temp_max", "apparent_temperature_max", None, pl.Float64),
+    ("apparent_temp_min", "apparent_temperature_min", None, pl.Float64),
+    ("precipitation_sum", "precipitation_sum", 0, pl.Float64),
+    ("precipitation_hours", "precipitation_hours", 0, pl.Float64),
+    ("rain_sum", "rain_sum", 0, pl.Float64),
+    ("precipitation_probability_max", "precipitation_probability_max", None, pl.Float64),
+    ("wind_speed_max", "wind_speed_10m_max", None, pl.Float64),
+    ("wind_gusts_max", "wind_gusts_10m_max", None, pl.Float64),
+    ("wind_direction_dominant", "wind_direction_10m_dominant", None, pl.Float64),
+    ("weather_code", "weather_code", None, pl.Int64),
+    ("sunrise", "sunrise", None, pl.Utf8),
+    ("sunset", "sunset", None, pl.Utf8),
+    ("uv_index_max", "uv_index_max", None, pl.Float64),
+]
+
+DAILY_AQI_STATS = [
+    pl.col("us_aqi").mean().alias("aqi_mean"),
+    pl.col("us_aqi").max().alias("aqi_max"),
+    pl.col("pm2_5").mean().alias("pm2_5_mean"),
+    pl.col("pm10").mean().alias("pm10_mean"),
+    pl.col("dust").mean().alias("dust_mean"),
+]
+
+
+def _padded_column(block: dict, var: str, length: int, default: Any, dtype: pl.DataType) -> pl.Series:
+    """Build one column from an Open-Meteo array, padding only if it is short."""
+    values = block.get(var)
+    if values is None:
+        return pl.repeat(default, length, dtype=dtype, eager=True).alias(var)
+    series = pl.Series(var, values[:length], dtype=dtype, strict=False)
+    if len(series) < length:
+        padding = pl.repeat(default, length - len(series), dtype=dtype, eager=True).alias(var)
+        series = series.append(padding)
+    return series
+
+
+def _columns_frame(block: dict, time_col: str, columns: list[tuple[str, str, Any, pl.DataType]]) -> pl.DataFrame:
+    """Turn an Open-Meteo `hourly` / `daily` block into a frame, one Series per column."""
+    times = pl.Series(time_col, block["time"], dtype=pl.Utf8)
+    return pl.DataFrame([
+        times,
+        *(_padded_column(block, var, len(times), default, dtype).alias(col)
+          for col, var, default, dtype in columns),
+    ])
+
+
+def process_hourly_weather(raw: dict, city_id: str) -> pl.DataFrame:
+    """Process raw hourly weather data into a database-ready frame."""
     hourly = raw.get("hourly", {})
     if not hourly or "time" not in hourly:
-        return []
+        return pl.DataFrame()
 
-    times = hourly["time"]
-    now = datetime.now(timezone.utc)
-
-    records = []
-    for i, time_str in enumerate(times):
-        record = {
-            "city_id": city_id,
-            "recorded_at": time_str,
-            "temperature_2m": hourly.get("temperature_2m", [None])[i] if i < len(hourly.get("temperature_2m", [])) else None,
-            "apparent_temperature": hourly.get("apparent_temperature", [None])[i] if i < len(hourly.get("apparent_temperature", [])) else None,
-            "relative_humidity_2m": hourly.get("relative_humidity_2m", [None])[i] if i < len(hourly.get("relative_humidity_2m", [])) else None,
-            "dewpoint_2m": hourly.get("dewpoint_2m", [None])[i] if i < len(hourly.get("dewpoint_2m", [])) else None,
-            "precipitation": hourly.get("precipitation", [0])[i] if i < len(hourly.get("precipitation", [])) else 0,
-            "precipitation_probability": hourly.get("precipitation_probability", [None])[i] if i < len(hourly.get("precipitation_probability", [])) else None,
-            "rain": hourly.get("rain", [0])[i] if i < len(hourly.get("rain", [])) else 0,
-            "wind_speed_10m": hourly.get("wind_speed_10m", [None])[i] if i < len(hourly.get("wind_speed_10m", [])) else None,
-            "wind_direction_10m": hourly.get("wind_direction_10m", [None])[i] if i < len(hourly.get("wind_direction_10m", [])) else None,
-            "wind_gusts_10m": hourly.get("wind_gusts_10m", [None])[i] if i < len(hourly.get("wind_gusts_10m", [])) else None,
-            "weather_code": hourly.get("weather_code", [None])[i] if i < len(hourly.get("weather_code", [])) else None,
-            "cloud_cover": hourly.get("cloud_cover", [None])[i] if i < len(hourly.get("cloud_cover", [])) else None,
-            "visibility": hourly.get("visibility", [None])[i] if i < len(hourly.get("visibility", [])) else None,
-            "surface_pressure": hourly.get("surface_pressure", [None])[i] if i < len(hourly.get("surface_pressure", [])) else None,
-            "uv_index": hourly.get("uv_index", [None])[i] if i < len(hourly.get("uv_index", [])) else None,
-            "is_forecast": datetime.fromisoformat(time_str) > now.replace(tzinfo=None),
-        }
-        records.append(record)
-
-    # Use Polars for efficient null handling and type validation
-    df = pl.DataFrame(records)
+    # Open-Meteo times are naive local strings; compared against naive UTC as before
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    df = _columns_frame(hourly, "recorded_at", HOURLY_WEATHER_COLUMNS).select(
+        pl.lit(city_id).alias("city_id"),
+        pl.all(),
+        (pl.col("recorded_at").str.to_datetime(strict=False) > now).fill_null(False).alias("is_forecast"),
+    )
     logger.debug(f"  Processed {len(df)} hourly weather records")
-    return df.to_dicts()
+    return df
+
+
+def process_minutely_15(raw: dict, city_id: str) -> pl.DataFrame:
+    """Process raw minutely_15 weather data into weather_data_15min rows."""
+    minutely = raw.get("minutely_15", {})
+    if not minutely or "time" not in minutely:
+        return pl.DataFrame()
 
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    df = _columns_frame(minutely, "recorded_at", MINUTELY_15_COLUMNS).select(
+        pl.lit(city_id).alias("city_id"),
+        pl.all(),
+        (pl.col("recorded_at").str.to_datetime(strict=False) > now).fill_null(False).alias("is_forecast"),
+    )
+    logger.debug(f"  Processed {len(df)} 15-minute weather records")
+    return df
 
-def process_air_quality(raw: dict, city_id: str) -> list[dict]:
-    """Process raw air quality data into database-ready records."""
+
+def process_air_quality(raw: dict, city_id: str) -> pl.DataFrame:
+    """Process raw air quality data into a database-ready frame."""
     hourly = raw.get("hourly", {})
     if not hourly or "time" not in hourly:
-        return []
+        return pl.DataFrame()
 
-    times = hourly["time"]
-    records = []
-    for i, time_str in enumerate(times):
-        record = {
-            "city_id": city_id,
-            "recorded_at": time_str,
-            "pm2_5": hourly.get("pm2_5", [None])[i] if i < len(hourly.get("pm2_5", [])) else None,
-            "pm10": hourly.get("pm10", [None])[i] if i < len(hourly.get("pm10", [])) else None,
-            "dust": hourly.get("dust", [None])[i] if i < len(hourly.get("dust", [])) else None,
-            "carbon_monoxide": hourly.get("carbon_monoxide", [None])[i] if i < len(hourly.get("carbon_monoxide", [])) else None,
-            "nitrogen_dioxide": hourly.get("nitrogen_dioxide", [None])[i] if i < len(hourly.get("nitrogen_dioxide", [])) else None,
-            "sulphur_dioxide": hourly.get("sulphur_dioxide", [None])[i] if i < len(hourly.get("sulphur_dioxide", [])) else None,
-            "ozone": hourly.get("ozone", [None])[i] if i < len(hourly.get("ozone", [])) else None,
-            "us_aqi": hourly.get("us_aqi", [None])[i] if i < len(hourly.get("us_aqi", [])) else None,
-            "european_aqi": hourly.get("european_aqi", [None])[i] if i < len(hourly.get("european_aqi", [])) else None,
-            "us_aqi_pm2_5": hourly.get("us_aqi_pm2_5", [None])[i] if i < len(hourly.get("us_aqi_pm2_5", [])) else None,
-            "us_aqi_pm10": hourly.get("us_aqi_pm10", [None])[i] if i < len(hourly.get("us_aqi_pm10", [])) else None,
-        }
-        records.append(record)
-
-    df = pl.DataFrame(records)
+    df = _columns_frame(hourly, "recorded_at", HOURLY_AQI_COLUMNS).select(
+        pl.lit(city_id).alias("city_id"),
+        pl.all(),
+    )
     logger.debug(f"  Processed {len(df)} air quality records")
-    return df.to_dicts()
-
-
-def process_daily_aggregates(weather_raw: dict, aqi_records: list[dict], city_id: str) -> list[dict]:
-    """Process daily weather aggregates + AQI stats."""
+    return df
+
+
+def _join_daily_stats(
+    daily_df: pl.DataFrame,
+    hourly: pl.DataFrame | None,
+    stats: list[pl.Expr],
+    columns: list[tuple[str, str, Any, pl.DataType]],
+) -> pl.DataFrame:
+    """
+    Aggregate an hourly frame per day with `stats` and join onto the daily frame.
+
+    Without hourly data the stats run over an empty frame of the same columns,
+    so the null values keep each stat's own dtype (integer hour counts stay
+    Int64 when this city is concatenated with others).
+    """
+    if hourly is None or hourly.is_empty() or "recorded_at" not in hourly.columns:
+        hourly = _columns_frame({"time": []}, "recorded_at", columns)
+    per_day = hourly.group_by(pl.col("recorded_at").str.slice(0, 10).alias("date")).agg(stats)
+    return daily_df.join(per_day, on="date", how="left").sort("date", maintain_order=True)
+
+
+def process_daily_aggregates(
+    weather_raw: dict,
+    aqi_records: pl.DataFrame,
+    city_id: str,
+    hourly_records: pl.DataFrame | None = None,
+) -> pl.DataFrame:
+    """Process daily weather aggregates + AQI stats + indices derived from the hourly frames."""
     daily = weather_raw.get("daily", {})
     if not daily or "time" not in daily:
-        return []
-
-    times = daily["time"]
-
-    # Calculate daily AQI stats using Polars
-    aqi_daily_stats = {}
-    if aqi_records:
-        aqi_df = pl.DataFrame(aqi_records)
-        if "recorded_at" in aqi_df.columns:
-            aqi_df = aqi_df.with_columns(
-                pl.col("recorded_at").str.slice(0, 10).alias("date")
-            )
-            aqi_grouped = aqi_df.group_by("date").agg([
-                pl.col("us_aqi").mean().alias("aqi_mean"),
-                pl.col("us_aqi").max().alias("aqi_max"),
-                pl.col("pm2_5").mean().alias("pm2_5_mean"),
-                pl.col("pm10").mean().alias("pm10_mean"),
-                pl.col("dust").mean().alias("dust_mean"),
-            ])
-            for row in aqi_grouped.to_dicts():
-                aqi_daily_stats[row["date"]] = row
-
-    records = []
-    for i, date_str in enumerate(times):
-        temp_max = daily.get("temperature_2m_max", [None])[i] if i < len(daily.get("temperature_2m_max", [])) else None
-        precip_sum = daily.get("precipitation_sum", [0])[i] if i < len(daily.get("precipitation_sum", [])) else 0
-        wind_max = daily.get("wind_speed_10m_max", [None])[i] if i < len(daily.get("wind_speed_10m_max", [])) else None
-
-        # AQI stats for this date
-        aqi_stats = aqi_daily_stats.get(date_str, {})
-        dust_mean = aqi_stats.get("dust_mean")
-
-        # Rajasthan-specific flags
-        is_heatwave = temp_max is not None and temp_max > THRESHOLDS["heatwave_temp"]
-        is_dust_storm = (
-            dust_mean is not None and dust_mean > THRESHOLDS["dust_storm_dust"]
-            and wind_max is not None and wind_max > THRESHOLDS["dust_storm_wind"]
-        )
-        is_heavy_rain = precip_sum is not None and precip_sum > THRESHOLDS["heavy_rain_mm"]
-
-        record = {
-            "city_id": city_id,
-            "date": date_str,
-            "temp_max": temp_max,
-            "temp_min": daily.get("temperature_2m_min", [None])[i] if i < len(daily.get("temperature_2m_min", [])) else None,
-            "temp_mean": None,  # Calculated from hourly if needed
-            "apparent_temp_max": daily.get("apparent_temperature_max", [None])[i] if i < len(daily.get("apparent_temperature_max", [])) else None,
-            "apparent_temp_min": daily.get("apparent_temperature_min", [None])[i] if i < len(daily.get("apparent_temperature_min", [])) else None,
-            "precipitation_sum": precip_sum,
-            "precipitation_hours": daily.get("precipitation_hours", [0])[i] if i < len(daily.get("precipitation_hours", [])) else 0,
-            "rain_sum": daily.get("rain_sum", [0])[i] if i < len(daily.get("rain_sum", [])) else 0,
-            "precipitation_probability_max": daily.get("precipitation_probability_max", [None])[i] if i < len(daily.get("precipitation_probability_max", [])) else None,
-            "wind_speed_max": wind_max,
-            "wind_gusts_max": daily.get("wind_gusts_10m_max", [None])[i] if i < len(daily.get("wind_gusts_10m_max", [])) else None,
-            "wind_direction_dominant": daily.get("wind_direction_10m_dominant", [None])[i] if i < len(daily.get("wind_direction_10m_dominant", [])) else None,
-            "weather_code": daily.get("weather_code", [None])[i] if i < len(daily.get("weather_code", [])) else None,
-            "sunrise": daily.get("sunrise", [None])[i] if i < len(daily.get("sunrise", [])) else None,
-            "sunset": daily.get("sunset", [None])[i] if i < len(daily.get("sunset", [])) else None,
-            "uv_index_max": daily.get("uv_index_max", [None])[i] if i < len(daily.get("uv_index_max", [])) else None,
-            "aqi_mean": aqi_stats.get("aqi_mean"),
-            "aqi_max": aqi_stats.get("aqi_max"),
-            "pm2_5_mean": aqi_stats.get("pm2_5_mean"),
-            "pm10_mean": aqi_stats.get("pm10_mean"),
-            "dust_mean": dust_mean,
-            "is_heatwave": is_heatwave,
-            "is_dust_storm_risk": is_dust_storm,
-            "is_heavy_rain": is_heavy_rain,
-        }
-        records.append(record)
-
-    return records
-
-
-# ============================================
-# Alert Generation
-# ============================================
-def generate_alerts(daily_records: list[dict], city_id: str, city_name: str) -> list[dict]:
-    """Generate Rajasthan-specific weather & AQI alerts."""
-    alerts = []
-    now = datetime.now(timezone.utc)
-
-    for record in daily_records:
-        date_str = record["date"]
-        starts_at = f"{date_str}T00:00:00Z"
-        expires_at = f"{date_str}T23:59:59Z"
-
-        # 🔥 Heatwave Alert
-        temp_max = record.get("temp_max")
-        if temp_max and temp_max > THRESHOLDS["heatwave_temp"]:
-            severity = "extreme" if temp_max > THRESHOLDS["extreme_heat_temp"] else "high"
-            alerts.append({
-                "city_id": city_id,
-                "alert_type": "heatwave",
-                "severity": severity,
-                "title": f"🔥 {'Severe ' if severity == 'extreme' else ''}Heatwave Alert — {city_name}",
-                "description": f"Temperature expected to reach {temp_max:.1f}°C on {date_str}. "
-                              f"Stay hydrated, avoid outdoor exposure between 11 AM - 4 PM.",
-                "value": temp_max,
-                "threshold": THRESHOLDS["heatwave_temp"],
-                "starts_at": starts_at,
-                "expires_at": expires_at,
-                "is_active": True,
-            })
-
-        # 🏜️ Dust Storm Risk
-        if record.get("is_dust_storm_risk"):
-            alerts.append({
-                "city_id": city_id,
-                "alert_type": "dust_storm",
-                "severity": "high",
-                "title": f"🏜️ Dust Storm Risk — {city_name}",
-                "description": f"High dust concentration ({record.get('dust_mean', 0):.0f} µg/m³) with "
-                              f"strong winds ({record.get('wind_speed_max', 0):.0f} km/h). "
-                              f"Thar Desert dust advisory in effect.",
-                "value": record.get("dust_mean", 0),
-                "threshold": THRESHOLDS["dust_storm_dust"],
-                "starts_at": starts_at,
-                "expires_at": expires_at,
-                "is_active": True,
-            })
-
-        # 🌧️ Heavy Rain Alert
-        precip = record.get("precipitation_sum", 0)
-        if precip and precip > THRESHOLDS["heavy_rain_mm"]:
-            severity = "extreme" if precip > THRESHOLDS["very_heavy_rain_mm"] else "high"
-            alerts.append({
-                "city_id": city_id,
-                "alert_type": "heavy_rain",
-                "severity": severity,
-                "title": f"🌧️ {'Very ' if severity == 'extreme' else ''}Heavy Rain — {city_name}",
-                "description": f"Expected rainfall: {precip:.1f}mm on {date_str}. "
-                              f"Waterlogging and flash floods possible.",
-                "value": precip,
-                "threshold": THRESHOLDS["heavy_rain_mm"],
-                "starts_at": starts_at,
-                "expires_at": expires_at,
-                "is_active": True,
-            })
-
-        # 💨 Poor AQI Alert
-        aqi = record.get("aqi_max")
-        if aqi:
-            if aqi > THRESHOLDS["hazardous_aqi"]:
-                alerts.append({
-                    "city_id": city_id,
-                    "alert_type": "hazardous_aqi",
-                    "severity": "extreme",
-                    "title": f"☠️ Hazardous Air Quality — {city_name}",
-                    "description": f"US AQI: {aqi:.0f}. Health emergency! Avoid all outdoor activity. "
-                                  f"Wear N95 masks if going outside.",
-                    "value": aqi,
-                    "threshold": THRESHOLDS["hazardous_aqi"],
-                    "starts_at": starts_at,
-                    "expires_at": expires_at,
-                    "is_active": True,
-                })
-            elif aqi > THRESHOLDS["very_poor_aqi"]:
-                alerts.append({
-                    "city_id": city_id,
-                    "alert_type": "very_poor_aqi",
-                    "severity": "high",
-                    "title": f"😷 Very Poor Air Quality — {city_name}",
-                    "description": f"US AQI: {aqi:.0f}. Unhealthy for everyone. "
-                                  f"Reduce outdoor activities.",
-                    "value": aqi,
-                    "threshold": THRESHOLDS["very_poor_aqi"],
-                    "starts_at": starts_at,
-                    "expires_at": expires_at,
-                    "is_active": True,
-                })
-            elif aqi > THRESHOLDS["poor_aqi"]:
-                alerts.append({
-                    "city_id": city_id,
-                    "alert_type": "poor_aqi",
-                    "severity": "moderate",
-                    "title": f"⚠️ Moderate Air Quality Concern — {city_name}",
-                    "description": f"US AQI: {aqi:.0f}. Sensitive groups should reduce outdoor exertion.",
-                    "value": aqi,
-                    "threshold": THRESHOLDS["poor_aqi"],
-                    "starts_at": starts_at,
-                    "expires_at": expires_at,
-                    "is_active": True,
-                })
-
-        # ☀️ High UV Alert
-        uv = record.get("uv_index_max")
-        if uv and uv > THRESHOLDS["high_uv"]:
-            alerts.append({
-                "city_id": city_id,
-                "alert_type": "high_uv",
-                "severity": "moderate",
-                "title": f"☀️ Very High UV Index — {city_name}",
-                "description": f"UV Index: {uv:.1f}. Apply SPF 30+ sunscreen, wear protective clothing.",
-                "value": uv,
-                "threshold": THRESHOLDS["high_uv"],
-                "starts_at": starts_at,
-                "expires_at": expires_at,
-                "is_active": True,
-            })
-
-    return alerts
+        return pl.DataFrame()
+
+    daily_df = _columns_frame(daily, "date", DAILY_WEATHER_COLUMNS)
+
+    # Daily AQI stats and derived weather/AQI indices, joined onto the forecast days
+    daily_df = _join_daily_stats(daily_df, aqi_records, DAILY_AQI_STATS + DAILY_AQI_DERIVED, HOURLY_AQI_COLUMNS)
+    daily_df = _join_daily_stats(daily_df, hourly_records, DAILY_WEATHER_DERIVED, HOURLY_WEATHER_COLUMNS)
+
+    # Rajasthan-specific flags
+    return daily_df.select(
+        pl.lit(city_id).alias("city_id"),
+        "date",
+        "temp_max",
+        "temp_min",
+        "temp_mean",
+        "apparent_temp_max",
+        "apparent_temp_min",
+        "precipitation_sum",
+        "precipitation_hours",
+        "rain_sum",
+        "precipitation_probability_max",
+        "wind_speed_max",
+        "wind_gusts_max",
+        "wind_direction_dominant",
+        "weather_code",
+        "sunrise",
+        "sunset",
+        "uv_index_max",
+        "aqi_mean",
+        "aqi_max",
+        "pm2_5_mean",
+        "pm10_mean",
+        "dust_mean",
+        "heat_index_max",
+        "wbgt_max",
+        "hours_poor_aqi",
+        "hours_very_poor_aqi",
+        "hours_hazardous_aqi",
+        "dust_exposure_hours",
+        (pl.col("temp_max") > THRESHOLDS["heatwave_temp"]).fill_null(False).alias("is_heatwave"),
+        (
+            (pl.col("dust_mean") > THRESHOLDS["dust_storm_dust"])
+            & (pl.col("wind_speed_max") > THRESHOLDS["dust_storm_wind"])
+        ).fill_null(False).alias("is_dust_storm_risk"),
+        (pl.col("precipitation_sum") > THRESHOLDS["heavy_rain_mm"]).fill_null(False).alias("is_heavy_rain"),
+    )
 
 
 # ============================================
-# Supabase Upsert Helpers
+# City ID Resolution
 # ============================================
-def upsert_weather_data(records: list[dict]) -> int:
-    """Upsert hourly weather records into Supabase."""
-    if not records:
-        return 0
+def get_city_id_map() -> dict[str, str]:
+    """Get mapping of city name → UUID from Supabase."""
     try:
-        result = supabase.table("weather_data").upsert(
-            records,
-            on_conflict="city_id,recorded_at,is_forecast"
-        ).execute()
-        return len(result.data) if result.data else 0
+        result = supabase.table("cities").select("id, name").eq("is_active", True).execute()
+        return {row["name"]: row["id"] for row in result.data}
     except Exception as e:
-        logger.error(f"❌ Failed to upsert weather_data: {e}")
-        return 0
-
+        logger.error(f"❌ Failed to fetch cities: {e}")
+        return {}
 
-def upsert_air_quality(records: list[dict]) -> int:
-    """Upsert air quality records into Supabase."""
-    if not records:
-        return 0
-    try:
-        result = supabase.table("air_quality_data").upsert(
-            records,
-            on_conflict="city_id,recorded_at"
-        ).execute()
-        return len(result.data) if result.data else 0
-    except Exception as e:
-        logger.error(f"❌ Failed to upsert air_quality_data: {e}")
-        return 0
 
+def get_custom_cities(city_map: dict[str, str]) -> list[tuple[str, CityConfig]]:
+    """
+    Load coordinates for user-added cities (not in DEFAULT_CITIES) in one query.
 
-def upsert_daily_aggregates(records: list[dict]) -> int:
-    """Upsert daily aggregate records into Supabase."""
-    if not records:
-        return 0
+    Selects every active city and filters locally, so hundreds of custom
+    cities don't put their ids in the request URL.
+    """
+    default_names = {c.name for c in DEFAULT_CITIES}
+    custom_ids = {city_id for name, city_id in city_map.items() if name not in default_names}
+    if not custom_ids:
+        return []
     try:
-        result = supabase.table("daily_aggregates").upsert(
-            records,
-            on_conflict="city_id,date"
-        ).execute()
-        return len(result.data) if result.data else 0
+        result = supabase.table("cities").select(
+            "id, name, latitude, longitude, elevation_m"
+        ).eq("is_active", True).execute()
     except Exception as e:
-        logger.error(f"❌ Failed to upsert daily_aggregates: {e}")
-        return 0
+        logger.error(f"❌ Failed to fetch custom cities: {e}")
+        return []
+    return [
+        (row["id"], CityConfig(
+            name=row["name"],
+            latitude=row["latitude"],
+            longitude=row["longitude"],
+            elevation_m=row.get("elevation_m", 0) or 0,
+        ))
+        for row in result.data
+        if row["id"] in custom_ids
+    ]
+
+
+def resolve_cities(city_map: dict[str, str]) -> list[tuple[str, CityConfig]]:
+    """All (city_id, config) pairs to process: default cities first, then custom ones."""
+    cities = []
+    for city_cfg in DEFAULT_CITIES:
+        if city_cfg.name not in city_map:
+            logger.warning(f"⚠️ City {city_cfg.name} not in database, skipping...")
+            continue
+        cities.append((city_map[city_cfg.name], city_cfg))
+    return cities + get_custom_cities(city_map)
 
 
-def insert_alerts(alerts: list[dict]) -> int:
-    """Insert new alerts (deactivate old ones first)."""
-    if not alerts:
-        return 0
+# ============================================
+# Per-City Processing
+# ============================================
+def process_and_store_city(
+    city_id: str,
+    city_cfg: CityConfig,
+    weather_raw: dict | None,
+    aqi_raw: dict | None,
+    writer: BulkWriter,
+    stages: StageMetrics,
+    diff: SnapshotDiff | None = None,
+    alert_inputs: list[pl.DataFrame] | None = None,
+    archive: ParquetArchive | None = None,
+    anomalies: AnomalyDetector | None = None,
+    snapshots: CitySnapshots | None = None,
+) -> dict[str, int]:
+    """
+    Process one city's payloads and queue them on the bulk writer. Runs in a worker thread.
+
+    The full daily frame (plus city name and minimum visibility) is appended to
+    `alert_inputs` so alert rules can run once over all cities at the end of
+    the run; hourly weather and AQI go to the anomaly detector and the city's
+    current conditions to the city_snapshot collector likewise. With a
+    SnapshotDiff, rows identical to the last successful run are dropped before
+    queueing; the rows that are queued also go to the archive.
+    """
+    counts = {"weather_15min": 0, "weather": 0, "aqi": 0, "daily": 0}
     try:
-        # Deactivate expired alerts
-        supabase.table("alerts").update(
-            {"is_active": False}
-        ).lt("expires_at", datetime.now(timezone.utc).isoformat()).execute()
-
-        # Insert new alerts
-        result = supabase.table("alerts").insert(alerts).execute()
-        return len(result.data) if result.data else 0
+        with stages.time("process", city=city_cfg.name):
+            hourly_records = process_hourly_weather(weather_raw, city_id) if weather_raw else pl.DataFrame()
+            minutely_records = (
+                process_minutely_15(weather_raw, city_id) if weather_raw and MINUTELY_15_ENABLED else pl.DataFrame()
+            )
+            # Hourly tier takes the downsampled 15-minute values where they cover the hour
+            hourly_records = merge_downsampled(hourly_records, downsample_to_hourly(minutely_records))
+            aqi_records = process_air_quality(aqi_raw, city_id) if aqi_raw else pl.DataFrame()
+            daily_records = (
+                process_daily_aggregates(weather_raw, aqi_records, city_id, hourly_records)
+                if weather_raw else pl.DataFrame()
+            )
+        for table, records in (
+            ("weather_data_15min", minutely_records), ("weather_data", hourly_records),
+            ("air_quality_data", aqi_records), ("daily_aggregates", daily_records),
+        ):
+            stages.inc("rows_processed", len(records), city=city_cfg.name, table=table)
+
+        if alert_inputs is not None and not daily_records.is_empty():
+            alert_inputs.append(
+                daily_records.join(daily_visibility(hourly_records), on=["city_id", "date"], how="left")
+                .with_columns(pl.lit(city_cfg.name).alias("city_name"))
+            )
+        if anomalies is not None:
+            anomalies.add(city_cfg.name, hourly_records, aqi_records)
+        if snapshots is not None:
+            snapshots.add(city_id, city_cfg, hourly_records, aqi_records, daily_records)
+
+        if diff is not None:
+            with stages.time("diff"):
+                minutely_records = diff.filter("weather_data_15min", city_id, minutely_records)
+                hourly_records = diff.filter("weather_data", city_id, hourly_records)
+                aqi_records = diff.filter("air_quality_data", city_id, aqi_records)
+                daily_records = diff.filter("daily_aggregates", city_id, daily_records)
+
+        counts["weather_15min"] = writer.add("weather_data_15min", minutely_records)
+        counts["weather"] = writer.add("weather_data", hourly_records)
+        counts["aqi"] = writer.add("air_quality_data", aqi_records)
+        counts["daily"] = writer.add("daily_aggregates", daily_records)
+
+        if archive is not None:
+            archive.add("weather_data_15min", minutely_records, city_cfg.name)
+            archive.add("weather_data", hourly_records, city_cfg.name)
+            archive.add("air_quality_data", aqi_records, city_cfg.name)
+            archive.add("daily_aggregates", daily_records, city_cfg.name)
     except Exception as e:
-        logger.error(f"❌ Failed to insert alerts: {e}")
-        return 0
+        logger.error(f"❌ Failed to process {city_cfg.name}: {e}")
+
+    minutely = f"⏱️ {counts['weather_15min']} 15-min | " if MINUTELY_15_ENABLED else ""
+    logger.info(
+        f"🏙️ {city_cfg.name}: {minutely}📊 {counts['weather']} hourly | 💨 {counts['aqi']} AQI | "
+        f"📅 {counts['daily']} daily queued"
+    )
+    return counts
 
 
 # ============================================
-# City ID Resolution
+# Alert Evaluation
 # ============================================
-def get_city_id_map() -> dict[str, str]:
-    """Get mapping of city name → UUID from Supabase."""
-    try:
-        result = supabase.table("cities").select("id, name").eq("is_active", True).execute()
-        return {row["name"]: row["id"] for row in result.data}
-    except Exception as e:
-        logger.error(f"❌ Failed to fetch cities: {e}")
-        return {}
+def evaluate_alerts(
+    alert_inputs: list[pl.DataFrame],
+    writer: BulkWriter,
+    stages: StageMetrics,
+    anomalies: AnomalyDetector | None = None,
+    snapshots: CitySnapshots | None = None,
+) -> int:
+    """
+    Run the alert rule table once over every city's daily frame and queue new alerts.
+
+    With an AnomalyDetector, newly observed hours are scored against their
+    baselines as well; the caller persists the updated baselines once the
+    queued alerts have been written (AnomalyDetector.commit). Alerts already
+    active for the same city, type, day and severity are not inserted again;
+    active alerts the latest forecast no longer supports are retired. The
+    resulting active alerts per city are attached to the city snapshots.
+    """
+    if not alert_inputs:
+        return 0
+    with stages.time("alerts"):
+        daily = pl.concat(alert_inputs, how="diagonal_relaxed")
+        new_alerts = evaluate_rules(daily)
+        if anomalies is not None:
+            new_alerts = pl.concat([new_alerts, anomalies.evaluate()], how="vertical_relaxed")
+        new_alerts = drop_expired(new_alerts)
+        active = load_active_alerts(supabase, daily["city_id"].unique().to_list())
+        to_insert, stale_ids = reconcile_alerts(new_alerts, active, evaluated_days(daily))
+        retire_alerts(supabase, stale_ids)
+        if snapshots is not None:
+            snapshots.apply_alerts(pl.concat([
+                active.filter(~pl.col("id").is_in(stale_ids)).select("city_id", "severity"),
+                to_insert.select("city_id", "severity"),
+            ]))
+    logger.info(
+        f"🚨 {len(new_alerts)} alerts triggered: {len(to_insert)} new, "
+        f"{len(new_alerts) - len(to_insert)} already active, {len(stale_ids)} retired"
+    )
+    return writer.add("alerts", to_insert)
 
 
 # ============================================
 # Main Pipeline
 # ============================================
-async def run_pipeline():
-    """Main data pipeline: Fetch → Process → Alert → Store."""
+async def run_pipeline(
+    concurrency: int = PIPELINE_CONCURRENCY,
+    store_workers: int = STORE_WORKERS,
+    batch_size: int = FETCH_BATCH_SIZE,
+    cache_dir: str | None = CACHE_DIR or None,
+    cities: list[tuple[str, CityConfig]] | None = None,
+    client: httpx.AsyncClient | None = None,
+    archive_dir: str | None = ARCHIVE_DIR or None,
+    metrics_file: str | None = METRICS_FILE or None,
+    stages: StageMetrics | None = None,
+) -> dict | None:
+    """
+    Main data pipeline: Fetch → Process → Alert → Store.
+
+    Cities are grouped into multi-location requests of `batch_size`. Batches are
+    fetched concurrently (bounded by `concurrency`) and feed an async queue; `store_workers` drain it, processing in worker threads and
+    queueing rows on a write-behind BulkWriter that flushes byte-bounded chunks
+    across cities, so storage overlaps with the remaining fetches.
+
+    With `cache_dir`, fresh Open-Meteo responses are reused from disk, only
+    rows that changed since the last successful run are upserted, and the
+    anomaly baselines kept there score each newly observed hour. With
+    `archive_dir`, the same rows are appended to the local Parquet archive.
+
+    Stage latencies and per-city / per-table metrics go to `stages` (the
+    daemon passes its own to serve on /metrics); with `metrics_file` they are
+    also written there as a Prometheus textfile.
+
+    The daemon passes its own `cities` subset and a long-lived `client`; a
+    one-shot run resolves cities from Supabase and opens its own client.
+    Returns rows written/failed per table and stage timings, or None if there
+    was nothing to do.
+    """
+    run_start = time.perf_counter()
     logger.info("=" * 60)
     logger.info("🚀 Starting Rajasthan Weather & AQI Pipeline")
     logger.info(f"⏰ Run time: {datetime.now(timezone.utc).isoformat()}")
     logger.info("=" * 60)
 
     # 1. Get city IDs from database
-    city_map = get_city_id_map()
-    if not city_map:
-        logger.error("❌ No cities found in database. Run schema.sql first!")
-        return
-
-    logger.info(f"📍 Processing {len(city_map)} cities: {', '.join(city_map.keys())}")
-
-    # Stats tracking
-    total_weather = 0
-    total_aqi = 0
-    total_daily = 0
-    total_alerts = 0
-
-    # 2. Fetch data for all cities concurrently
-    async with httpx.AsyncClient() as client:
-        for city_cfg in DEFAULT_CITIES:
-            if city_cfg.name not in city_map:
-                logger.warning(f"⚠️ City {city_cfg.name} not in database, skipping...")
-                continue
-
-            city_id = city_map[city_cfg.name]
-            logger.info(f"\n{'─' * 40}")
-            logger.info(f"🏙️ Processing: {city_cfg.name}")
-
-            # Fetch weather + AQI concurrently
-            weather_raw, aqi_raw = await asyncio.gather(
-                fetch_weather_data(client, city_cfg),
-                fetch_air_quality_data(client, city_cfg),
+    if cities is None:
+        city_map = get_city_id_map()
+        if not city_map:
+            logger.error("❌ No cities found in database. Run schema.sql first!")
+            return None
+        cities = resolve_cities(city_map)
+    if not cities:
+        return None
+
+    logger.info(f"📍 Processing {len(cities)} cities: {', '.join(cfg.name for _, cfg in cities)}")
+    batches = [cities[i:i + batch_size] for i in range(0, len(cities), batch_size)]
+    logger.info(
+        f"⚙️ {len(batches)} batches of ≤{batch_size} cities, "
+        f"{concurrency} concurrent fetches, {store_workers} store workers"
+    )
+
+    stages = stages if stages is not None else StageMetrics()
+    writer = BulkWriter(supabase, stages=stages)
+    await asyncio.to_thread(writer.deactivate_expired_alerts)
+    await asyncio.to_thread(prune_expired_tiers, supabase, None, cache_dir, hourly_pruning_allowed(archive_dir))
+    cache = ResponseCache(cache_dir, RESPONSE_CACHE_TTL) if cache_dir else None
+    diff = SnapshotDiff(cache_dir) if cache_dir else None
+    archive = ParquetArchive(archive_dir) if archive_dir else None
+    anomalies = AnomalyDetector(cache_dir) if cache_dir else None
+    snapshots = CitySnapshots()
+    alert_inputs: list[pl.DataFrame] = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency * 2))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # 2. Fetch weather + AQI per batch of cities, bounded by the semaphore
+    async def fetch_batch(client: httpx.AsyncClient, batch: list[tuple[str, CityConfig]]):
+        configs = [cfg for _, cfg in batch]
+        async with semaphore:
+            with stages.time("fetch"):
+                weather_payloads, aqi_payloads = await asyncio.gather(
+                    fetch_weather_batch(client, configs, cache, stages),
+                    fetch_air_quality_batch(client, configs, cache, stages),
+                )
+        for (city_id, city_cfg), weather_raw, aqi_raw in zip(batch, weather_payloads, aqi_payloads):
+            await queue.put((city_id, city_cfg, weather_raw, aqi_raw))
+
+    # 3-4. Process and store as soon as a city's payloads arrive
+    async def store_worker():
+        while (item := await queue.get()) is not None:
+            await asyncio.to_thread(
+                process_and_store_city, *item, writer, stages, diff, alert_inputs, archive, anomalies, snapshots
             )
 
-            # 3. Process weather data
-            if weather_raw:
-                hourly_records = process_hourly_weather(weather_raw, city_id)
-                count = upsert_weather_data(hourly_records)
-                total_weather += count
-                logger.info(f"  📊 Upserted {count} hourly weather records")
-
-            # 4. Process air quality data
-            aqi_records = []
-            if aqi_raw:
-                aqi_records = process_air_quality(aqi_raw, city_id)
-                count = upsert_air_quality(aqi_records)
-                total_aqi += count
-                logger.info(f"  💨 Upserted {count} AQI records")
-
-            # 5. Process daily aggregates
-            if weather_raw:
-                daily_records = process_daily_aggregates(weather_raw, aqi_records, city_id)
-                count = upsert_daily_aggregates(daily_records)
-                total_daily += count
-                logger.info(f"  📅 Upserted {count} daily aggregates")
-
-                # 6. Generate alerts
-                alerts = generate_alerts(daily_records, city_id, city_cfg.name)
-                if alerts:
-                    count = insert_alerts(alerts)
-                    total_alerts += count
-                    logger.info(f"  🚨 Created {count} alerts")
-
-    # Also handle custom cities from the database
-    custom_cities = [name for name in city_map if name not in [c.name for c in DEFAULT_CITIES]]
-    if custom_cities:
-        logger.info(f"\n📍 Processing {len(custom_cities)} custom cities...")
-        async with httpx.AsyncClient() as client:
-            for city_name in custom_cities:
-                city_id = city_map[city_name]
-                # Fetch city coordinates from DB
-                city_data = supabase.table("cities").select("*").eq("id", city_id).single().execute()
-                if city_data.data:
-                    custom_cfg = CityConfig(
-                        name=city_data.data["name"],
-                        latitude=city_data.data["latitude"],
-                        longitude=city_data.data["longitude"],
-                        elevation_m=city_data.data.get("elevation_m", 0) or 0,
-                    )
-                    weather_raw, aqi_raw = await asyncio.gather(
-                        fetch_weather_data(client, custom_cfg),
-                        fetch_air_quality_data(client, custom_cfg),
-                    )
-                    if weather_raw:
-                        hourly_records = process_hourly_weather(weather_raw, city_id)
-                        upsert_weather_data(hourly_records)
-                    if aqi_raw:
-                        aqi_records = process_air_quality(aqi_raw, city_id)
-                        upsert_air_quality(aqi_records)
-                    if weather_raw:
-                        daily_records = process_daily_aggregates(weather_raw, aqi_records, city_id)
-                        upsert_daily_aggregates(daily_records)
-                        alerts = generate_alerts(daily_records, city_id, custom_cfg.name)
-                        if alerts:
-                            insert_alerts(alerts)
+    workers = [asyncio.create_task(store_worker()) for _ in range(store_workers)]
+    async with contextlib.nullcontext(client) if client else httpx.AsyncClient() as http:
+        await asyncio.gather(*(fetch_batch(http, batch) for batch in batches))
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+
+    # 5-6. Evaluate alert rules over all cities × days in one pass, then flush
+    #      together with the refreshed city_snapshot rows
+    alerts_queued = False
+    try:
+        await asyncio.to_thread(evaluate_alerts, alert_inputs, writer, stages, anomalies, snapshots)
+        alerts_queued = True
+    except Exception as e:
+        logger.error(f"❌ Alert evaluation failed: {e}")
+    writer.add("city_snapshot", snapshots.rows())
+    written = await asyncio.to_thread(writer.flush)
+    if diff is not None:
+        diff.commit(writer.failed)
+    # Advance the anomaly watermarks only once their alerts are stored, so a
+    # failed write re-scores the same hours next run instead of losing them
+    if anomalies is not None and alerts_queued:
+        anomalies.commit(writer.failed)
+    archived: dict[str, int] = {}
+    if archive is not None:
+        try:
+            with stages.time("archive"):
+                archived = await asyncio.to_thread(archive.flush)
+        except Exception as e:
+            logger.error(f"❌ Parquet archive write failed: {e}")
+
+    # 7. Fold newly finalized days into historical_stats / yearly_stats
+    rolled_up = 0
+    try:
+        with stages.time("rollup"):
+            rolled_up = await asyncio.to_thread(
+                RollupEngine(supabase, writer).run, {city_id: cfg.name for city_id, cfg in cities}
+            )
+    except Exception as e:
+        logger.error(f"❌ Historical rollup failed: {e}")
+
+    duration = time.perf_counter() - run_start
+    for table in writer.written:
+        stages.set("rows_written", writer.written[table], table=table)
+        stages.set("upsert_failed_rows", writer.failed[table], table=table)
+    stages.set("run_duration_seconds", duration)
+    stages.set("last_run_timestamp_seconds", time.time())
+    if metrics_file:
+        try:
+            stages.write_textfile(metrics_file)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write metrics to {metrics_file}: {e}")
 
     # Summary
     logger.info(f"\n{'=' * 60}")
-    logger.info(f"✅ Pipeline Complete!")
-    logger.info(f"   📊 Weather records:    {total_weather}")
-    logger.info(f"   💨 AQI records:        {total_aqi}")
-    logger.info(f"   📅 Daily aggregates:   {total_daily}")
-    logger.info(f"   🚨 Alerts generated:   {total_alerts}")
+    logger.info(f"✅ Pipeline Complete in {duration:.1f}s")
+    if MINUTELY_15_ENABLED:
+        logger.info(f"   ⏱️ 15-min records:     {written['weather_data_15min']}")
+    logger.info(f"   📊 Weather records:    {written['weather_data']}")
+    logger.info(f"   💨 AQI records:        {written['air_quality_data']}")
+    logger.info(f"   📅 Daily aggregates:   {written['daily_aggregates']}")
+    logger.info(f"   🚨 New alerts:         {written['alerts']}")
+    logger.info(f"   🏙️ City snapshots:     {written['city_snapshot']}")
+    logger.info(f"   📈 Days rolled up:     {rolled_up}")
+    if archived:
+        logger.info(f"   🗄️ Archived rows:      {sum(archived.values())}")
+    if any(writer.failed.values()):
+        failed = ", ".join(f"{table}={n}" for table, n in writer.failed.items() if n)
+        logger.warning(f"   ⚠️ Rows not written:   {failed}")
+    if cache is not None:
+        logger.info(f"   💾 Response cache:     {cache.hits} hits, {cache.misses} misses")
+    if diff is not None and diff.unchanged:
+        skipped = ", ".join(f"{table}={n}" for table, n in diff.unchanged.items())
+        logger.info(f"   ♻️ Unchanged, skipped: {skipped}")
+    logger.info("   Stage latencies:")
+    stages.log_report(logger)
     logger.info(f"{'=' * 60}")
+    return {"written": written, "failed": dict(writer.failed), "stages": stages.summary()}
 
 
 # ============================================
 # Entry Point
 # ============================================
+# One-shot run (cron). The long-running scheduler is `python daemon.py`.
 if __name__ == "__main__":
+    if supabase is None:
+        logger.error("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set!")
+        sys.exit(1)
     asyncio.run(run_pipeline())
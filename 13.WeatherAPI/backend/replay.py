@@ -0,0 +1,410 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Replay Harness — offline end-to-end benchmark of run_pipeline.
+
+Serves recorded (or synthetic) Open-Meteo JSON from a local stand-in server
+and swaps Supabase for an in-memory sink, so Fetch → Process → Alert → Store
+runs without network. Each city count is measured in a fresh subprocess so
+peak RSS is per run (it includes the sink's copy of every written row).
+
+Usage:
+    python replay.py record                              # save live responses for DEFAULT_CITIES
+    python replay.py bench --cities 6 100 1000 5000      # table of stage timings + peak RSS
+    python replay.py run --cities 500                    # single run, JSON report
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import AIR_QUALITY_API_URL, DEFAULT_CITIES, FORECAST_DAYS, TIMEZONE, WEATHER_API_URL
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+API_PATHS = {"forecast": "/v1/forecast", "air-quality": "/v1/air-quality"}
+SYNTHETIC_VARIANTS = 16      # distinct synthetic payloads per API, reused round-robin
+DEFAULT_CITY_COUNTS = [6, 100, 1000, 5000]
+MAX_IN_FILTER_CHARS = 8000   # in.(...) values travel in the URL; proxies commonly cap it near 8 KB
+
+
+# ============================================
+# Fixtures
+# ============================================
+def record_fixtures(directory: Path = FIXTURE_DIR) -> None:
+    """Fetch live responses for the default cities and save one JSON file per city and API."""
+    import httpx
+
+    from preprocess import AQI_PARAMS, WEATHER_PARAMS
+
+    for api, url, params in (
+        ("forecast", WEATHER_API_URL, WEATHER_PARAMS),
+        ("air-quality", AIR_QUALITY_API_URL, AQI_PARAMS),
+    ):
+        response = httpx.get(url, timeout=60, params={
+            **params,
+            "latitude": ",".join(str(c.latitude) for c in DEFAULT_CITIES),
+            "longitude": ",".join(str(c.longitude) for c in DEFAULT_CITIES),
+        })
+        response.raise_for_status()
+        (directory / api).mkdir(parents=True, exist_ok=True)
+        for city, payload in zip(DEFAULT_CITIES, response.json()):
+            path = directory / api / f"{city.name.lower()}.json"
+            path.write_text(json.dumps(payload), encoding="utf-8")
+            print(f"💾 {path.relative_to(directory.parent)}")
+
+
+def load_fixtures(directory: Path) -> dict[str, list[bytes]]:
+    """Pre-serialized payloads per API: recorded files if present, else synthetic ones."""
+    from benchmark import make_aqi_payload, make_weather_payload
+    from preprocess import MINUTELY_15_ENABLED
+
+    # Synthetic windows start yesterday so some days are final (exercises the rollup)
+    start = datetime.now(ZoneInfo(TIMEZONE)).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    start -= timedelta(days=1)
+    builders = {
+        "forecast": lambda days, seed, start: make_weather_payload(days, seed, start, MINUTELY_15_ENABLED),
+        "air-quality": make_aqi_payload,
+    }
+
+    fixtures = {}
+    for api, build in builders.items():
+        files = sorted((directory / api).glob("*.json"))
+        if files:
+            fixtures[api] = [f.read_bytes() for f in files]
+        else:
+            fixtures[api] = [
+                json.dumps(build(FORECAST_DAYS + 1, seed, start)).encode() for seed in range(SYNTHETIC_VARIANTS)
+            ]
+    return fixtures
+
+
+# ============================================
+# Stand-in Open-Meteo Server
+# ============================================
+def serve(directory: Path, port: int) -> None:
+    """Answer multi-location Open-Meteo requests from fixtures until killed."""
+    fixtures = load_fixtures(directory)
+    routes = {path: fixtures[api] for api, path in API_PATHS.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            payloads = routes.get(url.path)
+            if payloads is None:
+                self.send_error(404)
+                return
+            query = parse_qs(url.query)
+            locations = list(zip(query["latitude"][0].split(","), query["longitude"][0].split(",")))
+            # Same coordinates always get the same fixture
+            picked = [payloads[zlib.crc32(f"{lat},{lon}".encode()) % len(payloads)] for lat, lon in locations]
+            body = picked[0] if len(picked) == 1 else b"[" + b",".join(picked) + b"]"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"READY {server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+def start_server(directory: Path) -> tuple[subprocess.Popen, str]:
+    """Run the stand-in server in its own process so it doesn't share our GIL."""
+    proc = subprocess.Popen(
+        [sys.executable, __file__, "serve", "--fixtures", str(directory)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = proc.stdout.readline().split()
+    if len(line) != 2 or line[0] != "READY":
+        proc.kill()
+        raise RuntimeError("replay server failed to start")
+    return proc, f"http://127.0.0.1:{line[1]}"
+
+
+# ============================================
+# In-Memory Supabase Sink
+# ============================================
+class MemorySink:
+    """Stand-in for the Supabase client: PostgREST-style query builder over in-memory tables."""
+
+    def __init__(self):
+        self.tables: dict[str, dict] = defaultdict(dict)
+
+    def table(self, name: str) -> "_Query":
+        return _Query(self, name)
+
+    def seed_cities(self, count: int) -> None:
+        """DEFAULT_CITIES first, then synthetic custom cities spread over Rajasthan."""
+        for i in range(count):
+            if i < len(DEFAULT_CITIES):
+                city = DEFAULT_CITIES[i]
+                row = {"name": city.name, "latitude": city.latitude, "longitude": city.longitude,
+                       "elevation_m": city.elevation_m}
+            else:
+                row = {"name": f"Replay City {i:04d}", "latitude": round(23.0 + (i * 0.37) % 7.0, 4),
+                       "longitude": round(69.5 + (i * 0.53) % 8.5, 4), "elevation_m": 250}
+            row.update(id=str(uuid.uuid4()), is_active=True)
+            self.tables["cities"][row["id"]] = row
+
+    def row_count(self) -> dict[str, int]:
+        return {name: len(rows) for name, rows in self.tables.items()}
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    OPERATORS = {
+        "eq": lambda a, b: a == b,
+        "gt": lambda a, b: a > b,
+        "gte": lambda a, b: a >= b,
+        "lt": lambda a, b: a < b,
+        "lte": lambda a, b: a <= b,
+        "in_": lambda a, b: a in b,
+    }
+
+    def __init__(self, sink: MemorySink, table: str):
+        self.sink = sink
+        self.name = table
+        self.action = "select"
+        self.columns: list[str] | None = None
+        self.filters: list[tuple[str, str, object]] = []
+        self.payload = None
+        self.conflict: list[str] | None = None
+        self.order_by: tuple[str, bool] | None = None
+        self.window: tuple[int, int] | None = None
+
+    def __getattr__(self, op):
+        if op not in self.OPERATORS:
+            raise AttributeError(op)
+
+        def add_filter(column, value):
+            if op == "in_" and sum(len(str(v)) + 1 for v in value) > MAX_IN_FILTER_CHARS:
+                raise ValueError(f"in.({column}) filter with {len(value)} values would exceed the request URL limit")
+            self.filters.append((op, column, set(value) if op == "in_" else value))
+            return self
+        return add_filter
+
+    def select(self, columns: str = "*"):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def is_(self, column: str, value):
+        self.filters.append(("eq", column, None if value in (None, "null") else value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def range(self, start: int, end: int):
+        self.window = (start, end + 1)
+        return self
+
+    def limit(self, count: int):
+        self.window = (0, count)
+        return self
+
+    def upsert(self, rows: list[dict], on_conflict: str = "id"):
+        self.action, self.payload, self.conflict = "upsert", rows, on_conflict.split(",")
+        return self
+
+    def insert(self, rows: list[dict]):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def update(self, values: dict):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self, **_options):
+        self.action = "delete"
+        return self
+
+    def execute(self) -> _Result:
+        rows = self.sink.tables[self.name]
+        if self.action in ("upsert", "insert"):
+            # JSON round trip: the serialization the real client pays per request
+            records = json.loads(json.dumps(self.payload))
+            for record in records:
+                if self.action == "insert":
+                    record.setdefault("id", str(uuid.uuid4()))
+                    key = record["id"]
+                else:
+                    key = tuple(record.get(c) for c in self.conflict)
+                rows[key] = {**rows.get(key, {}), **record}
+            return _Result(records)
+
+        if self.action == "delete":
+            doomed = [key for key, row in rows.items() if self._matches(row)]
+            for key in doomed:
+                del rows[key]
+            return _Result([])
+
+        matched = [row for row in rows.values() if self._matches(row)]
+        if self.action == "update":
+            for row in matched:
+                row.update(self.payload)
+            return _Result(matched)
+
+        if self.order_by:
+            column, desc = self.order_by
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        if self.window:
+            matched = matched[self.window[0]:self.window[1]]
+        if self.columns:
+            matched = [{c: row.get(c) for c in self.columns} for row in matched]
+        return _Result(matched)
+
+    def _matches(self, row: dict) -> bool:
+        for op, column, value in self.filters:
+            actual = row.get(column)
+            if actual is None or value is None:
+                if not (op == "eq" and actual is value):
+                    return False
+            elif not self.OPERATORS[op](actual, value):
+                return False
+        return True
+
+
+# ============================================
+# Runs
+# ============================================
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_replay(cities: int, base_url: str, runs: int = 1, cache: bool = False) -> dict:
+    """Run the real pipeline `runs` times against the stand-in server and an in-memory sink."""
+    import preprocess
+
+    sink = MemorySink()
+    sink.seed_cities(cities)
+    preprocess.supabase = sink
+    preprocess.WEATHER_API_URL = base_url + API_PATHS["forecast"]
+    preprocess.AIR_QUALITY_API_URL = base_url + API_PATHS["air-quality"]
+
+    report = {"cities": cities, "runs": []}
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as archive_dir:
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = asyncio.run(preprocess.run_pipeline(
+                cache_dir=cache_dir if cache else None, archive_dir=archive_dir
+            )) or {}
+            report["runs"].append({
+                "wall_seconds": round(time.perf_counter() - start, 3),
+                "rows_written": sum(result.get("written", {}).values()),
+                "rows_failed": sum(result.get("failed", {}).values()),
+                "stages": result.get("stages", {}),
+            })
+    report["stored_rows"] = sink.row_count()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def bench(city_counts: list[int], directory: Path, runs: int, cache: bool) -> None:
+    server, base_url = start_server(directory)
+    print(f"🛰️ Replay server at {base_url} ({'recorded' if any(directory.glob('*/*.json')) else 'synthetic'} fixtures)")
+    header = (f"{'cities':>7}{'run':>5}{'rows':>11}{'wall s':>9}{'fetch Σs':>10}{'process Σs':>12}"
+              f"{'alerts s':>10}{'store Σs':>10}{'rollup s':>10}{'rows/s':>10}{'peak MB':>9}")
+    print(header)
+    print("-" * len(header))
+    try:
+        for count in city_counts:
+            child = subprocess.run(
+                [sys.executable, __file__, "run", "--cities", str(count), "--base-url", base_url,
+                 "--runs", str(runs), *(["--cache"] if cache else [])],
+                capture_output=True, text=True, env={**os.environ, "LOG_LEVEL": "WARNING"},
+            )
+            if child.returncode != 0:
+                print(f"{count:>7}  failed: {child.stderr.strip().splitlines()[-1:]}")
+                continue
+            report = json.loads(child.stdout.strip().splitlines()[-1])
+            for i, run in enumerate(report["runs"], 1):
+                stage = lambda name: run["stages"].get(name, {}).get("total", 0.0)
+                print(
+                    f"{count:>7}{i:>5}{run['rows_written']:>11,}{run['wall_seconds']:>9.2f}"
+                    f"{stage('fetch'):>10.2f}{stage('process'):>12.2f}{stage('alerts'):>10.2f}"
+                    f"{stage('store'):>10.2f}{stage('rollup'):>10.2f}"
+                    f"{run['rows_written'] / run['wall_seconds']:>10,.0f}{report['peak_rss_mb'] or 0:>9.0f}"
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay + benchmark for the weather pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="save live Open-Meteo responses as fixtures")
+    rec.add_argument("--fixtures", type=Path, default=FIXTURE_DIR)
+
+    srv = sub.add_parser("serve", help="run the stand-in Open-Meteo server")
+    srv.add_argument("--fixtures", type=Path, default=FIXTURE_DIR)
+    srv.add_argument("--port", type=int, default=0)
+
+    run = sub.add_parser("run", help="one replay run; prints a JSON report")
+    run.add_argument("--cities", type=int, default=len(DEFAULT_CITIES))
+    run.add_argument("--fixtures", type=Path, default=FIXTURE_DIR)
+    run.add_argument("--base-url", help="existing replay server (default: start one)")
+    run.add_argument("--runs", type=int, default=1)
+    run.add_argument("--cache", action="store_true", help="enable response cache + snapshot diff across runs")
+
+    bch = sub.add_parser("bench", help="replay runs for several city counts")
+    bch.add_argument("--cities", type=int, nargs="+", default=DEFAULT_CITY_COUNTS)
+    bch.add_argument("--fixtures", type=Path, default=FIXTURE_DIR)
+    bch.add_argument("--runs", type=int, default=1)
+    bch.add_argument("--cache", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_fixtures(args.fixtures)
+    elif args.command == "serve":
+        serve(args.fixtures, args.port)
+    elif args.command == "bench":
+        bench(args.cities, args.fixtures, args.runs, args.cache)
+    else:
+        server = None
+        base_url = args.base_url
+        if base_url is None:
+            server, base_url = start_server(args.fixtures)
+        try:
+            print(json.dumps(run_replay(args.cities, base_url, args.runs, args.cache)))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
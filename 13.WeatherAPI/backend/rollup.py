@@ -0,0 +1,306 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Rollup Engine — incremental monthly/yearly stats into historical_stats / yearly_stats.
+
+Each run folds only the days that became final since the last rollup (dates
+before today, after the stored watermark) into running aggregates. The
+mergeable state (sums, counts, extremes, AQI histogram sketch, monsoon normal
+to date) is kept in the `rollup_state` column of each row, so history is
+never rescanned.
+
+Days stored behind the watermark (a historical backfill) are not folded in;
+`rebuild` recomputes the affected city/years from daily_aggregates instead.
+"""
+
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import polars as pl
+from supabase import Client
+
+from config import MONSOON_NORMAL_RAINFALL, THRESHOLDS, TIMEZONE
+from writer import BulkWriter
+
+logger = logging.getLogger(__name__)
+
+AQI_SKETCH_BUCKET = 5        # US AQI units per histogram bucket
+PAGE_SIZE = 1000             # PostgREST default max rows per response
+CITY_CHUNK = 50              # city ids per in.(...) filter, keeping request URLs short
+
+MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+
+# Per-group partial aggregates over newly finalized daily_aggregates rows
+PARTIAL_AGGS = [
+    pl.len().alias("days"),
+    pl.col("temp_max").count().alias("temp_max_days"),
+    pl.col("temp_max").sum().alias("temp_max_sum"),
+    pl.col("temp_min").count().alias("temp_min_days"),
+    pl.col("temp_min").sum().alias("temp_min_sum"),
+    pl.col("temp_max").max().alias("max_temp"),
+    pl.col("temp_min").min().alias("min_temp"),
+    pl.col("precipitation_sum").fill_null(0).sum().alias("precip_total"),
+    pl.col("precipitation_sum").max().alias("max_precip_day"),
+    (pl.col("precipitation_sum") >= THRESHOLDS["rainy_day_mm"]).sum().alias("rainy_days"),
+    pl.col("is_heatwave").fill_null(False).sum().alias("heatwave_days"),
+    pl.col("is_dust_storm_risk").fill_null(False).sum().alias("dust_storm_days"),
+    pl.col("aqi_mean").count().alias("aqi_days"),
+    pl.col("aqi_mean").sum().alias("aqi_sum"),
+    (pl.col("aqi_mean") // AQI_SKETCH_BUCKET).drop_nulls().cast(pl.Int64).alias("aqi_buckets"),
+    pl.col("precipitation_sum").filter(pl.col("daily_normal").is_not_null()).fill_null(0).sum().alias("monsoon_rain"),
+    pl.col("daily_normal").sum().alias("monsoon_normal_to_date"),
+    pl.col("date").max().alias("last_date"),
+]
+
+SUM_FIELDS = (
+    "days", "temp_max_days", "temp_max_sum", "temp_min_days", "temp_min_sum",
+    "precip_total", "rainy_days", "heatwave_days", "dust_storm_days",
+    "aqi_days", "aqi_sum", "monsoon_rain", "monsoon_normal_to_date",
+)
+
+
+# ============================================
+# Mergeable State
+# ============================================
+def merge_state(state: dict, partial: dict) -> dict:
+    """Fold a partial aggregate into a stored rollup state (both plain dicts)."""
+    merged = dict(state)
+    for field in SUM_FIELDS:
+        merged[field] = (merged.get(field) or 0) + (partial.get(field) or 0)
+    for field, pick in (("max_temp", max), ("max_precip_day", max), ("min_temp", min)):
+        values = [v for v in (merged.get(field), partial.get(field)) if v is not None]
+        merged[field] = pick(values) if values else None
+
+    # AQI sketch: fixed-width histogram, merged by adding bucket counts
+    sketch = dict(merged.get("aqi_sketch") or {})
+    for bucket in partial.get("aqi_buckets") or []:
+        sketch[str(bucket)] = sketch.get(str(bucket), 0) + 1
+    merged["aqi_sketch"] = sketch
+
+    merged["last_date"] = max(filter(None, (merged.get("last_date"), partial.get("last_date"))))
+    return merged
+
+
+def sketch_percentile(sketch: dict[str, int], q: float) -> float | None:
+    """Percentile (0-100) from the AQI histogram, interpolating inside the bucket."""
+    total = sum(sketch.values())
+    if not total:
+        return None
+    target = q / 100 * total
+    seen = 0
+    for bucket in sorted(sketch, key=int):
+        count = sketch[bucket]
+        if seen + count >= target:
+            fraction = (target - seen) / count
+            return round((int(bucket) + fraction) * AQI_SKETCH_BUCKET, 1)
+        seen += count
+    return round((max(map(int, sketch)) + 1) * AQI_SKETCH_BUCKET, 1)
+
+
+def _ratio(numerator: float | None, denominator: float | None) -> float | None:
+    return round(numerator / denominator, 2) if numerator is not None and denominator else None
+
+
+def state_to_row(state: dict) -> dict:
+    """Public columns derived from a rollup state (shared by monthly and yearly rows)."""
+    normal = state.get("monsoon_normal_to_date") or 0
+    return {
+        "avg_temp_max": _ratio(state.get("temp_max_sum"), state.get("temp_max_days")),
+        "avg_temp_min": _ratio(state.get("temp_min_sum"), state.get("temp_min_days")),
+        "total_precipitation": round(state.get("precip_total") or 0, 2),
+        "avg_aqi": _ratio(state.get("aqi_sum"), state.get("aqi_days")),
+        "max_temp_recorded": state.get("max_temp"),
+        "min_temp_recorded": state.get("min_temp"),
+        "max_precipitation_day": state.get("max_precip_day"),
+        "heatwave_days": state.get("heatwave_days") or 0,
+        "dust_storm_days": state.get("dust_storm_days") or 0,
+        "rainy_days": state.get("rainy_days") or 0,
+        "days_count": state.get("days") or 0,
+        "aqi_p50": sketch_percentile(state.get("aqi_sketch") or {}, 50),
+        "aqi_p90": sketch_percentile(state.get("aqi_sketch") or {}, 90),
+        "aqi_p95": sketch_percentile(state.get("aqi_sketch") or {}, 95),
+        "monsoon_rainfall": round(state.get("monsoon_rain") or 0, 2) if normal else None,
+        "monsoon_normal_to_date": round(normal, 2) if normal else None,
+        "rainfall_departure_pct": (
+            round((state.get("monsoon_rain", 0) - normal) / normal * 100, 1) if normal else None
+        ),
+        "last_date": state.get("last_date"),
+        "rollup_state": json.dumps(state),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+# ============================================
+# Engine
+# ============================================
+class RollupEngine:
+    """Folds newly finalized daily_aggregates rows into monthly and yearly stats."""
+
+    def __init__(self, client: Client, writer: BulkWriter):
+        self.client = client
+        self.writer = writer
+
+    def run(self, cities: dict[str, str], today: date | None = None) -> int:
+        """
+        Roll up every finalized day not yet counted.
+
+        Args:
+            cities: city_id → city name (names pick the MONSOON_NORMAL_RAINFALL entry)
+            today: local date; days strictly before it are final
+
+        Returns:
+            Number of daily rows folded in
+        """
+        if not cities:
+            return 0
+        today = today or datetime.now(ZoneInfo(TIMEZONE)).date()
+        final_through = today - timedelta(days=1)
+        city_ids = list(cities)
+
+        yearly = self._load_states("yearly_stats", city_ids, {final_through.year, final_through.year - 1})
+        # Per-city watermark: last day already folded in. Cities never rolled up
+        # start with the current month; older history comes from a backfill.
+        bootstrap = (final_through.replace(day=1) - timedelta(days=1)).isoformat()
+        watermarks = dict.fromkeys(city_ids, bootstrap)
+        for (city_id, _year, _month), state in yearly.items():
+            last = state.get("last_date")
+            if last and (watermarks[city_id] == bootstrap or last > watermarks[city_id]):
+                watermarks[city_id] = last
+
+        start = min(watermarks.values())
+        if start >= final_through.isoformat():
+            return 0
+        days = self._load_final_days(city_ids, date.fromisoformat(start), final_through)
+        if days.is_empty():
+            return 0
+        days = days.filter(
+            pl.col("date") > pl.col("city_id").replace_strict(watermarks, return_dtype=pl.Utf8)
+        )
+        return self.fold(days, cities, yearly)
+
+    def fold(self, days: pl.DataFrame, cities: dict[str, str], yearly: dict | None = None) -> int:
+        """Merge already-final daily rows into the monthly and yearly states and queue upserts."""
+        if days.is_empty():
+            return 0
+        days = self._with_monsoon_normals(days, cities)
+        years = set(days["year"].unique().to_list())
+        city_ids = days["city_id"].unique().to_list()
+        if yearly is None:
+            yearly = self._load_states("yearly_stats", city_ids, years)
+        monthly = self._load_states("historical_stats", city_ids, years)
+
+        month_rows = self._merge(days, ["city_id", "year", "month"], monthly)
+        year_rows = self._merge(days, ["city_id", "year"], yearly)
+        self.writer.add("historical_stats", month_rows)
+        self.writer.add("yearly_stats", year_rows)
+        self.writer.flush()
+        return len(days)
+
+    def rebuild(self, city_id: str, city_name: str, years: set[int], today: date | None = None) -> int:
+        """
+        Recompute a city's monthly and yearly stats for `years` from its final daily rows.
+
+        Used after days are stored behind the rollup watermark (backfill), which
+        the forward-only `run` would skip. The states are rebuilt from scratch,
+        so it is safe to repeat. Returns the number of daily rows counted.
+        """
+        today = today or datetime.now(ZoneInfo(TIMEZONE)).date()
+        through = min(today - timedelta(days=1), date(max(years), 12, 31))
+        after = date(min(years), 1, 1) - timedelta(days=1)
+        if through <= after:
+            return 0
+        days = self._load_final_days([city_id], after, through)
+        if days.is_empty():
+            return 0
+        days = self._with_monsoon_normals(days, {city_id: city_name}).filter(pl.col("year").is_in(sorted(years)))
+        self.writer.add("historical_stats", self._merge(days, ["city_id", "year", "month"], {}))
+        self.writer.add("yearly_stats", self._merge(days, ["city_id", "year"], {}))
+        self.writer.flush()
+        return len(days)
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _merge(self, days: pl.DataFrame, keys: list[str], states: dict) -> list[dict]:
+        rows = []
+        for group in days.partition_by(keys, maintain_order=True):
+            key = tuple(group[k][0] for k in keys)
+            state_key = key if len(key) == 3 else (*key, None)
+            state = states.get(state_key, {})
+            # Idempotent: skip days this row already counted (e.g. a retried run)
+            if state.get("last_date"):
+                group = group.filter(pl.col("date") > state["last_date"])
+            if group.is_empty():
+                continue
+            partial = group.group_by(keys).agg(PARTIAL_AGGS).row(0, named=True)
+            merged = merge_state(state, partial)
+            states[state_key] = merged
+            rows.append({**dict(zip(keys, key)), **state_to_row(merged)})
+        return rows
+
+    def _with_monsoon_normals(self, days: pl.DataFrame, cities: dict[str, str]) -> pl.DataFrame:
+        """Add year/month and each day's share of its month's monsoon normal (Jun–Sep)."""
+        normals = pl.DataFrame(
+            [
+                {"city_id": city_id, "month": MONTH_NAMES.index(month) + 1, "month_normal": mm}
+                for city_id, name in cities.items()
+                for month, mm in MONSOON_NORMAL_RAINFALL.get(name, {}).items()
+                if month in MONTH_NAMES
+            ],
+            schema={"city_id": pl.Utf8, "month": pl.Int8, "month_normal": pl.Float64},
+        )
+        parsed = pl.col("date").str.to_date()
+        return (
+            days.with_columns(
+                parsed.dt.year().cast(pl.Int32).alias("year"),
+                parsed.dt.month().cast(pl.Int8).alias("month"),
+                parsed.dt.month_end().dt.day().alias("days_in_month"),
+            )
+            .join(normals, on=["city_id", "month"], how="left")
+            .with_columns((pl.col("month_normal") / pl.col("days_in_month")).alias("daily_normal"))
+            .sort("city_id", "date")
+        )
+
+    def _load_states(self, table: str, city_ids: list[str], years: set[int]) -> dict:
+        columns = "city_id, year, month, rollup_state" if table == "historical_stats" else "city_id, year, rollup_state"
+        rows = self._select_per_city_chunk(
+            city_ids, lambda chunk: self.client.table(table).select(columns).in_("city_id", chunk).in_("year", sorted(years))
+        )
+        return {
+            (row["city_id"], row["year"], row.get("month")): json.loads(row.get("rollup_state") or "{}")
+            for row in rows
+        }
+
+    def _load_final_days(self, city_ids: list[str], after: date, through: date) -> pl.DataFrame:
+        rows = self._select_per_city_chunk(
+            city_ids, lambda chunk: self.client.table("daily_aggregates").select(
+                "city_id, date, temp_max, temp_min, precipitation_sum, aqi_mean, is_heatwave, is_dust_storm_risk"
+            ).in_("city_id", chunk).gt("date", after.isoformat()).lte("date", through.isoformat()).order("date")
+        )
+        if not rows:
+            return pl.DataFrame()
+        return pl.DataFrame(rows, infer_schema_length=None).with_columns(
+            pl.col(c).cast(pl.Float64) for c in ("temp_max", "temp_min", "precipitation_sum", "aqi_mean")
+        ).sort("date", maintain_order=True)
+
+    def _select_per_city_chunk(self, city_ids: list[str], build_query) -> list[dict]:
+        """Run `build_query(chunk)` for every CITY_CHUNK city ids and page through each."""
+        rows = []
+        for start in range(0, len(city_ids), CITY_CHUNK):
+            chunk = city_ids[start:start + CITY_CHUNK]
+            rows.extend(self._select_all(lambda: build_query(chunk)))
+        return rows
+
+    def _select_all(self, build_query) -> list[dict]:
+        """Page through a PostgREST select."""
+        rows, offset = [], 0
+        while True:
+            page = build_query().range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
@@ -0,0 +1,104 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+City Snapshot — one small "current state" row per city for the dashboard.
+
+While cities are processed, their latest observed weather and AQI hour and
+today's daily aggregates are kept in memory; once alerts are reconciled the
+active alert count is attached and the rows are upserted into `city_snapshot`
+in the same flush as everything else. Only cities processed in this run are
+touched, so daemon cycles refresh their subset incrementally.
+"""
+
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from config import HOURLY_AQI_VARS, HOURLY_WEATHER_VARS, TIMEZONE, CityConfig
+
+# daily_aggregates column → city_snapshot column
+TODAY_COLUMNS = {
+    "date": "today_date",
+    "temp_max": "today_temp_max",
+    "temp_min": "today_temp_min",
+    "precipitation_sum": "today_precipitation_sum",
+    "precipitation_probability_max": "today_precipitation_probability_max",
+    "uv_index_max": "today_uv_index_max",
+    "sunrise": "today_sunrise",
+    "sunset": "today_sunset",
+    "aqi_mean": "today_aqi_mean",
+    "aqi_max": "today_aqi_max",
+    "is_heatwave": "today_is_heatwave",
+    "is_dust_storm_risk": "today_is_dust_storm_risk",
+    "is_heavy_rain": "today_is_heavy_rain",
+}
+SEVERITY_ORDER = ["low", "moderate", "high", "extreme"]
+
+
+def _latest_row(frame: pl.DataFrame, now: str, columns: list[str], time_alias: str) -> dict:
+    """Latest hour at or before `now` (local time, like Open-Meteo's `time`), as a dict."""
+    latest = frame.filter(pl.col("recorded_at") <= now).sort("recorded_at").tail(1)
+    if latest.is_empty():
+        return {}
+    return latest.select(
+        pl.col("recorded_at").alias(time_alias), *(c for c in columns if c in frame.columns)
+    ).row(0, named=True)
+
+
+class CitySnapshots:
+    """Collects one snapshot row per processed city (from worker threads)."""
+
+    def __init__(self):
+        self._rows: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        city_id: str,
+        city_cfg: CityConfig,
+        hourly: pl.DataFrame,
+        aqi: pl.DataFrame,
+        daily: pl.DataFrame,
+    ) -> None:
+        """Record a city's current state; a city missing weather or AQI this run keeps its old row."""
+        if hourly.is_empty() or aqi.is_empty():
+            return
+        local_now = datetime.now(ZoneInfo(TIMEZONE))
+        now, today = local_now.strftime("%Y-%m-%dT%H:%M"), local_now.date().isoformat()
+        row = {
+            "city_id": city_id,
+            "city_name": city_cfg.name,
+            "latitude": city_cfg.latitude,
+            "longitude": city_cfg.longitude,
+            **_latest_row(hourly, now, HOURLY_WEATHER_VARS, "weather_recorded_at"),
+            **_latest_row(aqi, now, HOURLY_AQI_VARS, "aqi_recorded_at"),
+        }
+        if not daily.is_empty():
+            today_row = daily.filter(pl.col("date") == today)
+            if not today_row.is_empty():
+                row.update(today_row.select(
+                    pl.col(column).alias(alias) for column, alias in TODAY_COLUMNS.items() if column in daily.columns
+                ).row(0, named=True))
+        with self._lock:
+            self._rows[city_id] = row
+
+    def apply_alerts(self, active: pl.DataFrame) -> None:
+        """Attach active alert count and top severity, given every active alert (city_id, severity)."""
+        counts = (
+            active.group_by("city_id").agg(
+                pl.len().alias("active_alerts"),
+                pl.col("severity").cast(pl.Enum(SEVERITY_ORDER)).max().cast(pl.Utf8).alias("top_alert_severity"),
+            ).rows_by_key("city_id", named=True, unique=True)
+            if not active.is_empty() else {}
+        )
+        with self._lock:
+            for city_id, row in self._rows.items():
+                row.update(counts.get(city_id, {"active_alerts": 0, "top_alert_severity": None}))
+
+    def rows(self) -> pl.DataFrame:
+        """Snapshot rows to upsert on city_id (empty if no city was processed)."""
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            rows = [{**row, "updated_at": updated_at} for row in self._rows.values()]
+        return pl.DataFrame(rows, infer_schema_length=None) if rows else pl.DataFrame()
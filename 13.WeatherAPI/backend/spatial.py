@@ -0,0 +1,196 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Spatial Interpolation — grid index over city observations + IDW.
+
+Cities are bucketed into a regular lat/lon grid once; a batch of query points
+then only looks at cities in the surrounding cells (falling back to a full
+scan for points with too few nearby cities) and blends the k nearest with
+inverse-distance weights. Hundreds of points per request are answered with a
+few Polars joins, without calling Open-Meteo per point.
+
+Usage:
+    python spatial.py --points 26.9,75.8 27.5,72.1
+    python spatial.py --grid 0.25 > heatmap.csv
+"""
+
+import argparse
+import logging
+import sys
+
+import polars as pl
+from supabase import Client
+
+from config import IDW_NEIGHBORS, IDW_POWER, MAX_INTERPOLATION_POINTS, RAJASTHAN_BOUNDS, SPATIAL_CELL_DEGREES
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("temperature_2m", "us_aqi", "dust")
+EARTH_RADIUS_KM = 6371.0
+EXACT_MATCH_KM = 0.05        # closer than this, a city's own value is returned
+PAGE_SIZE = 1000             # PostgREST default max rows per response
+
+
+def _haversine_km(lat1: pl.Expr, lon1: pl.Expr, lat2: pl.Expr, lon2: pl.Expr) -> pl.Expr:
+    dlat = (lat2 - lat1).radians()
+    dlon = (lon2 - lon1).radians()
+    a = (dlat / 2).sin() ** 2 + lat1.radians().cos() * lat2.radians().cos() * (dlon / 2).sin() ** 2
+    return 2 * EARTH_RADIUS_KM * a.sqrt().arcsin()
+
+
+class SpatialIndex:
+    """Regular lat/lon grid over city observations with batched IDW interpolation."""
+
+    def __init__(self, observations: pl.DataFrame, cell_degrees: float = SPATIAL_CELL_DEGREES):
+        """
+        Args:
+            observations: one row per city with `latitude`, `longitude` and any of FIELDS
+            cell_degrees: grid cell size in degrees
+        """
+        self.cell_degrees = cell_degrees
+        self.fields = [f for f in FIELDS if f in observations.columns]
+        self.cities = observations.select(
+            pl.col("latitude").cast(pl.Float64).alias("city_lat"),
+            pl.col("longitude").cast(pl.Float64).alias("city_lon"),
+            *(pl.col(f).cast(pl.Float64) for f in self.fields),
+        ).drop_nulls(["city_lat", "city_lon"]).with_columns(
+            (pl.col("city_lat") / cell_degrees).floor().cast(pl.Int32).alias("cell_i"),
+            (pl.col("city_lon") / cell_degrees).floor().cast(pl.Int32).alias("cell_j"),
+        )
+        self._offsets = pl.DataFrame(
+            {"di": [di for di in (-1, 0, 1) for _ in range(3)], "dj": [-1, 0, 1] * 3},
+            schema={"di": pl.Int32, "dj": pl.Int32},
+        )
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    @classmethod
+    def from_supabase(cls, client: Client) -> "SpatialIndex":
+        """Build from the latest observed weather and AQI per city (city_snapshot)."""
+        rows = _select_all(client, "city_snapshot", "city_id, latitude, longitude, temperature_2m, us_aqi, dust")
+        return cls(pl.DataFrame(rows, schema={
+            "city_id": pl.Utf8, "latitude": pl.Float64, "longitude": pl.Float64,
+            "temperature_2m": pl.Float64, "us_aqi": pl.Float64, "dust": pl.Float64,
+        }))
+
+    # ----------------------------------------
+    # Queries
+    # ----------------------------------------
+    def interpolate(
+        self,
+        points: list[tuple[float, float]],
+        k: int = IDW_NEIGHBORS,
+        power: float = IDW_POWER,
+    ) -> pl.DataFrame:
+        """IDW estimate of every field at each (lat, lon), in input order."""
+        if len(points) > MAX_INTERPOLATION_POINTS:
+            raise ValueError(f"at most {MAX_INTERPOLATION_POINTS} points per request, got {len(points)}")
+        pts = pl.DataFrame(
+            {"latitude": [p[0] for p in points], "longitude": [p[1] for p in points]},
+            schema={"latitude": pl.Float64, "longitude": pl.Float64},
+        ).with_row_index("point_id")
+        if pts.is_empty() or self.cities.is_empty():
+            return pts.with_columns(pl.lit(None, dtype=pl.Float64).alias(f) for f in (*self.fields, "nearest_km"))
+
+        k = min(k, len(self.cities))
+        neighbors = self._nearest(pts, k)
+        weight = (
+            pl.when(pl.col("distance_km") < EXACT_MATCH_KM)
+            .then(pl.lit(1e12))
+            .otherwise(1 / pl.col("distance_km") ** power)
+        )
+        estimates = neighbors.with_columns(weight.alias("_w")).group_by("point_id").agg(
+            *(
+                # Null, not 0/0 = NaN, when every neighbor lacks the field
+                pl.when(pl.col("_w").filter(pl.col(f).is_not_null()).sum() > 0)
+                .then((pl.col("_w") * pl.col(f)).sum() / pl.col("_w").filter(pl.col(f).is_not_null()).sum())
+                .round(2).alias(f)
+                for f in self.fields
+            ),
+            pl.col("distance_km").min().round(2).alias("nearest_km"),
+        )
+        return pts.join(estimates, on="point_id", how="left").sort("point_id").drop("point_id")
+
+    def grid(self, step: float, bounds: tuple[float, float, float, float] = RAJASTHAN_BOUNDS) -> pl.DataFrame:
+        """Interpolate on a regular grid of `step` degrees over `bounds` (heat-map tiles)."""
+        lat_min, lon_min, lat_max, lon_max = bounds
+        rows = int((lat_max - lat_min) / step) + 1
+        cols = int((lon_max - lon_min) / step) + 1
+        points = [
+            (round(lat_min + i * step, 6), round(lon_min + j * step, 6)) for i in range(rows) for j in range(cols)
+        ]
+        return self.interpolate(points)
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _nearest(self, pts: pl.DataFrame, k: int) -> pl.DataFrame:
+        """k nearest cities per point: 3×3 cell neighborhood first, full scan where that isn't enough."""
+        distance = _haversine_km(pl.col("latitude"), pl.col("longitude"), pl.col("city_lat"), pl.col("city_lon"))
+        cells = pts.with_columns(
+            (pl.col("latitude") / self.cell_degrees).floor().cast(pl.Int32).alias("cell_i"),
+            (pl.col("longitude") / self.cell_degrees).floor().cast(pl.Int32).alias("cell_j"),
+        )
+        local = (
+            cells.join(self._offsets, how="cross")
+            .with_columns(pl.col("cell_i") + pl.col("di"), pl.col("cell_j") + pl.col("dj"))
+            .join(self.cities, on=["cell_i", "cell_j"])
+            .with_columns(distance.alias("distance_km"))
+            .sort("point_id", "distance_km")
+            .group_by("point_id", maintain_order=True)
+            .head(k)
+        )
+        # The ring is exact only if all k neighbors lie closer than one cell width.
+        # Longitude cells narrow with latitude, so measure that width at the ring's
+        # poleward edge for each query point.
+        ring_km = self.cell_degrees * 111.0 * (
+            (pl.col("latitude").abs() + self.cell_degrees).clip(upper_bound=90.0).radians().cos()
+        )
+        resolved = local.group_by("point_id").agg(
+            pl.len().alias("n"), pl.col("distance_km").max().alias("kth_km"), pl.col("latitude").first()
+        ).filter((pl.col("n") >= k) & (pl.col("kth_km") <= ring_km))
+        local = local.join(resolved.select("point_id"), on="point_id", how="semi")
+
+        remaining = pts.join(resolved.select("point_id"), on="point_id", how="anti")
+        if remaining.is_empty():
+            return local
+        scanned = (
+            remaining.join(self.cities, how="cross")
+            .with_columns(distance.alias("distance_km"))
+            .sort("point_id", "distance_km")
+            .group_by("point_id", maintain_order=True)
+            .head(k)
+        )
+        return pl.concat([local, scanned], how="diagonal_relaxed")
+
+
+def _select_all(client: Client, table: str, columns: str) -> list[dict]:
+    rows, offset = [], 0
+    while True:
+        page = client.table(table).select(columns).range(offset, offset + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interpolate weather/AQI at arbitrary Rajasthan coordinates")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--points", nargs="+", metavar="LAT,LON")
+    group.add_argument("--grid", type=float, metavar="STEP_DEG")
+    args = parser.parse_args()
+
+    from preprocess import supabase
+    if supabase is None:
+        sys.exit("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set!")
+    index = SpatialIndex.from_supabase(supabase)
+    if args.grid:
+        result = index.grid(args.grid)
+    else:
+        result = index.interpolate([tuple(map(float, p.split(","))) for p in args.points])
+    result.write_csv(sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Daily aggregates joined from the hourly weather and AQI frames."""
+
+import polars as pl
+import pytest
+
+from preprocess import process_air_quality, process_daily_aggregates, process_hourly_weather
+
+DAYS = ["2024-06-01", "2024-06-02"]
+HOURS = [f"{day}T{hour:02d}:00" for day in DAYS for hour in range(24)]
+WEATHER = {
+    "daily": {"time": DAYS, "temperature_2m_max": [44.0, 46.0], "temperature_2m_min": [30.0, 31.0]},
+    "hourly": {"time": HOURS, "temperature_2m": [40.0] * 48, "relative_humidity_2m": [30] * 48},
+}
+AQI = {"hourly": {"time": HOURS, "us_aqi": [180] * 48, "pm2_5": [80.0] * 48, "dust": [200.0] * 48}}
+
+
+@pytest.fixture
+def full() -> pl.DataFrame:
+    return process_daily_aggregates(
+        WEATHER, process_air_quality(AQI, "c1"), "c1", process_hourly_weather(WEATHER, "c1")
+    )
+
+
+@pytest.mark.parametrize("with_aqi, with_hourly", [(False, True), (True, False), (False, False)])
+def test_missing_hourly_data_keeps_daily_dtypes(full, with_aqi, with_hourly):
+    bare = process_daily_aggregates(
+        WEATHER,
+        process_air_quality(AQI, "c2") if with_aqi else pl.DataFrame(),
+        "c2",
+        process_hourly_weather(WEATHER, "c2") if with_hourly else None,
+    )
+    assert bare.schema == full.schema
+    # Cities with and without AQI data concatenate without dtype promotion
+    combined = pl.concat([full, bare], how="vertical")
+    assert combined.schema == full.schema
+
+
+def test_hour_counts_are_integers(full):
+    for column in ("hours_poor_aqi", "hours_very_poor_aqi", "hours_hazardous_aqi", "dust_exposure_hours"):
+        assert full.schema[column] == pl.Int64
+    assert full["hours_poor_aqi"].to_list() == [24, 24]
+    assert full["hours_hazardous_aqi"].to_list() == [0, 0]
+
+
+def test_without_aqi_the_stats_are_null():
+    bare = process_daily_aggregates(WEATHER, pl.DataFrame(), "c2", None)
+    assert bare["hours_poor_aqi"].null_count() == len(DAYS)
+    assert bare["date"].to_list() == DAYS
@@ -0,0 +1,117 @@
+"""Mergeable rollup state and the monthly / yearly stats built from it."""
+
+from datetime import date, timedelta
+
+import polars as pl
+import pytest
+
+from replay import MemorySink
+from rollup import CITY_CHUNK, PARTIAL_AGGS, RollupEngine, merge_state, sketch_percentile, state_to_row
+from writer import BulkWriter
+
+START = date(2024, 6, 1)
+
+
+def daily_rows(city_id: str, days: int, start: date = START) -> list[dict]:
+    return [
+        {
+            "city_id": city_id,
+            "date": (start + timedelta(days=i)).isoformat(),
+            "temp_max": 40.0 + i % 7,
+            "temp_min": 28.0 - i % 5,
+            "precipitation_sum": float(i % 4) * 6.5,
+            "aqi_mean": 60.0 + (i * 13) % 120 if i % 9 else None,
+            "is_heatwave": 40.0 + i % 7 >= 45,
+            "is_dust_storm_risk": i % 11 == 0,
+        }
+        for i in range(days)
+    ]
+
+
+def with_normals(rows: list[dict], name: str = "Jaipur") -> pl.DataFrame:
+    days = pl.DataFrame(rows)
+    return RollupEngine(None, None)._with_monsoon_normals(days, {rows[0]["city_id"]: name})
+
+
+def public(row: dict) -> dict:
+    return {k: v for k, v in row.items() if k not in ("rollup_state", "updated_at")}
+
+
+def test_merge_is_independent_of_batching():
+    days = with_normals(daily_rows("c1", 30))
+    all_at_once = merge_state({}, days.group_by("city_id").agg(PARTIAL_AGGS).row(0, named=True))
+
+    one_by_one: dict = {}
+    for day in days.partition_by("date", maintain_order=True):
+        one_by_one = merge_state(one_by_one, day.group_by("city_id").agg(PARTIAL_AGGS).row(0, named=True))
+
+    assert public(state_to_row(one_by_one)) == public(state_to_row(all_at_once))
+    assert one_by_one["days"] == 30
+    assert one_by_one["last_date"] == "2024-06-30"
+
+
+def test_merge_keeps_extremes_with_missing_values():
+    state = merge_state({}, {"days": 1, "max_temp": 41.0, "min_temp": None, "last_date": "2024-06-01"})
+    state = merge_state(state, {"days": 1, "max_temp": None, "min_temp": 22.5, "last_date": "2024-06-02"})
+    assert (state["max_temp"], state["min_temp"], state["days"]) == (41.0, 22.5, 2)
+
+
+def test_sketch_percentile():
+    assert sketch_percentile({}, 50) is None
+    # 10 days in bucket 20 (AQI 100-105): the median is halfway through it
+    assert sketch_percentile({"20": 10}, 50) == 102.5
+
+
+def test_departure_against_monsoon_normal():
+    row = state_to_row({"monsoon_rain": 75.0, "monsoon_normal_to_date": 50.0})
+    assert (row["monsoon_rainfall"], row["monsoon_normal_to_date"], row["rainfall_departure_pct"]) == (75.0, 50.0, 50.0)
+    # Outside Jun-Sep there is no normal to compare against
+    assert state_to_row({"monsoon_rain": 0.0})["rainfall_departure_pct"] is None
+
+
+@pytest.fixture
+def sink() -> MemorySink:
+    return MemorySink()
+
+
+def engine(sink: MemorySink) -> RollupEngine:
+    return RollupEngine(sink, BulkWriter(sink))
+
+
+def seed_days(sink: MemorySink, rows: list[dict]):
+    for row in rows:
+        sink.tables["daily_aggregates"][(row["city_id"], row["date"])] = row
+
+
+def test_run_rolls_up_more_cities_than_one_filter_chunk(sink):
+    # 250 UUIDs in one in.() filter would overflow the URL, which the sink rejects
+    sink.seed_cities(CITY_CHUNK * 5)
+    cities = {city_id: row["name"] for city_id, row in sink.tables["cities"].items()}
+    for city_id in cities:
+        seed_days(sink, daily_rows(city_id, 10))
+
+    folded = engine(sink).run(cities, today=START + timedelta(days=10))
+
+    assert folded == 10 * len(cities)
+    yearly = list(sink.tables["yearly_stats"].values())
+    assert len(yearly) == len(cities)
+    assert {row["days_count"] for row in yearly} == {10}
+    # Everything is counted: a second run folds nothing
+    assert engine(sink).run(cities, today=START + timedelta(days=10)) == 0
+
+
+def test_rebuild_counts_backfilled_days_behind_watermark(sink):
+    sink.seed_cities(1)
+    city_id, city = next(iter(sink.tables["cities"].items()))
+    seed_days(sink, daily_rows(city_id, 10))
+    engine(sink).run({city_id: city["name"]}, today=START + timedelta(days=10))
+
+    # Backfill stores May, before the yearly watermark (2024-06-10)
+    seed_days(sink, daily_rows(city_id, 31, start=date(2024, 5, 1)))
+    assert engine(sink).run({city_id: city["name"]}, today=START + timedelta(days=10)) == 0
+    engine(sink).rebuild(city_id, city["name"], {2024}, today=START + timedelta(days=10))
+
+    yearly = sink.tables["yearly_stats"][(city_id, 2024)]
+    assert yearly["days_count"] == 41
+    assert yearly["last_date"] == "2024-06-10"
+    assert {row["month"] for row in sink.tables["historical_stats"].values()} == {5, 6}
@@ -0,0 +1,68 @@
+"""Grid-indexed IDW interpolation."""
+
+import json
+import random
+
+import polars as pl
+import pytest
+
+from spatial import SpatialIndex
+
+CITIES = pl.DataFrame(
+    {
+        "latitude": [26.9124, 26.2389, 24.5854, 28.0229],
+        "longitude": [75.7873, 73.0243, 73.7125, 73.3119],
+        "temperature_2m": [38.0, 41.0, 33.0, 43.0],
+        "us_aqi": [None, None, None, None],
+        "dust": [120.0, None, 40.0, 300.0],
+    },
+    schema_overrides={"us_aqi": pl.Float64},
+)
+
+
+def test_exact_city_returns_its_own_value():
+    result = SpatialIndex(CITIES).interpolate([(26.9124, 75.7873)])
+    assert result["temperature_2m"][0] == 38.0
+    assert result["nearest_km"][0] == 0.0
+
+
+def test_estimate_stays_within_neighbor_range():
+    result = SpatialIndex(CITIES).interpolate([(26.0, 74.0), (27.0, 73.5)])
+    assert result["temperature_2m"].is_between(33.0, 43.0).all()
+    assert result["dust"].is_between(40.0, 300.0).all()
+
+
+def test_field_missing_everywhere_is_null_not_nan():
+    result = SpatialIndex(CITIES).interpolate([(26.0, 74.0)])
+    assert result["us_aqi"][0] is None
+    # /interpolate serves this as JSON; NaN would not be valid JSON
+    json.dumps(result.to_dicts(), allow_nan=False)
+
+
+def test_results_follow_input_order():
+    points = [(28.0, 73.3), (24.6, 73.7), (26.9, 75.8)]
+    result = SpatialIndex(CITIES).interpolate(points)
+    assert list(zip(result["latitude"], result["longitude"])) == points
+    assert result["temperature_2m"].to_list() == [43.0, 33.0, 38.0]
+
+
+def test_empty_inputs():
+    assert SpatialIndex(CITIES).interpolate([]).is_empty()
+    result = SpatialIndex(CITIES.clear()).interpolate([(26.0, 74.0)])
+    assert result["temperature_2m"][0] is None
+
+
+@pytest.mark.parametrize("lat_range", [(24.0, 30.0), (55.0, 65.0)])
+def test_grid_lookup_matches_full_scan(lat_range):
+    # A cell larger than the whole area forces every point through the full scan.
+    # Far north, longitude cells are much narrower than at Rajasthan's latitudes.
+    rng = random.Random(7)
+    cities = pl.DataFrame({
+        "latitude": [rng.uniform(*lat_range) for _ in range(300)],
+        "longitude": [rng.uniform(5.0, 15.0) for _ in range(300)],
+        "temperature_2m": [rng.uniform(0.0, 45.0) for _ in range(300)],
+    })
+    points = [(rng.uniform(*lat_range), rng.uniform(5.0, 15.0)) for _ in range(500)]
+    gridded = SpatialIndex(cities, cell_degrees=1.0).interpolate(points)
+    scanned = SpatialIndex(cities, cell_degrees=180.0).interpolate(points)
+    assert gridded.equals(scanned)
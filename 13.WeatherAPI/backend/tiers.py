@@ -0,0 +1,169 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Resolution Tiers — 15-minute raw tier, downsampling and retention.
+
+weather_data_15min (raw, 7 days) → weather_data (hourly, 90 days) →
+daily_aggregates (daily, kept forever). Each run downsamples the fetched
+15-minute rows into the hourly rows it upserts, and once a day prunes the
+15-minute tier past its retention so storage stays bounded. Pruning the
+hourly tiers is opt-in (PIPELINE_PRUNE_HOURLY=1).
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import polars as pl
+from postgrest import ReturnMethod
+from supabase import Client
+
+from config import MINUTELY_15_VARS, PRUNE_HOURLY_TIERS, TIER_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PER_HOUR = 4
+PRUNE_MARKER = "tiers_pruned_on.txt"   # in the cache dir: UTC date of the last retention prune
+
+_last_pruned_on: str | None = None     # same, for daemon cycles within one process
+
+# Tiers holding history the pipeline always kept; their retention is opt-in
+HOURLY_TIERS = ("weather_data", "air_quality_data")
+
+# Time column each tier is pruned on
+TIER_TIME_COLUMNS = {
+    "weather_data_15min": "recorded_at",
+    "weather_data": "recorded_at",
+    "air_quality_data": "recorded_at",
+    "daily_aggregates": "date",
+}
+
+# How four 15-minute samples become one hourly value
+DOWNSAMPLE_AGGS: dict[str, pl.Expr] = {
+    "temperature_2m": pl.col("temperature_2m").mean(),
+    "apparent_temperature": pl.col("apparent_temperature").mean(),
+    "relative_humidity_2m": pl.col("relative_humidity_2m").mean(),
+    "dewpoint_2m": pl.col("dewpoint_2m").mean(),
+    "precipitation": pl.col("precipitation").sum(),
+    "rain": pl.col("rain").sum(),
+    "wind_speed_10m": pl.col("wind_speed_10m").mean(),
+    "wind_direction_10m": pl.col("wind_direction_10m").last(),   # directions don't average
+    "wind_gusts_10m": pl.col("wind_gusts_10m").max(),
+    "weather_code": pl.col("weather_code").max(),                # WMO codes rise with severity
+    "visibility": pl.col("visibility").min(),
+}
+
+
+def downsample_to_hourly(minutely: pl.DataFrame) -> pl.DataFrame:
+    """
+    Aggregate 15-minute rows into hourly rows keyed like weather_data.
+
+    Open-Meteo labels an hour by its end (precipitation at 14:00 fell during
+    13:00–14:00), so windows are (HH-1:00, HH:00]. Hours with fewer than four
+    samples (edges of the response) are dropped.
+    """
+    if minutely.is_empty():
+        return minutely
+    aggs = [DOWNSAMPLE_AGGS[var].alias(var) for var in MINUTELY_15_VARS if var in minutely.columns]
+    return (
+        minutely.with_columns(pl.col("recorded_at").str.to_datetime(strict=False).alias("_ts"))
+        .drop_nulls("_ts")
+        .sort("city_id", "_ts")
+        .group_by_dynamic("_ts", every="1h", closed="right", label="right", group_by="city_id")
+        .agg(pl.len().alias("_samples"), *aggs)
+        .filter(pl.col("_samples") == SAMPLES_PER_HOUR)
+        .with_columns(pl.col("_ts").dt.strftime("%Y-%m-%dT%H:%M").alias("recorded_at"))
+        .drop("_ts", "_samples")
+    )
+
+
+def merge_downsampled(hourly: pl.DataFrame, downsampled: pl.DataFrame) -> pl.DataFrame:
+    """Overwrite hourly values with the downsampled 15-minute aggregates where they exist."""
+    if hourly.is_empty() or downsampled.is_empty():
+        return hourly
+    shared = [c for c in downsampled.columns if c in hourly.columns and c not in ("city_id", "recorded_at")]
+    return (
+        hourly.join(downsampled.select("city_id", "recorded_at", *shared), on=["city_id", "recorded_at"],
+                    how="left", suffix="_15min")
+        .with_columns(
+            pl.coalesce(pl.col(f"{c}_15min"), pl.col(c)).cast(hourly.schema[c]).alias(c) for c in shared
+        )
+        .select(hourly.columns)
+    )
+
+
+def _pruned_on(state_dir: str | None) -> str | None:
+    if _last_pruned_on is not None or not state_dir:
+        return _last_pruned_on
+    try:
+        return (Path(state_dir) / PRUNE_MARKER).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def retention_days(table: str, prune_hourly: bool = PRUNE_HOURLY_TIERS) -> int | None:
+    """Days of `table` kept in Supabase (None = forever); hourly tiers only expire when opted in."""
+    if table in HOURLY_TIERS and not prune_hourly:
+        return None
+    return TIER_RETENTION_DAYS[table]
+
+
+def hourly_pruning_allowed(archive_dir: str | None, prune_hourly: bool = PRUNE_HOURLY_TIERS) -> bool:
+    """
+    Whether hourly rows past retention may be deleted from Supabase.
+
+    Only with the opt-in and a Parquet archive that outlives the run, since the
+    archive is then the only copy: never with the archive disabled, and never
+    on a GitHub Actions runner, whose disk is discarded (the Actions cache that
+    carries the archive between runs is best-effort and can be evicted).
+    """
+    if not prune_hourly:
+        return False
+    if not archive_dir:
+        logger.warning("⚠️ PIPELINE_PRUNE_HOURLY ignored: the Parquet archive is disabled")
+        return False
+    if os.getenv("GITHUB_ACTIONS") == "true":
+        logger.warning("⚠️ PIPELINE_PRUNE_HOURLY ignored: the archive on a GitHub Actions runner is not durable")
+        return False
+    return True
+
+
+def prune_expired_tiers(
+    client: Client,
+    now: datetime | None = None,
+    state_dir: str | None = None,
+    prune_hourly: bool = PRUNE_HOURLY_TIERS,
+) -> bool:
+    """
+    Delete rows older than each tier's retention, at most once per UTC day.
+
+    The 15-minute tier is always pruned; weather_data and air_quality_data
+    only with `prune_hourly` (PIPELINE_PRUNE_HOURLY=1). Retention is in days,
+    so pruning more often only repeats the same DELETEs. The last prune date
+    is remembered in-process and, with a `state_dir` (the cache directory),
+    across runs. Returns whether a prune ran.
+    """
+    global _last_pruned_on
+    now = now or datetime.now(timezone.utc)
+    today = now.date().isoformat()
+    if _pruned_on(state_dir) == today:
+        return False
+    for table in TIER_RETENTION_DAYS:
+        days = retention_days(table, prune_hourly)
+        if days is None:
+            continue
+        cutoff = now - timedelta(days=days)
+        column = TIER_TIME_COLUMNS[table]
+        value = cutoff.date().isoformat() if column == "date" else cutoff.isoformat()
+        try:
+            client.table(table).delete(returning=ReturnMethod.minimal).lt(column, value).execute()
+        except Exception as e:
+            logger.error(f"❌ Failed to prune {table} older than {days} days: {e}")
+    _last_pruned_on = today
+    if state_dir:
+        try:
+            Path(state_dir).mkdir(parents=True, exist_ok=True)
+            (Path(state_dir) / PRUNE_MARKER).write_text(today, encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"⚠️ Could not record tier prune date: {e}")
+    return True
@@ -0,0 +1,154 @@
+"""
+Rajasthan Weather & Air Quality Monitor
+Bulk Writer — write-behind, cross-city batched upserts into Supabase.
+
+Records from every city are buffered per table and flushed in chunks whose
+size is derived from the estimated JSON payload bytes, instead of one
+round trip per city per table.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+
+import polars as pl
+from supabase import Client
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+from config import BULK_CHUNK_BYTES, MAX_RETRIES
+from metrics import StageMetrics
+
+logger = logging.getLogger(__name__)
+
+# Table → upsert conflict target (None = plain insert)
+TABLE_CONFLICT_KEYS: dict[str, str | None] = {
+    "weather_data_15min": "city_id,recorded_at,is_forecast",
+    "weather_data": "city_id,recorded_at,is_forecast",
+    "air_quality_data": "city_id,recorded_at",
+    "daily_aggregates": "city_id,date",
+    "alerts": None,
+    "historical_stats": "city_id,month,year",
+    "yearly_stats": "city_id,year",
+    "city_snapshot": "city_id",
+}
+
+
+def estimate_payload_bytes(df: pl.DataFrame, sample_rows: int = 64) -> int:
+    """Estimate the JSON body size of `df` from a serialized sample."""
+    if df.is_empty():
+        return 0
+    sample = df.head(sample_rows)
+    return int(len(sample.write_json()) * len(df) / len(sample))
+
+
+class BulkWriter:
+    """
+    Buffers records per table and writes them in byte-bounded chunks.
+
+    `add` flushes a table as soon as its buffer exceeds one chunk, so writes
+    keep overlapping with fetching; `flush` writes whatever is left. A chunk
+    that still fails after retries is logged and counted in `failed` without
+    affecting the other chunks.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        max_chunk_bytes: int = BULK_CHUNK_BYTES,
+        stages: StageMetrics | None = None,
+    ):
+        self.client = client
+        self.max_chunk_bytes = max_chunk_bytes
+        self.stages = stages or StageMetrics()
+        self.written: dict[str, int] = dict.fromkeys(TABLE_CONFLICT_KEYS, 0)
+        self.failed: dict[str, int] = dict.fromkeys(TABLE_CONFLICT_KEYS, 0)
+        self._buffers: dict[str, list[pl.DataFrame]] = {table: [] for table in TABLE_CONFLICT_KEYS}
+        self._buffered_bytes: dict[str, int] = dict.fromkeys(TABLE_CONFLICT_KEYS, 0)
+        self._lock = threading.Lock()
+
+    def add(self, table: str, records: pl.DataFrame | list[dict]) -> int:
+        """Queue records for `table`; returns the number of rows queued."""
+        if isinstance(records, list):
+            # Infer from every row: a column can be null (or int 0) for the first hundred
+            records = pl.DataFrame(records, infer_schema_length=None)
+        if records.is_empty():
+            return 0
+
+        size = estimate_payload_bytes(records)
+        with self._lock:
+            self._buffers[table].append(records)
+            self._buffered_bytes[table] += size
+            ready = self._drain(table) if self._buffered_bytes[table] >= self.max_chunk_bytes else None
+
+        if ready is not None:
+            self._write_table(table, ready)
+        return len(records)
+
+    def flush(self) -> dict[str, int]:
+        """Write every buffered table; returns rows written per table so far."""
+        for table in TABLE_CONFLICT_KEYS:
+            with self._lock:
+                ready = self._drain(table)
+            if ready is not None:
+                self._write_table(table, ready)
+        return dict(self.written)
+
+    def deactivate_expired_alerts(self) -> None:
+        """Mark alerts past their expiry as inactive (once per run)."""
+        try:
+            self.client.table("alerts").update(
+                {"is_active": False}
+            ).lt("expires_at", datetime.now(timezone.utc).isoformat()).execute()
+        except Exception as e:
+            logger.error(f"❌ Failed to deactivate expired alerts: {e}")
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _drain(self, table: str) -> pl.DataFrame | None:
+        """Pop the buffer for `table` as one frame. Caller holds the lock."""
+        frames = self._buffers[table]
+        if not frames:
+            return None
+        self._buffers[table] = []
+        self._buffered_bytes[table] = 0
+        return pl.concat(frames, how="vertical_relaxed")
+
+    def _write_table(self, table: str, df: pl.DataFrame) -> None:
+        conflict = TABLE_CONFLICT_KEYS[table]
+        if conflict:
+            # Postgres rejects an upsert that touches the same key twice
+            df = df.unique(subset=conflict.split(","), keep="last", maintain_order=True)
+
+        bytes_per_row = max(1, estimate_payload_bytes(df) // len(df))
+        rows_per_chunk = max(1, self.max_chunk_bytes // bytes_per_row)
+        for offset in range(0, len(df), rows_per_chunk):
+            self._write_chunk(table, df.slice(offset, rows_per_chunk))
+
+    def _write_chunk(self, table: str, chunk: pl.DataFrame) -> None:
+        records = chunk.to_dicts()
+        self.stages.inc("upsert_payload_bytes", estimate_payload_bytes(chunk), table=table)
+        try:
+            for attempt in Retrying(
+                stop=stop_after_attempt(MAX_RETRIES),
+                wait=wait_exponential(multiplier=1, min=2, max=10),
+                reraise=True,
+                before_sleep=lambda retry_state: logger.warning(
+                    f"⚠️ {table} chunk retry {retry_state.attempt_number}/{MAX_RETRIES}..."
+                ),
+            ):
+                with attempt, self.stages.time("store", table=table):
+                    result = self._send(table, records)
+            with self._lock:
+                self.written[table] += len(result.data) if result.data else 0
+        except Exception as e:
+            logger.error(f"❌ Failed to write {len(records)} rows to {table}: {e}")
+            with self._lock:
+                self.failed[table] += len(records)
+
+    def _send(self, table: str, records: list[dict]):
+        conflict = TABLE_CONFLICT_KEYS[table]
+        query = self.client.table(table)
+        if conflict:
+            return query.upsert(records, on_conflict=conflict).execute()
+        return query.insert(records).execute()
@@ -123,6 +123,13 @@ CREATE TABLE IF NOT EXISTS daily_aggregates (
     pm2_5_mean DOUBLE PRECISION,
     pm10_mean DOUBLE PRECISION,
     dust_mean DOUBLE PRECISION,
+    -- Derived from the hourly frames (backend/derived.py)
+    heat_index_max DOUBLE PRECISION,
+    wbgt_max DOUBLE PRECISION,
+    hours_poor_aqi INTEGER,
+    hours_very_poor_aqi INTEGER,
+    hours_hazardous_aqi INTEGER,
+    dust_exposure_hours INTEGER,
     -- Flags
     is_heatwave BOOLEAN DEFAULT FALSE,         -- temp_max > 42°C
     is_dust_storm_risk BOOLEAN DEFAULT FALSE,  -- high dust + wind
@@ -141,7 +148,7 @@ CREATE TABLE IF NOT EXISTS alerts (
     alert_type TEXT NOT NULL CHECK (alert_type IN (
         'heatwave', 'dust_storm', 'heavy_rain', 'poor_aqi',
         'very_poor_aqi', 'hazardous_aqi', 'cold_wave', 'high_uv',
-        'thunderstorm', 'fog'
+        'thunderstorm', 'fog', 'anomaly'
     )),
     severity TEXT NOT NULL CHECK (severity IN ('low', 'moderate', 'high', 'extreme')),
     title TEXT NOT NULL,
@@ -317,3 +324,255 @@ ORDER BY
         WHEN 'low' THEN 4
     END,
     a.created_at DESC;
+
+-- ============================================
+-- 13. HISTORICAL ROLLUPS (incremental, written by preprocess.py)
+-- ============================================
+-- Extra columns maintained by the rollup stage; rollup_state holds the
+-- mergeable running aggregates (sums, counts, AQI sketch) as JSON text.
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS days_count INTEGER DEFAULT 0;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS aqi_p50 DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS aqi_p90 DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS aqi_p95 DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS monsoon_rainfall DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS monsoon_normal_to_date DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS rainfall_departure_pct DOUBLE PRECISION;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS last_date DATE;
+ALTER TABLE historical_stats ADD COLUMN IF NOT EXISTS rollup_state TEXT;
+
+-- Yearly rollup (same aggregates, one row per city per year)
+CREATE TABLE IF NOT EXISTS yearly_stats (
+    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+    city_id UUID NOT NULL REFERENCES cities(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    -- Averages
+    avg_temp_max DOUBLE PRECISION,
+    avg_temp_min DOUBLE PRECISION,
+    total_precipitation DOUBLE PRECISION,
+    avg_aqi DOUBLE PRECISION,
+    aqi_p50 DOUBLE PRECISION,
+    aqi_p90 DOUBLE PRECISION,
+    aqi_p95 DOUBLE PRECISION,
+    -- Extremes
+    max_temp_recorded DOUBLE PRECISION,
+    min_temp_recorded DOUBLE PRECISION,
+    max_precipitation_day DOUBLE PRECISION,
+    -- Counts
+    days_count INTEGER DEFAULT 0,
+    heatwave_days INTEGER DEFAULT 0,
+    dust_storm_days INTEGER DEFAULT 0,
+    rainy_days INTEGER DEFAULT 0,
+    -- Monsoon (June–September vs MONSOON_NORMAL_RAINFALL, pro-rated to date)
+    monsoon_rainfall DOUBLE PRECISION,
+    monsoon_normal_to_date DOUBLE PRECISION,
+    rainfall_departure_pct DOUBLE PRECISION,
+    -- Metadata
+    last_date DATE,
+    rollup_state TEXT,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(city_id, year)
+);
+
+CREATE INDEX IF NOT EXISTS idx_yearly_city_year ON yearly_stats(city_id, year DESC);
+
+ALTER TABLE yearly_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow public read on yearly_stats"
+    ON yearly_stats FOR SELECT
+    USING (true);
+
+CREATE POLICY "Deny public insert on yearly_stats"
+    ON yearly_stats FOR INSERT
+    WITH CHECK (false);
+
+-- ============================================
+-- 14. ALERT DEDUPLICATION (rule engine in backend/alerts.py)
+-- ============================================
+-- Each run looks up active alerts by city/type/day before inserting new ones
+CREATE INDEX IF NOT EXISTS idx_alerts_active_lookup
+    ON alerts(city_id, alert_type, starts_at)
+    WHERE is_active = TRUE;
+
+-- ============================================
+-- 15. RESOLUTION TIERS (backend/tiers.py)
+-- ============================================
+-- Raw 15-minute tier (PIPELINE_MINUTELY_15=1); pruned after 7 days.
+-- weather_data (hourly) is pruned after 90 days only with PIPELINE_PRUNE_HOURLY=1; daily_aggregates is kept.
+CREATE TABLE IF NOT EXISTS weather_data_15min (
+    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+    city_id UUID NOT NULL REFERENCES cities(id) ON DELETE CASCADE,
+    recorded_at TIMESTAMPTZ NOT NULL,
+    temperature_2m DOUBLE PRECISION,
+    apparent_temperature DOUBLE PRECISION,
+    relative_humidity_2m DOUBLE PRECISION,
+    dewpoint_2m DOUBLE PRECISION,
+    precipitation DOUBLE PRECISION DEFAULT 0,
+    rain DOUBLE PRECISION DEFAULT 0,
+    wind_speed_10m DOUBLE PRECISION,
+    wind_direction_10m DOUBLE PRECISION,
+    wind_gusts_10m DOUBLE PRECISION,
+    weather_code INTEGER,
+    visibility DOUBLE PRECISION,
+    is_forecast BOOLEAN DEFAULT FALSE,
+    fetched_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(city_id, recorded_at, is_forecast)
+);
+
+CREATE INDEX IF NOT EXISTS idx_weather_15min_city_time ON weather_data_15min(city_id, recorded_at DESC);
+-- Retention deletes filter on time alone
+CREATE INDEX IF NOT EXISTS idx_weather_15min_recorded ON weather_data_15min(recorded_at);
+CREATE INDEX IF NOT EXISTS idx_weather_recorded ON weather_data(recorded_at);
+CREATE INDEX IF NOT EXISTS idx_aqi_recorded ON air_quality_data(recorded_at);
+
+ALTER TABLE weather_data_15min ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow public read on weather_data_15min"
+    ON weather_data_15min FOR SELECT
+    USING (true);
+
+CREATE POLICY "Deny public insert on weather_data_15min"
+    ON weather_data_15min FOR INSERT
+    WITH CHECK (false);
+
+-- Chart series from the coarsest tier that still gives p_min_points over the
+-- range (and still holds it): daily → hourly → 15-minute.
+-- supabase.rpc('weather_series', { p_city_id, p_from, p_to })
+CREATE OR REPLACE FUNCTION weather_series(
+    p_city_id UUID,
+    p_from TIMESTAMPTZ,
+    p_to TIMESTAMPTZ,
+    p_min_points INTEGER DEFAULT 24
+)
+RETURNS TABLE (
+    recorded_at TIMESTAMPTZ,
+    resolution TEXT,
+    temperature_2m DOUBLE PRECISION,
+    precipitation DOUBLE PRECISION,
+    wind_speed_10m DOUBLE PRECISION,
+    weather_code INTEGER
+)
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    span_hours DOUBLE PRECISION := EXTRACT(EPOCH FROM (p_to - p_from)) / 3600;
+BEGIN
+    IF span_hours / 24 >= p_min_points OR p_from < NOW() - INTERVAL '90 days' THEN
+        RETURN QUERY
+        SELECT d.date::TIMESTAMPTZ, 'daily'::TEXT,
+               COALESCE(d.temp_mean, (d.temp_max + d.temp_min) / 2),
+               d.precipitation_sum, d.wind_speed_max, d.weather_code
+        FROM daily_aggregates d
+        WHERE d.city_id = p_city_id AND d.date BETWEEN p_from::DATE AND p_to::DATE
+        ORDER BY d.date;
+    ELSIF span_hours >= p_min_points
+          OR p_from < NOW() - INTERVAL '7 days'
+          OR NOT EXISTS (SELECT 1 FROM weather_data_15min m
+                         WHERE m.city_id = p_city_id AND m.recorded_at BETWEEN p_from AND p_to) THEN
+        RETURN QUERY
+        SELECT w.recorded_at, 'hourly'::TEXT, w.temperature_2m, w.precipitation, w.wind_speed_10m, w.weather_code
+        FROM weather_data w
+        WHERE w.city_id = p_city_id AND w.recorded_at BETWEEN p_from AND p_to
+        ORDER BY w.recorded_at, w.is_forecast;
+    ELSE
+        RETURN QUERY
+        SELECT m.recorded_at, '15min'::TEXT, m.temperature_2m, m.precipitation, m.wind_speed_10m, m.weather_code
+        FROM weather_data_15min m
+        WHERE m.city_id = p_city_id AND m.recorded_at BETWEEN p_from AND p_to
+        ORDER BY m.recorded_at, m.is_forecast;
+    END IF;
+END;
+$$;
+
+-- ============================================
+-- 16. ANOMALY ALERTS (backend/anomaly.py)
+-- ============================================
+-- Existing databases: allow the 'anomaly' alert type raised by the baseline detector
+ALTER TABLE alerts DROP CONSTRAINT IF EXISTS alerts_alert_type_check;
+ALTER TABLE alerts ADD CONSTRAINT alerts_alert_type_check CHECK (alert_type IN (
+    'heatwave', 'dust_storm', 'heavy_rain', 'poor_aqi',
+    'very_poor_aqi', 'hazardous_aqi', 'cold_wave', 'high_uv',
+    'thunderstorm', 'fog', 'anomaly'
+));
+
+-- ============================================
+-- 17. CITY SNAPSHOT (backend/snapshot.py)
+-- ============================================
+-- One row per city, upserted by the pipeline at the end of each run for the
+-- cities it processed: latest observed weather + AQI hour, today's daily
+-- aggregates and active alert counts. The dashboard reads this instead of
+-- latest_weather / latest_aqi, which scan the hourly tables per city.
+CREATE TABLE IF NOT EXISTS city_snapshot (
+    city_id UUID PRIMARY KEY REFERENCES cities(id) ON DELETE CASCADE,
+    city_name TEXT NOT NULL,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    -- Current weather (latest observed hour)
+    weather_recorded_at TIMESTAMPTZ,
+    temperature_2m DOUBLE PRECISION,
+    apparent_temperature DOUBLE PRECISION,
+    relative_humidity_2m DOUBLE PRECISION,
+    dewpoint_2m DOUBLE PRECISION,
+    precipitation DOUBLE PRECISION,
+    precipitation_probability DOUBLE PRECISION,
+    rain DOUBLE PRECISION,
+    wind_speed_10m DOUBLE PRECISION,
+    wind_direction_10m DOUBLE PRECISION,
+    wind_gusts_10m DOUBLE PRECISION,
+    weather_code INTEGER,
+    cloud_cover DOUBLE PRECISION,
+    visibility DOUBLE PRECISION,
+    surface_pressure DOUBLE PRECISION,
+    uv_index DOUBLE PRECISION,
+    -- Current air quality (latest observed hour)
+    aqi_recorded_at TIMESTAMPTZ,
+    pm2_5 DOUBLE PRECISION,
+    pm10 DOUBLE PRECISION,
+    dust DOUBLE PRECISION,
+    carbon_monoxide DOUBLE PRECISION,
+    nitrogen_dioxide DOUBLE PRECISION,
+    sulphur_dioxide DOUBLE PRECISION,
+    ozone DOUBLE PRECISION,
+    us_aqi DOUBLE PRECISION,
+    european_aqi DOUBLE PRECISION,
+    us_aqi_pm2_5 DOUBLE PRECISION,
+    us_aqi_pm10 DOUBLE PRECISION,
+    -- Today
+    today_date DATE,
+    today_temp_max DOUBLE PRECISION,
+    today_temp_min DOUBLE PRECISION,
+    today_precipitation_sum DOUBLE PRECISION,
+    today_precipitation_probability_max DOUBLE PRECISION,
+    today_uv_index_max DOUBLE PRECISION,
+    today_sunrise TIMESTAMPTZ,
+    today_sunset TIMESTAMPTZ,
+    today_aqi_mean DOUBLE PRECISION,
+    today_aqi_max DOUBLE PRECISION,
+    today_is_heatwave BOOLEAN DEFAULT FALSE,
+    today_is_dust_storm_risk BOOLEAN DEFAULT FALSE,
+    today_is_heavy_rain BOOLEAN DEFAULT FALSE,
+    -- Alerts
+    active_alerts INTEGER DEFAULT 0,
+    top_alert_severity TEXT CHECK (top_alert_severity IN ('low', 'moderate', 'high', 'extreme')),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE city_snapshot ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow public read on city_snapshot"
+    ON city_snapshot FOR SELECT
+    USING (true);
+
+CREATE POLICY "Deny public insert on city_snapshot"
+    ON city_snapshot FOR INSERT
+    WITH CHECK (false);
+
+-- ============================================
+-- 18. DERIVED DAILY METRICS (backend/derived.py)
+-- ============================================
+-- Existing databases: columns computed from hourly weather/AQI in the same
+-- pass as the rest of daily_aggregates (temp_mean is now filled as well)
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS heat_index_max DOUBLE PRECISION;
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS wbgt_max DOUBLE PRECISION;
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS hours_poor_aqi INTEGER;
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS hours_very_poor_aqi INTEGER;
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS hours_hazardous_aqi INTEGER;
+ALTER TABLE daily_aggregates ADD COLUMN IF NOT EXISTS dust_exposure_hours INTEGER;
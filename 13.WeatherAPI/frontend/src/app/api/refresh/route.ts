@@ -8,33 +8,28 @@ import { supabaseServer } from '@/lib/supabase-server';
 
 export async function POST() {
     try {
-        // Simply verify database connectivity and return latest data timestamp
-        const { data: latestWeather, error: weatherError } = await supabaseServer
-            .from('weather_data')
-            .select('recorded_at')
-            .order('fetched_at', { ascending: false })
-            .limit(1)
-            .single();
+        // Verify database connectivity and return the latest data timestamps
+        // from the per-city snapshot rows (one tiny row per city)
+        const { data: snapshots, error } = await supabaseServer
+            .from('city_snapshot')
+            .select('weather_recorded_at, aqi_recorded_at, active_alerts');
 
-        const { data: latestAQI, error: aqiError } = await supabaseServer
-            .from('air_quality_data')
-            .select('recorded_at')
-            .order('fetched_at', { ascending: false })
-            .limit(1)
-            .single();
+        if (error) throw error;
 
-        const { count: alertCount } = await supabaseServer
-            .from('alerts')
-            .select('*', { count: 'exact', head: true })
-            .eq('is_active', true);
+        const latest = (key: 'weather_recorded_at' | 'aqi_recorded_at') =>
+            (snapshots || []).reduce<string | null>(
+                (max, row) => (row[key] && (!max || row[key] > max) ? row[key] : max),
+                null,
+            );
+        const alertCount = (snapshots || []).reduce((sum, row) => sum + (row.active_alerts || 0), 0);
 
         return NextResponse.json({
             success: true,
             message: 'Data status retrieved',
             data: {
-                latest_weather: latestWeather?.recorded_at || null,
-                latest_aqi: latestAQI?.recorded_at || null,
-                active_alerts: alertCount || 0,
+                latest_weather: latest('weather_recorded_at'),
+                latest_aqi: latest('aqi_recorded_at'),
+                active_alerts: alertCount,
                 timestamp: new Date().toISOString(),
             },
         });
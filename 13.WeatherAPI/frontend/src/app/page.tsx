@@ -28,6 +28,7 @@ export default function Dashboard() {
     forecast,
     hourlyData,
     alerts,
+    monsoon,
     loading,
     error,
     lastUpdated,
@@ -96,6 +97,7 @@ export default function Dashboard() {
           <div className="grid-row-insights">
             <MonsoonTracker
               forecast={forecast}
+              monsoon={monsoon}
               cityName={selectedCity?.name || 'Jaipur'}
             />
             <HealthTips aqi={currentAQI} weather={currentWeather} />
@@ -1,6 +1,6 @@
 // ============================================
 // Monsoon Tracker Component
-// Cumulative rainfall vs historical normals
+// Season rainfall vs historical normals (departure comes from the backend rollup)
 // ============================================
 
 'use client';
@@ -16,30 +16,34 @@ import {
     Legend,
     ReferenceLine,
 } from 'recharts';
-import type { DailyAggregate } from '@/lib/types';
+import type { DailyAggregate, MonsoonStats } from '@/lib/types';
 import { MONSOON_NORMALS } from '@/lib/types';
 
 interface MonsoonTrackerProps {
     forecast: DailyAggregate[];
+    monsoon: MonsoonStats | null;
     cityName: string;
 }
 
-export function MonsoonTracker({ forecast, cityName }: MonsoonTrackerProps) {
+export function MonsoonTracker({ forecast, monsoon, cityName }: MonsoonTrackerProps) {
     const normals = MONSOON_NORMALS[cityName];
 
-    // Calculate cumulative rainfall from forecast data
+    // Upcoming rainfall from forecast data
     const cumulativeRain = forecast.reduce((sum, d) => sum + (d.precipitation_sum || 0), 0);
 
-    // Monthly comparison data
+    // Observed season totals and departure are rolled up by the pipeline
+    const departure = monsoon?.rainfall_departure_pct ?? null;
+    const hasSeasonData = departure !== null;
+
+    // Monthly comparison data (Jun–Sep = months 6–9)
     const months = ['June', 'July', 'August', 'September'];
     const currentMonth = new Date().toLocaleString('en-US', { month: 'long' });
-    const isMonsoonSeason = months.includes(currentMonth);
 
     const comparisonData = normals
-        ? months.map((month) => ({
+        ? months.map((month, i) => ({
             month: month.slice(0, 3),
             normal: normals[month] || 0,
-            actual: month === currentMonth ? cumulativeRain : 0,
+            actual: monsoon?.monthly_rainfall[i + 6] ?? 0,
         }))
         : [];
 
@@ -64,12 +68,14 @@ export function MonsoonTracker({ forecast, cityName }: MonsoonTrackerProps) {
                         </div>
                         <div className="monsoon-stat">
                             <span className="monsoon-stat-value">
-                                {isMonsoonSeason
-                                    ? `${((cumulativeRain / (normals[currentMonth] || 1)) * 100).toFixed(0)}%`
+                                {hasSeasonData
+                                    ? `${departure > 0 ? '+' : ''}${departure.toFixed(0)}%`
                                     : '--'}
                             </span>
                             <span className="monsoon-stat-label">
-                                {isMonsoonSeason ? 'vs Normal This Month' : 'Off Season'}
+                                {hasSeasonData
+                                    ? `vs Normal to Date (${(monsoon?.monsoon_rainfall ?? 0).toFixed(0)} mm)`
+                                    : 'Off Season'}
                             </span>
                         </div>
                     </>
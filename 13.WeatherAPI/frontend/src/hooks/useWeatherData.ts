@@ -7,7 +7,7 @@
 
 import { useState, useEffect, useCallback } from 'react';
 import { supabase } from '@/lib/supabase-browser';
-import type { City, WeatherData, AirQualityData, DailyAggregate, Alert } from '@/lib/types';
+import type { City, CitySnapshot, WeatherData, AirQualityData, DailyAggregate, Alert, MonsoonStats } from '@/lib/types';
 
 interface WeatherState {
     cities: City[];
@@ -16,6 +16,7 @@ interface WeatherState {
     forecast: DailyAggregate[];
     hourlyData: WeatherData[];
     alerts: Alert[];
+    monsoon: MonsoonStats | null;
     loading: boolean;
     error: string | null;
     lastUpdated: string | null;
@@ -29,6 +30,7 @@ export function useWeatherData(selectedCityId: string | null) {
         forecast: [],
         hourlyData: [],
         alerts: [],
+        monsoon: null,
         loading: true,
         error: null,
         lastUpdated: null,
@@ -51,42 +53,27 @@ export function useWeatherData(selectedCityId: string | null) {
         }
     }, []);
 
-    // Fetch current weather for a city (latest non-forecast record)
-    const fetchCurrentWeather = useCallback(async (cityId: string) => {
+    // Fetch current weather + AQI for a city (one city_snapshot row)
+    const fetchSnapshot = useCallback(async (cityId: string) => {
         try {
             const { data, error } = await supabase
-                .from('weather_data')
+                .from('city_snapshot')
                 .select('*')
                 .eq('city_id', cityId)
-                .eq('is_forecast', false)
-                .order('recorded_at', { ascending: false })
-                .limit(1)
-                .single();
+                .maybeSingle();
 
-            if (error && error.code !== 'PGRST116') throw error;
-            return data;
+            if (error) throw error;
+            const snapshot = data as CitySnapshot | null;
+            const currentWeather: WeatherData | null = snapshot?.weather_recorded_at
+                ? { ...snapshot, id: snapshot.city_id, recorded_at: snapshot.weather_recorded_at, is_forecast: false }
+                : null;
+            const currentAQI: AirQualityData | null = snapshot?.aqi_recorded_at
+                ? { ...snapshot, id: snapshot.city_id, recorded_at: snapshot.aqi_recorded_at }
+                : null;
+            return { currentWeather, currentAQI };
         } catch (err: unknown) {
-            console.error('Failed to fetch current weather:', err);
-            return null;
-        }
-    }, []);
-
-    // Fetch current AQI
-    const fetchCurrentAQI = useCallback(async (cityId: string) => {
-        try {
-            const { data, error } = await supabase
-                .from('air_quality_data')
-                .select('*')
-                .eq('city_id', cityId)
-                .order('recorded_at', { ascending: false })
-                .limit(1)
-                .single();
-
-            if (error && error.code !== 'PGRST116') throw error;
-            return data;
-        } catch (err: unknown) {
-            console.error('Failed to fetch AQI:', err);
-            return null;
+            console.error('Failed to fetch city snapshot:', err);
+            return { currentWeather: null, currentAQI: null };
         }
     }, []);
 
@@ -160,6 +147,41 @@ export function useWeatherData(selectedCityId: string | null) {
         }
     }, []);
 
+    // Fetch this year's monsoon rollup (season departure + Jun–Sep monthly totals)
+    const fetchMonsoon = useCallback(async (cityId: string) => {
+        try {
+            const year = new Date().getFullYear();
+            const [yearly, monthly] = await Promise.all([
+                supabase
+                    .from('yearly_stats')
+                    .select('year, monsoon_rainfall, monsoon_normal_to_date, rainfall_departure_pct, last_date')
+                    .eq('city_id', cityId)
+                    .eq('year', year)
+                    .maybeSingle(),
+                supabase
+                    .from('historical_stats')
+                    .select('month, total_precipitation')
+                    .eq('city_id', cityId)
+                    .eq('year', year)
+                    .gte('month', 6)
+                    .lte('month', 9),
+            ]);
+
+            if (yearly.error) throw yearly.error;
+            if (monthly.error) throw monthly.error;
+            if (!yearly.data) return null;
+
+            const monthly_rainfall: Record<number, number> = {};
+            for (const row of monthly.data || []) {
+                monthly_rainfall[row.month] = row.total_precipitation ?? 0;
+            }
+            return { ...yearly.data, monthly_rainfall } as MonsoonStats;
+        } catch (err: unknown) {
+            console.error('Failed to fetch monsoon stats:', err);
+            return null;
+        }
+    }, []);
+
     // Main data fetch
     const refreshData = useCallback(async () => {
         setState(prev => ({ ...prev, loading: true, error: null }));
@@ -185,12 +207,12 @@ export function useWeatherData(selectedCityId: string | null) {
             }
 
             // Fetch all data concurrently
-            const [currentWeather, currentAQI, forecast, hourlyData, alerts] = await Promise.all([
-                fetchCurrentWeather(cityId),
-                fetchCurrentAQI(cityId),
+            const [{ currentWeather, currentAQI }, forecast, hourlyData, alerts, monsoon] = await Promise.all([
+                fetchSnapshot(cityId),
                 fetchForecast(cityId),
                 fetchHourlyData(cityId),
                 fetchAlerts(cityId),
+                fetchMonsoon(cityId),
             ]);
 
             setState({
@@ -200,6 +222,7 @@ export function useWeatherData(selectedCityId: string | null) {
                 forecast,
                 hourlyData,
                 alerts,
+                monsoon,
                 loading: false,
                 error: null,
                 lastUpdated: new Date().toISOString(),
@@ -211,7 +234,7 @@ export function useWeatherData(selectedCityId: string | null) {
                 error: err instanceof Error ? err.message : 'Failed to fetch data',
             }));
         }
-    }, [selectedCityId, fetchCities, fetchCurrentWeather, fetchCurrentAQI, fetchForecast, fetchHourlyData, fetchAlerts]);
+    }, [selectedCityId, fetchCities, fetchSnapshot, fetchForecast, fetchHourlyData, fetchAlerts, fetchMonsoon]);
 
     useEffect(() => {
         refreshData();
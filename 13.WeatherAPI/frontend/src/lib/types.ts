@@ -81,6 +81,12 @@ export interface DailyAggregate {
     pm2_5_mean: number | null;
     pm10_mean: number | null;
     dust_mean: number | null;
+    heat_index_max: number | null;
+    wbgt_max: number | null;
+    hours_poor_aqi: number | null;
+    hours_very_poor_aqi: number | null;
+    hours_hazardous_aqi: number | null;
+    dust_exposure_hours: number | null;
     is_heatwave: boolean;
     is_dust_storm_risk: boolean;
     is_heavy_rain: boolean;
@@ -101,6 +107,44 @@ export interface Alert {
     city_name?: string;
 }
 
+// One row per city, refreshed by the pipeline (city_snapshot table)
+export type CitySnapshot =
+    Omit<WeatherData, 'id' | 'recorded_at' | 'is_forecast' | 'city_name' | 'latitude' | 'longitude'> &
+    Omit<AirQualityData, 'id' | 'city_id' | 'recorded_at' | 'city_name'> & {
+        city_name: string;
+        latitude: number;
+        longitude: number;
+        weather_recorded_at: string | null;
+        aqi_recorded_at: string | null;
+        today_date: string | null;
+        today_temp_max: number | null;
+        today_temp_min: number | null;
+        today_precipitation_sum: number | null;
+        today_precipitation_probability_max: number | null;
+        today_uv_index_max: number | null;
+        today_sunrise: string | null;
+        today_sunset: string | null;
+        today_aqi_mean: number | null;
+        today_aqi_max: number | null;
+        today_is_heatwave: boolean;
+        today_is_dust_storm_risk: boolean;
+        today_is_heavy_rain: boolean;
+        active_alerts: number;
+        top_alert_severity: Alert['severity'] | null;
+        updated_at: string;
+    };
+
+// Monsoon-season rollup for the current year (yearly_stats + historical_stats rows)
+export interface MonsoonStats {
+    year: number;
+    monsoon_rainfall: number | null;
+    monsoon_normal_to_date: number | null;
+    rainfall_departure_pct: number | null;
+    last_date: string | null;
+    // total_precipitation per month number (6–9) from historical_stats
+    monthly_rainfall: Record<number, number>;
+}
+
 // AQI Category helpers
 export type AQICategory = 'Good' | 'Moderate' | 'Unhealthy for Sensitive' | 'Unhealthy' | 'Very Unhealthy' | 'Hazardous';
 
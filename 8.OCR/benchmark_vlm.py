@@ -0,0 +1,140 @@
+"""
+Florence-2 Backend Benchmark
+=============================
+Compares the VLM backends (see VLM_BACKEND in ocr_engines.py) on the
+images in samples/: load time, per-image latency, peak memory and field
+accuracy against samples/ground_truth.json.
+
+Images are matched to ground truth by file name (sample_dl_1.jpg ->
+"sample_dl_1"). Each backend runs in its own process so peak RSS is
+measured per backend.
+
+Usage:
+    python benchmark_vlm.py
+    python benchmark_vlm.py --backends torch onnx-int8 --runs 5 --threads 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import multiprocessing
+from typing import Dict, List
+
+from ocr_engines import VLM_BACKENDS
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+
+
+def find_samples(samples_dir: str) -> Dict[str, str]:
+    """Map ground-truth key -> image path for every sample image that has ground truth."""
+    with open(os.path.join(samples_dir, "ground_truth.json")) as f:
+        ground_truth = json.load(f)
+    images = {}
+    for filename in sorted(os.listdir(samples_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() in IMAGE_EXTENSIONS and stem in ground_truth:
+            images[stem] = os.path.join(samples_dir, filename)
+    return images
+
+
+def run_backend(backend: str, samples_dir: str, runs: int, threads: int) -> Dict:
+    """Load one backend and time it on every sample (runs in a child process)."""
+    import ocr_engines
+    if threads:
+        ocr_engines.VLM_THREADS = threads
+    from utils import AccuracyCalculator, ImagePreprocessor, format_dl_fields
+
+    with open(os.path.join(samples_dir, "ground_truth.json")) as f:
+        ground_truth = json.load(f)
+    preprocessor = ImagePreprocessor()
+
+    start = time.perf_counter()
+    engine = ocr_engines.VLMOCREngine(backend=backend)
+    load_seconds = time.perf_counter() - start
+    if engine.model == "ERROR":
+        return {"backend": backend, "error": "model failed to load"}
+
+    latencies, accuracies = [], []
+    for key, path in find_samples(samples_dir).items():
+        with open(path, "rb") as f:
+            image = preprocessor.preprocess_for_vlm(f.read())
+        engine.extract(image)  # warm-up
+        for _ in range(runs):
+            start = time.perf_counter()
+            fields = format_dl_fields(engine.extract(image))
+            latencies.append(time.perf_counter() - start)
+        accuracy = AccuracyCalculator.calculate_field_accuracy(fields, ground_truth[key])
+        accuracies.append(accuracy["accuracy_percent"])
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "mean_latency_seconds": round(statistics.mean(latencies), 3),
+        "median_latency_seconds": round(statistics.median(latencies), 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "accuracy_percent": round(statistics.mean(accuracies), 2),
+    }
+
+
+def _child(queue, *args):
+    try:
+        queue.put(run_backend(*args))
+    except Exception as e:
+        queue.put({"backend": args[0], "error": str(e)})
+
+
+def benchmark(backends: List[str], samples_dir: str, runs: int, threads: int) -> List[Dict]:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in backends:
+        print(f"Benchmarking {backend}...")
+        queue = context.Queue()
+        process = context.Process(target=_child, args=(queue, backend, samples_dir, runs, threads))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+def print_table(results: List[Dict]):
+    print("\n" + "=" * 78)
+    print(f"{'Backend':<12}{'Load (s)':>10}{'Mean (s)':>10}{'Median (s)':>12}{'Peak RSS (MB)':>16}{'Accuracy %':>12}")
+    print("-" * 78)
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<12}  ✗ {r['error']}")
+            continue
+        print(f"{r['backend']:<12}{r['load_seconds']:>10}{r['mean_latency_seconds']:>10}"
+              f"{r['median_latency_seconds']:>12}{r['peak_rss_mb']:>16}{r['accuracy_percent']:>12}")
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Florence-2 backends on the sample DL images")
+    parser.add_argument("--backends", nargs="+", choices=VLM_BACKENDS, default=list(VLM_BACKENDS))
+    parser.add_argument("--samples", default=SAMPLES_DIR, help="directory with images + ground_truth.json")
+    parser.add_argument("--runs", type=int, default=3, help="timed runs per image (after one warm-up)")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = backend default)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    samples = find_samples(args.samples)
+    if not samples:
+        sys.exit(f"✗ No images in {args.samples} match a key in ground_truth.json "
+                 f"(expected e.g. sample_dl_1.jpg)")
+    print(f"Found {len(samples)} sample image(s): {', '.join(samples)}")
+
+    results = benchmark(args.backends, args.samples, args.runs, args.threads)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
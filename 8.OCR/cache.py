@@ -0,0 +1,113 @@
+"""
+OCR Result Cache
+=================
+Content-addressed cache of extraction results (Tesseract fields and
+regions, VLM fields), so the same DL image uploaded again skips Tesseract
+and Florence-2.
+
+Entries are keyed by (image hash, engine version):
+- image hash: SHA-256 of the decoded pixels (utils.image_fingerprint), so
+  the same picture under another file name or with different metadata hits
+- engine version: engine + model + parser version (ocr_engines.engine_versions),
+  so upgrading either approach never serves stale fields
+
+Two tiers: an in-memory LRU in front of a SQLite table that survives
+restarts. Set OCR_CACHE=0 to disable.
+"""
+
+import os
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_PATH = "./results/ocr_cache.db"
+CACHE_ENABLED = os.environ.get("OCR_CACHE", "1") != "0"
+MEMORY_ENTRIES = int(os.environ.get("OCR_CACHE_MEMORY_ENTRIES", 256))
+
+
+class OCRCache:
+    """LRU memory tier over a persistent SQLite tier."""
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, memory_entries: int = MEMORY_ENTRIES,
+                 enabled: bool = CACHE_ENABLED):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self.hits = {"memory": 0, "sqlite": 0}
+        self.misses = 0
+        self._memory: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def open(self):
+        if not self.enabled:
+            return
+        self._db = await aiosqlite.connect(self.db_path)
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                image_hash TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                fields_json TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (image_hash, engine)
+            )
+        ''')
+        await self._db.commit()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def _remember(self, key: Tuple[str, str], result: Dict):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, image_hash: str, engine: str) -> Optional[Dict]:
+        """Cached result for this image and engine version, or None."""
+        if self._db is None:
+            return None
+        key = (image_hash, engine)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits["memory"] += 1
+            return dict(self._memory[key])
+
+        cursor = await self._db.execute(
+            'SELECT fields_json FROM ocr_cache WHERE image_hash = ? AND engine = ?', key
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        result = json.loads(row[0])
+        self._remember(key, result)
+        self.hits["sqlite"] += 1
+        return dict(result)
+
+    async def put(self, image_hash: str, engine: str, result: Dict):
+        """Store what one approach extracted from this image (JSON-serializable)."""
+        if self._db is None:
+            return
+        key = (image_hash, engine)
+        self._remember(key, dict(result))
+        try:
+            await self._db.execute(
+                'INSERT OR REPLACE INTO ocr_cache (image_hash, engine, fields_json, created_at) VALUES (?, ?, ?, ?)',
+                (image_hash, engine, json.dumps(result), datetime.now().isoformat())
+            )
+            await self._db.commit()
+        except Exception as e:
+            # The memory tier still has it; a failed write only costs a future miss
+            logger.warning(f"OCR cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        return {"enabled": self._db is not None, "memory_entries": len(self._memory),
+                "hits": dict(self.hits), "misses": self.misses}
@@ -3,21 +3,45 @@ Database Module for DL OCR Project
 ====================================
 Handles storage of OCR results in both SQLite and JSON formats.
 Provides persistence and querying of past uploads.
+
+All queries share one long-lived aiosqlite connection in WAL mode, opened on
+first use (or by the app at startup). Inserts and deletes are committed in
+batches - after COMMIT_BATCH_SIZE writes or COMMIT_INTERVAL_MS, whichever
+comes first - and JSON sidecar files are written on a worker thread.
+
+Accuracy statistics are kept as running aggregates (ocr_stats,
+ocr_latency_histogram, ocr_field_daily) updated in the same transaction as
+every insert and delete, so /stats never scans ocr_results.
 """
 
-import sqlite3
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import aiosqlite
 import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # Paths
 DB_PATH = "./results/ocr_results.db"
 JSON_RESULTS_DIR = "./results/json"
 
+# Write batching
+COMMIT_BATCH_SIZE = int(os.environ.get("OCR_DB_COMMIT_BATCH", 32))
+COMMIT_INTERVAL_MS = int(os.environ.get("OCR_DB_COMMIT_INTERVAL_MS", 200))
+
+# `winner` text -> indexed winner_approach code (NULL when there was no ground truth)
+WINNER_CODES = {"Approach 1": 1, "Approach 2": 2, "Tie": 0}
+
+# Processing-time histogram upper bounds (ms); slower results go in the overflow bucket (-1)
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000]
+OVERFLOW_BUCKET = -1
+FIELD_TREND_DAYS = 30
+
 
 def ensure_directories():
     """Ensure required directories exist."""
@@ -26,15 +50,16 @@ def ensure_directories():
     Path("./uploads").mkdir(exist_ok=True)
 
 
-def init_database():
-    """Initialize SQLite database with required tables."""
-    ensure_directories()
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create main results table
-    cursor.execute('''
+def winner_code(winner: str) -> Optional[int]:
+    """1 / 2 for the winning approach, 0 for a tie, None otherwise."""
+    for prefix, code in WINNER_CODES.items():
+        if winner and winner.startswith(prefix):
+            return code
+    return None
+
+
+SCHEMA = [
+    '''
         CREATE TABLE IF NOT EXISTS ocr_results (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             image_name TEXT NOT NULL,
@@ -68,6 +93,7 @@ def init_database():
             approach1_accuracy REAL,
             approach2_accuracy REAL,
             winner TEXT,
+            winner_approach INTEGER,
             accuracy_details_json TEXT,
             
             -- Ground Truth (if provided)
@@ -78,19 +104,292 @@ def init_database():
             image_size_bytes INTEGER,
             error_message TEXT
         )
-    ''')
-    
+    ''',
     # Create index for faster queries
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_timestamp ON ocr_results(timestamp)
+    'CREATE INDEX IF NOT EXISTS idx_timestamp ON ocr_results(timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_image_name ON ocr_results(image_name)',
+    # get_accuracy_stats reads ocr_stats now; drop the old covering index from existing databases
+    'DROP INDEX IF EXISTS idx_stats',
+    # Running aggregates over results without an error (see _apply_stats)
+    '''
+        CREATE TABLE IF NOT EXISTS ocr_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_processed INTEGER NOT NULL DEFAULT 0,
+            sum_approach1_accuracy REAL NOT NULL DEFAULT 0,
+            sum_approach2_accuracy REAL NOT NULL DEFAULT 0,
+            approach1_wins INTEGER NOT NULL DEFAULT 0,
+            approach2_wins INTEGER NOT NULL DEFAULT 0,
+            ties INTEGER NOT NULL DEFAULT 0,
+            sum_processing_time_ms INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS ocr_latency_histogram (
+            bucket_ms INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    # Per day, field and approach: how many ground-truth values and their summed similarity
+    '''
+        CREATE TABLE IF NOT EXISTS ocr_field_daily (
+            day TEXT NOT NULL,
+            field TEXT NOT NULL,
+            approach INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            sum_similarity REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, field, approach)
+        )
+    ''',
+]
+
+
+# ============================================
+# Running aggregates
+# ============================================
+def latency_bucket(processing_time_ms: Optional[int]) -> int:
+    """Histogram bucket (upper bound in ms) for a processing time."""
+    for bound in LATENCY_BUCKETS_MS:
+        if (processing_time_ms or 0) <= bound:
+            return bound
+    return OVERFLOW_BUCKET
+
+
+def _field_similarities(accuracy_details) -> List[Tuple[str, int, float]]:
+    """(field, approach, similarity) for every field that had a ground-truth value."""
+    if isinstance(accuracy_details, str):
+        accuracy_details = json.loads(accuracy_details or '{}')
+    rows = []
+    for approach in (1, 2):
+        per_field = (accuracy_details or {}).get(f'approach{approach}', {}).get('per_field', {})
+        for field, metrics in per_field.items():
+            if metrics.get('ground_truth'):
+                rows.append((field, approach, metrics.get('similarity', 0.0)))
+    return rows
+
+
+def _stats_deltas(result: Dict, sign: int):
+    """
+    One result's contribution to the aggregates, negated for a delete.
+
+    Returns:
+        (ocr_stats increments, latency bucket, [(day, field, approach, count, similarity)]),
+        or None for results that aren't counted (error_message set)
+    """
+    if result.get('error_message') is not None:
+        return None
+    winner = result.get('winner_approach')
+    totals = (
+        sign,
+        sign * (result.get('approach1_accuracy') or 0),
+        sign * (result.get('approach2_accuracy') or 0),
+        sign * (winner == 1),
+        sign * (winner == 2),
+        sign * (winner == 0),
+        sign * (result.get('processing_time_ms') or 0),
+    )
+    day = (result.get('timestamp') or '')[:10]
+    fields = [
+        (day, field, approach, sign, sign * similarity)
+        for field, approach, similarity in _field_similarities(result.get('accuracy_details_json'))
+    ]
+    return totals, latency_bucket(result.get('processing_time_ms')), fields
+
+
+async def _apply_stats(db: aiosqlite.Connection, result: Dict, sign: int):
+    """Add (sign=1) or remove (sign=-1) one result row's contribution to the running aggregates."""
+    deltas = _stats_deltas(result, sign)
+    if deltas is None:
+        return
+    totals, bucket, fields = deltas
+    await _write_stats(db, totals, {bucket: sign}, fields)
+
+
+async def _write_stats(db: aiosqlite.Connection, totals, histogram: Dict[int, int], fields):
+    await db.execute('INSERT OR IGNORE INTO ocr_stats (id) VALUES (1)')
+    await db.execute('''
+        UPDATE ocr_stats SET
+            total_processed = total_processed + ?,
+            sum_approach1_accuracy = sum_approach1_accuracy + ?,
+            sum_approach2_accuracy = sum_approach2_accuracy + ?,
+            approach1_wins = approach1_wins + ?,
+            approach2_wins = approach2_wins + ?,
+            ties = ties + ?,
+            sum_processing_time_ms = sum_processing_time_ms + ?
+        WHERE id = 1
+    ''', totals)
+    await db.executemany('''
+        INSERT INTO ocr_latency_histogram (bucket_ms, count) VALUES (?, ?)
+        ON CONFLICT(bucket_ms) DO UPDATE SET count = count + excluded.count
+    ''', list(histogram.items()))
+    await db.executemany('''
+        INSERT INTO ocr_field_daily (day, field, approach, count, sum_similarity) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(day, field, approach) DO UPDATE SET
+            count = count + excluded.count,
+            sum_similarity = sum_similarity + excluded.sum_similarity
+    ''', fields)
+
+
+async def _rebuild_stats(db: aiosqlite.Connection):
+    """Recompute every aggregate from ocr_results (once, when the aggregate tables are created)."""
+    for table in ('ocr_stats', 'ocr_latency_histogram', 'ocr_field_daily'):
+        await db.execute(f'DELETE FROM {table}')
+    totals = [0] * 7
+    histogram: Dict[int, int] = {}
+    fields: Dict[Tuple[str, str, int], List[float]] = {}
+    cursor = await db.execute('''
+        SELECT error_message, approach1_accuracy, approach2_accuracy, winner_approach,
+               processing_time_ms, timestamp, accuracy_details_json
+        FROM ocr_results
     ''')
+    async for row in cursor:
+        deltas = _stats_deltas(dict(row), 1)
+        if deltas is None:
+            continue
+        row_totals, bucket, row_fields = deltas
+        totals = [a + b for a, b in zip(totals, row_totals)]
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+        for day, field, approach, count, similarity in row_fields:
+            entry = fields.setdefault((day, field, approach), [0, 0.0])
+            entry[0] += count
+            entry[1] += similarity
+    await _write_stats(db, totals, histogram, [(*key, count, total) for key, (count, total) in fields.items()])
+    logger.info(f"Built running accuracy statistics from {totals[0]} results")
+
+
+def _percentile(histogram: Dict[int, int], q: float) -> Optional[float]:
+    """q-th percentile (0-1) from histogram buckets, interpolated linearly inside the bucket."""
+    total = sum(histogram.values())
+    if total <= 0:
+        return None
+    target = q * total
+    seen, lower = 0, 0
+    for bound in LATENCY_BUCKETS_MS:
+        count = histogram.get(bound, 0)
+        if count > 0 and seen + count >= target:
+            return round(lower + (bound - lower) * (target - seen) / count, 1)
+        seen += count
+        lower = bound
+    # Overflow bucket has no upper bound: report its lower edge
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+class ResultStore:
+    """One shared aiosqlite connection with WAL and batched commits."""
     
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_image_name ON ocr_results(image_name)
-    ''')
+    def __init__(self, db_path: str = DB_PATH, commit_batch_size: int = COMMIT_BATCH_SIZE,
+                 commit_interval_ms: int = COMMIT_INTERVAL_MS):
+        self.db_path = db_path
+        self.commit_batch_size = commit_batch_size
+        self.commit_interval = commit_interval_ms / 1000
+        self._db: Optional[aiosqlite.Connection] = None
+        self._open_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._pending = 0
+        self._commit_task: Optional[asyncio.Task] = None
+    
+    async def connection(self) -> aiosqlite.Connection:
+        """The shared connection, opened (and the schema created) on first use."""
+        if self._db is None:
+            async with self._open_lock:
+                if self._db is None:
+                    self._db = await self._open()
+        return self._db
+    
+    async def _open(self) -> aiosqlite.Connection:
+        ensure_directories()
+        db = await aiosqlite.connect(self.db_path)
+        db.row_factory = aiosqlite.Row
+        await db.execute('PRAGMA journal_mode=WAL')
+        await db.execute('PRAGMA synchronous=NORMAL')
+        await db.execute('PRAGMA busy_timeout=5000')
+        for statement in SCHEMA[:1]:
+            await db.execute(statement)
+        await self._migrate(db)
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ocr_stats'")
+        has_stats = await cursor.fetchone() is not None
+        for statement in SCHEMA[1:]:
+            await db.execute(statement)
+        if not has_stats:
+            await _rebuild_stats(db)
+        await db.commit()
+        return db
+    
+    async def _migrate(self, db: aiosqlite.Connection):
+        """Add winner_approach to databases created before it existed, backfilled from `winner`."""
+        cursor = await db.execute('PRAGMA table_info(ocr_results)')
+        columns = {row[1] for row in await cursor.fetchall()}
+        if 'winner_approach' in columns:
+            return
+        await db.execute('ALTER TABLE ocr_results ADD COLUMN winner_approach INTEGER')
+        await db.execute('''
+            UPDATE ocr_results SET winner_approach = CASE
+                WHEN winner LIKE 'Approach 1%' THEN 1
+                WHEN winner LIKE 'Approach 2%' THEN 2
+                WHEN winner = 'Tie' THEN 0
+            END
+        ''')
+        logger.info("Migrated ocr_results: added winner_approach")
+    
+    @asynccontextmanager
+    async def write(self):
+        """
+        One atomic write unit on the shared connection.
+
+        Runs as a savepoint inside the current batch transaction, so a result
+        row and its aggregate updates are committed (or rolled back) together
+        without touching other requests' pending writes.
+        """
+        db = await self.connection()
+        async with self._write_lock:
+            if not db.in_transaction:
+                await db.execute('BEGIN')
+            await db.execute('SAVEPOINT write_unit')
+            try:
+                yield db
+            except BaseException:
+                await db.execute('ROLLBACK TO write_unit')
+                await db.execute('RELEASE write_unit')
+                raise
+            await db.execute('RELEASE write_unit')
+        await self.wrote()
+    
+    @asynccontextmanager
+    async def read(self):
+        """The connection, with no write unit half-applied while reading."""
+        db = await self.connection()
+        async with self._write_lock:
+            yield db
+    
+    async def wrote(self):
+        """Count one write; commit now if the batch is full, else within the commit interval."""
+        self._pending += 1
+        if self._pending >= self.commit_batch_size:
+            await self.commit()
+        elif self._commit_task is None:
+            self._commit_task = asyncio.create_task(self._commit_later())
     
-    conn.commit()
-    conn.close()
+    async def _commit_later(self):
+        await asyncio.sleep(self.commit_interval)
+        self._commit_task = None
+        await self.commit()
+    
+    async def commit(self):
+        if self._db is not None and self._pending:
+            async with self._write_lock:
+                self._pending = 0
+                await self._db.commit()
+    
+    async def close(self):
+        if self._commit_task is not None:
+            self._commit_task.cancel()
+            self._commit_task = None
+        if self._db is not None:
+            await self.commit()
+            await self._db.close()
+            self._db = None
+
+
+store = ResultStore()
 
 
 async def save_result_async(
@@ -109,11 +408,10 @@ async def save_result_async(
     Returns:
         Record ID of the saved result
     """
-    ensure_directories()
-    
     timestamp = datetime.now().isoformat()
+    winner = accuracy_result.get('comparison', {}).get('winner', 'Unknown')
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with store.write() as db:
         cursor = await db.execute('''
             INSERT INTO ocr_results (
                 image_name, timestamp,
@@ -125,10 +423,10 @@ async def save_result_async(
                 approach2_doi, approach2_doe, approach2_license_number,
                 approach2_address, approach2_blood_group, approach2_vehicle_class,
                 approach2_raw_json,
-                approach1_accuracy, approach2_accuracy, winner,
+                approach1_accuracy, approach2_accuracy, winner, winner_approach,
                 accuracy_details_json, ground_truth_json,
                 processing_time_ms, image_size_bytes, error_message
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             image_name, timestamp,
             approach1_fields.get('name', ''),
@@ -153,16 +451,24 @@ async def save_result_async(
             json.dumps(approach2_fields),
             accuracy_result.get('approach1', {}).get('accuracy_percent', 0),
             accuracy_result.get('approach2', {}).get('accuracy_percent', 0),
-            accuracy_result.get('comparison', {}).get('winner', 'Unknown'),
+            winner,
+            winner_code(winner),
             json.dumps(accuracy_result),
             json.dumps(ground_truth) if ground_truth else None,
             processing_time_ms,
             image_size_bytes,
             error_message
         ))
-        
-        await db.commit()
         result_id = cursor.lastrowid
+        await _apply_stats(db, {
+            'error_message': error_message,
+            'approach1_accuracy': accuracy_result.get('approach1', {}).get('accuracy_percent', 0),
+            'approach2_accuracy': accuracy_result.get('approach2', {}).get('accuracy_percent', 0),
+            'winner_approach': winner_code(winner),
+            'processing_time_ms': processing_time_ms,
+            'timestamp': timestamp,
+            'accuracy_details_json': accuracy_result,
+        }, 1)
     
     # Also save to JSON file
     await save_result_json(
@@ -187,9 +493,7 @@ async def save_result_json(
     accuracy_result: Dict,
     ground_truth: Optional[Dict[str, str]] = None
 ):
-    """Save result as individual JSON file."""
-    ensure_directories()
-    
+    """Save result as individual JSON file (written on a worker thread, off the event loop)."""
     result = {
         "id": result_id,
         "image_name": image_name,
@@ -205,6 +509,10 @@ async def save_result_json(
     filename = f"{result_id}_{safe_name}_{timestamp.replace(':', '-')[:19]}.json"
     filepath = os.path.join(JSON_RESULTS_DIR, filename)
     
+    await asyncio.to_thread(_write_json, filepath, result)
+
+
+def _write_json(filepath: str, result: Dict):
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(result, f, indent=2, ensure_ascii=False)
 
@@ -220,41 +528,31 @@ async def get_all_results(limit: int = 100, offset: int = 0) -> List[Dict]:
     Returns:
         List of result dictionaries
     """
-    ensure_directories()
+    db = await store.connection()
+    cursor = await db.execute('''
+        SELECT * FROM ocr_results
+        ORDER BY timestamp DESC
+        LIMIT ? OFFSET ?
+    ''', (limit, offset))
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute('''
-            SELECT * FROM ocr_results
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset))
-        
-        rows = await cursor.fetchall()
-        
-        results = []
-        for row in rows:
-            results.append(dict(row))
-        
-        return results
+    rows = await cursor.fetchall()
+    
+    return [dict(row) for row in rows]
 
 
 async def get_result_by_id(result_id: int) -> Optional[Dict]:
     """Get a specific result by ID."""
-    ensure_directories()
+    db = await store.connection()
+    cursor = await db.execute(
+        'SELECT * FROM ocr_results WHERE id = ?',
+        (result_id,)
+    )
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            'SELECT * FROM ocr_results WHERE id = ?',
-            (result_id,)
-        )
-        
-        row = await cursor.fetchone()
-        
-        if row:
-            return dict(row)
-        return None
+    row = await cursor.fetchone()
+    
+    if row:
+        return dict(row)
+    return None
 
 
 async def search_results(
@@ -263,8 +561,6 @@ async def search_results(
     end_date: Optional[str] = None
 ) -> List[Dict]:
     """Search results with filters."""
-    ensure_directories()
-    
     query = "SELECT * FROM ocr_results WHERE 1=1"
     params = []
     
@@ -282,67 +578,80 @@ async def search_results(
     
     query += " ORDER BY timestamp DESC"
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(query, params)
-        rows = await cursor.fetchall()
-        
-        return [dict(row) for row in rows]
+    db = await store.connection()
+    cursor = await db.execute(query, params)
+    rows = await cursor.fetchall()
+    
+    return [dict(row) for row in rows]
 
 
 async def get_accuracy_stats() -> Dict:
-    """Get aggregate accuracy statistics."""
-    ensure_directories()
+    """
+    Get aggregate accuracy statistics from the running aggregates.
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT 
-                COUNT(*) as total_processed,
-                AVG(approach1_accuracy) as avg_approach1,
-                AVG(approach2_accuracy) as avg_approach2,
-                SUM(CASE WHEN winner LIKE '%Approach 1%' THEN 1 ELSE 0 END) as approach1_wins,
-                SUM(CASE WHEN winner LIKE '%Approach 2%' THEN 1 ELSE 0 END) as approach2_wins,
-                SUM(CASE WHEN winner = 'Tie' THEN 1 ELSE 0 END) as ties,
-                AVG(processing_time_ms) as avg_processing_time
-            FROM ocr_results
-            WHERE error_message IS NULL
-        ''')
-        
+    Returns:
+        Totals, average accuracies and wins (results without an error),
+        processing-time percentiles from the latency histogram, and daily
+        per-field average similarity for the last FIELD_TREND_DAYS days
+    """
+    since = (date.today() - timedelta(days=FIELD_TREND_DAYS - 1)).isoformat()
+    async with store.read() as db:
+        cursor = await db.execute('SELECT * FROM ocr_stats WHERE id = 1')
         row = await cursor.fetchone()
-        
-        if row:
-            return {
-                "total_processed": row[0] or 0,
-                "average_accuracy": {
-                    "approach1": round(row[1] or 0, 2),
-                    "approach2": round(row[2] or 0, 2)
-                },
-                "wins": {
-                    "approach1": row[3] or 0,
-                    "approach2": row[4] or 0,
-                    "ties": row[5] or 0
-                },
-                "average_processing_time_ms": round(row[6] or 0, 2)
-            }
-        
-        return {
-            "average_processing_time_ms": 0
-        }
+        cursor = await db.execute('SELECT bucket_ms, count FROM ocr_latency_histogram WHERE count > 0')
+        histogram = {bucket: count for bucket, count in await cursor.fetchall()}
+        cursor = await db.execute('''
+            SELECT day, field, approach, count, sum_similarity FROM ocr_field_daily
+            WHERE day >= ? AND count > 0
+            ORDER BY day
+        ''', (since,))
+        field_rows = await cursor.fetchall()
+    
+    total = row['total_processed'] if row else 0
+    trends: Dict[str, Dict[str, List[Dict]]] = {}
+    for day, field, approach, count, sum_similarity in field_rows:
+        trends.setdefault(field, {"approach1": [], "approach2": []})[f"approach{approach}"].append({
+            "date": day,
+            "average_similarity": round(sum_similarity / count, 4),
+            "samples": count
+        })
+    
+    return {
+        "total_processed": total,
+        "average_accuracy": {
+            "approach1": round(row['sum_approach1_accuracy'] / total, 2) if total else 0,
+            "approach2": round(row['sum_approach2_accuracy'] / total, 2) if total else 0
+        },
+        "wins": {
+            "approach1": row['approach1_wins'] if row else 0,
+            "approach2": row['approach2_wins'] if row else 0,
+            "ties": row['ties'] if row else 0
+        },
+        "average_processing_time_ms": round(row['sum_processing_time_ms'] / total, 2) if total else 0,
+        "processing_time_percentiles_ms": {
+            "p50": _percentile(histogram, 0.50),
+            "p95": _percentile(histogram, 0.95),
+            "p99": _percentile(histogram, 0.99)
+        },
+        "field_accuracy_trends": trends
+    }
 
 
 async def delete_result(result_id: int) -> bool:
-    """Delete a result by ID."""
-    ensure_directories()
-    
+    """Delete a result by ID (and remove it from the running aggregates)."""
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('DELETE FROM ocr_results WHERE id = ?', (result_id,))
-            await db.commit()
-            return cursor.rowcount > 0
+        async with store.write() as db:
+            cursor = await db.execute('''
+                SELECT error_message, approach1_accuracy, approach2_accuracy, winner_approach,
+                       processing_time_ms, timestamp, accuracy_details_json
+                FROM ocr_results WHERE id = ?
+            ''', (result_id,))
+            row = await cursor.fetchone()
+            if row is None:
+                return False
+            await db.execute('DELETE FROM ocr_results WHERE id = ?', (result_id,))
+            await _apply_stats(db, dict(row), -1)
+        return True
     except Exception as e:
         print(f"Error deleting result {result_id}: {e}")
         return False
-
-
-# Initialize database on module import
-init_database()
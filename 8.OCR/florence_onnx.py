@@ -0,0 +1,191 @@
+"""
+Florence-2 on ONNX Runtime
+===========================
+CPU backend for VLMOCREngine (VLM_BACKEND=onnx / onnx-int8).
+
+Uses the split ONNX export of Florence-2 (onnx-community layout):
+vision_encoder, embed_tokens, encoder_model and decoder_model_merged.
+The processor and tokenizer still come from transformers; only the
+forward passes run under ONNX Runtime, with a greedy decode loop that
+keeps the decoder KV cache between steps.
+
+The int8 variant uses the `*_quantized.onnx` files; if a local export
+only has float32 files, they are quantized once with ONNX Runtime's
+dynamic int8 quantization and saved next to the originals.
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ONNX_REPO = os.environ.get("VLM_ONNX_REPO", "onnx-community/Florence-2-base")
+ONNX_DIR = os.environ.get("VLM_ONNX_DIR", "")     # local export; downloaded from ONNX_REPO if empty
+PARTS = ["vision_encoder", "embed_tokens", "encoder_model", "decoder_model_merged"]
+
+
+def _session_options(threads: int):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # One model call at a time on the VLM thread: spend every core inside the op
+    options.intra_op_num_threads = threads or (os.cpu_count() or 1)
+    options.inter_op_num_threads = 1
+    return options
+
+
+def _model_path(part: str, quantized: bool) -> str:
+    """Local path of one ONNX part, downloading or quantizing it if needed."""
+    name = f"{part}_quantized.onnx" if quantized else f"{part}.onnx"
+    if ONNX_DIR:
+        path = os.path.join(ONNX_DIR, name)
+        if not os.path.exists(path) and quantized:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            source = os.path.join(ONNX_DIR, f"{part}.onnx")
+            logger.info(f"Quantizing {source} to int8...")
+            quantize_dynamic(source, path, weight_type=QuantType.QInt8)
+        return path
+
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(ONNX_REPO, name, subfolder="onnx")
+
+
+class Florence2OnnxModel:
+    """
+    Greedy Florence-2 generation over ONNX Runtime sessions.
+
+    Mirrors the decoding the torch path gets from the model's generation
+    config (decoder start </s>, forced <s> first token, no repeated
+    3-grams), so the two backends can be compared on accuracy.
+    """
+
+    def __init__(
+        self,
+        quantized: bool = False,
+        threads: int = 0,
+        decoder_start_token_id: int = 2,
+        forced_bos_token_id: Optional[int] = 0,
+        eos_token_id: int = 2,
+        pad_token_id: int = 1,
+        no_repeat_ngram_size: int = 3,
+    ):
+        import onnxruntime as ort
+
+        options = _session_options(threads)
+        self.sessions = {
+            part: ort.InferenceSession(_model_path(part, quantized), options, providers=["CPUExecutionProvider"])
+            for part in PARTS
+        }
+        self.quantized = quantized
+        self.threads = options.intra_op_num_threads
+        self.decoder_start_token_id = decoder_start_token_id
+        self.forced_bos_token_id = forced_bos_token_id
+        self.eos_token_id = eos_token_id
+        self.pad_token_id = pad_token_id
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+
+        decoder = self.sessions["decoder_model_merged"]
+        self._decoder_inputs = {i.name: i for i in decoder.get_inputs()}
+        self._decoder_outputs = [o.name for o in decoder.get_outputs()]
+        self._past_names = [name for name in self._decoder_inputs if name.startswith("past_key_values")]
+
+    # ----------------------------------------
+    # Forward passes
+    # ----------------------------------------
+    def _embed(self, input_ids: np.ndarray) -> np.ndarray:
+        return self.sessions["embed_tokens"].run(None, {"input_ids": input_ids.astype(np.int64)})[0]
+
+    def _encode(self, input_ids: np.ndarray, pixel_values: np.ndarray, attention_mask: np.ndarray):
+        """Image features + prompt embeddings through the encoder; returns (hidden states, mask)."""
+        image_features = self.sessions["vision_encoder"].run(
+            None, {"pixel_values": pixel_values.astype(np.float32)}
+        )[0]
+        inputs_embeds = np.concatenate([image_features, self._embed(input_ids)], axis=1)
+        mask = np.concatenate(
+            [np.ones(image_features.shape[:2], dtype=np.int64), attention_mask.astype(np.int64)], axis=1
+        )
+        hidden = self.sessions["encoder_model"].run(
+            None, {"inputs_embeds": inputs_embeds, "attention_mask": mask}
+        )[0]
+        return hidden, mask
+
+    def _empty_past(self, batch: int) -> Dict[str, np.ndarray]:
+        past = {}
+        for name in self._past_names:
+            shape = self._decoder_inputs[name].shape
+            heads = shape[1] if isinstance(shape[1], int) else 12
+            head_dim = shape[3] if isinstance(shape[3], int) else 64
+            past[name] = np.zeros((batch, heads, 0, head_dim), dtype=np.float32)
+        return past
+
+    # ----------------------------------------
+    # Decoding
+    # ----------------------------------------
+    def _banned_ngrams(self, tokens: List[int]) -> List[int]:
+        """Tokens that would complete an n-gram already present in `tokens`."""
+        n = self.no_repeat_ngram_size
+        if n <= 0 or len(tokens) < n:
+            return []
+        prefix = tuple(tokens[-(n - 1):]) if n > 1 else ()
+        return [tokens[i + n - 1] for i in range(len(tokens) - n + 1) if tuple(tokens[i:i + n - 1]) == prefix]
+
+    def generate(
+        self,
+        input_ids: np.ndarray,
+        pixel_values: np.ndarray,
+        attention_mask: Optional[np.ndarray] = None,
+        max_new_tokens: int = 1024,
+    ) -> np.ndarray:
+        """
+        Greedy generation for a batch of prompts/images.
+
+        Returns:
+            Token ids (batch x length) starting with the decoder start token,
+            padded with pad_token_id after each sequence's </s>
+        """
+        batch = input_ids.shape[0]
+        if attention_mask is None:
+            attention_mask = np.ones_like(input_ids)
+        hidden, mask = self._encode(input_ids, pixel_values, attention_mask)
+
+        tokens = np.full((batch, 1), self.decoder_start_token_id, dtype=np.int64)
+        past = self._empty_past(batch)
+        finished = np.zeros(batch, dtype=bool)
+
+        for step in range(max_new_tokens):
+            feed = {
+                "encoder_attention_mask": mask,
+                "encoder_hidden_states": hidden,
+                "inputs_embeds": self._embed(tokens[:, -1:]),
+                **past,
+            }
+            if "use_cache_branch" in self._decoder_inputs:
+                feed["use_cache_branch"] = np.array([step > 0])
+            outputs = dict(zip(self._decoder_outputs, self.sessions["decoder_model_merged"].run(None, feed)))
+
+            # Encoder cross-attention keys are fixed after the first step; only the self-attention cache grows
+            for name in self._past_names:
+                if step == 0 or ".decoder." in name:
+                    past[name] = outputs[name.replace("past_key_values", "present")]
+
+            logits = outputs["logits"][:, -1, :].astype(np.float32)
+            if step == 0 and self.forced_bos_token_id is not None:
+                next_tokens = np.full(batch, self.forced_bos_token_id, dtype=np.int64)
+            else:
+                for row in range(batch):
+                    banned = self._banned_ngrams(tokens[row].tolist())
+                    if banned:
+                        logits[row, banned] = -np.inf
+                next_tokens = logits.argmax(axis=-1)
+
+            next_tokens = np.where(finished, self.pad_token_id, next_tokens)
+            tokens = np.concatenate([tokens, next_tokens[:, None]], axis=1)
+            finished |= next_tokens == self.eos_token_id
+            if finished.all():
+                break
+        return tokens
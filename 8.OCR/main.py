@@ -1,30 +1,125 @@
 """
 DL OCR FastAPI Application - Main Entry Point
 """
+import io
 import os
 import time
+import asyncio
+import zipfile
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 import json
-import base64
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 import uvicorn
 
-from utils import ImagePreprocessor, AccuracyCalculator, validate_image, format_dl_fields
-from ocr_engines import get_traditional_engine, get_vlm_engine
-from database import save_result_async, get_all_results, get_result_by_id, get_accuracy_stats, ensure_directories
+from utils import AccuracyCalculator
+from processing import OCRWorkers, EMPTY_FIELDS
+from cache import OCRCache
+from database import store, save_result_async, get_all_results, get_result_by_id, get_accuracy_stats
 
 # HF Inference API used for VLM - set token if available
 # set HF_TOKEN=your_huggingface_token  (in terminal before running)
-ensure_directories()
 
-app = FastAPI(title="DL OCR Comparison API", version="1.0.0")
+MAX_BATCH_IMAGES = int(os.environ.get("OCR_MAX_BATCH_IMAGES", 100))
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+MAX_BATCH_BYTES = int(os.environ.get("OCR_MAX_BATCH_MB", 200)) * 1024 * 1024  # uncompressed, across all images
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+workers = OCRWorkers()
+ocr_cache = OCRCache()
+# Images of one /batch in flight at once: enough to keep the CPU pool and a full VLM batch busy
+BATCH_CONCURRENCY = int(os.environ.get("OCR_BATCH_CONCURRENCY", 0)) or workers.cpu_workers + workers.vlm_batcher.max_batch
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workers.start()
+    await store.connection()  # creates results/ and the schema
+    await ocr_cache.open()
+    yield
+    await ocr_cache.close()
+    await store.close()
+    workers.shutdown()
+
+
+app = FastAPI(title="DL OCR Comparison API", version="1.0.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 app.mount("/frontend", StaticFiles(directory="frontend"), name="frontend")
-preprocessor = ImagePreprocessor()
+
+
+class InvalidImage(ValueError):
+    """Upload failed validation (reported as 400 / a per-image error)."""
+
+
+async def process_image(image_name: str, file_bytes: bytes, ground_truth_dict: Dict, use_vlm: bool,
+                        include_image: bool = True) -> Dict:
+    """
+    Validate, run both approaches concurrently (CPU pool + VLM worker), score and save one image.
+
+    Fields already extracted from the same image by the same engine version come
+    from the OCR cache; every call still records its own result row.
+    """
+    start_time = time.time()
+    image, error_msg, image_hash = await workers.load(file_bytes)
+    if image is None:
+        raise InvalidImage(error_msg)
+    engines = await workers.engine_versions()
+    approach1 = await ocr_cache.get(image_hash, engines["traditional"])
+    approach2_fields = await ocr_cache.get(image_hash, engines["vlm"]) if use_vlm else {k: '' for k in EMPTY_FIELDS}
+    cached = {"approach1": approach1 is not None, "approach2": use_vlm and approach2_fields is not None}
+    inputs = await workers.prepare(image, approach1 is None, approach2_fields is None, include_image)
+    del image  # release the full-size pixels before waiting on the engines
+    pending = {}
+    if "approach1" in inputs:
+        pending["approach1"] = workers.traditional(inputs.pop("approach1"))
+    if "approach2" in inputs:
+        pending["approach2"] = workers.vlm(inputs.pop("approach2"))
+    done = dict(zip(pending, await asyncio.gather(*pending.values())))
+    done.update(inputs)
+    if "approach1" in done:
+        approach1 = done["approach1"]
+        if "error" not in approach1:
+            await ocr_cache.put(image_hash, engines["traditional"], approach1)
+    approach1_fields = approach1["fields"]
+    if "approach2" in done:
+        approach2_fields = done["approach2"]
+        if "error" not in approach2_fields:
+            await ocr_cache.put(image_hash, engines["vlm"], approach2_fields)
+    accuracy_result = {"approach1": {"accuracy_percent": 0}, "approach2": {"accuracy_percent": 0}, "comparison": {"winner": "No ground truth"}}
+    if ground_truth_dict:
+        accuracy_result = AccuracyCalculator.compare_approaches(approach1_fields, approach2_fields, ground_truth_dict)
+    processing_time_ms = int((time.time() - start_time) * 1000)
+    result_id = await save_result_async(image_name, approach1_fields, approach2_fields, accuracy_result, ground_truth_dict or None, processing_time_ms, len(file_bytes))
+    result = {"success": True, "result_id": result_id, "image_name": image_name}
+    if include_image:
+        result["image_base64"] = done["image_base64"]
+    result.update({"approach1": {"name": "Pytesseract (Traditional)", "fields": approach1_fields,
+                                 "confidence": approach1.get("confidence"), "regions": approach1.get("regions", [])},
+                   "approach2": {"name": "VLM (HF API)", "fields": approach2_fields},
+                   "accuracy": accuracy_result, "processing_time_ms": processing_time_ms, "cached": cached})
+    return result
+
+
+def list_zip_images(data: bytes) -> Optional[List[zipfile.ZipInfo]]:
+    """Image entries of a zip archive (nothing is decompressed), or None if the upload is not a zip."""
+    if not zipfile.is_zipfile(io.BytesIO(data)):
+        return None
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return [info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def extract_images(name: str, data: bytes, entries: Optional[List[zipfile.ZipInfo]]) -> List[tuple]:
+    """(image_name, bytes) pairs from one uploaded file; zip archives are expanded to their listed images."""
+    if entries is None:
+        return [(name, data)]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        # Oversized entries are not read (None); they are reported as failed images
+        return [(info.filename, archive.read(info) if info.file_size <= MAX_IMAGE_BYTES else None) for info in entries]
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -32,46 +127,79 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "cache": ocr_cache.stats()}
 
 @app.post("/upload")
-async def upload_and_process(file: UploadFile = File(...), ground_truth: Optional[str] = Form(None), use_vlm: bool = Form(True)):
-    start_time = time.time()
+async def upload_and_process(file: UploadFile = File(...), ground_truth: Optional[str] = Form(None), use_vlm: bool = Form(True),
+                             include_image: bool = Form(True)):
     file_bytes = await file.read()
-    file_size = len(file_bytes)
-    is_valid, error_msg = validate_image(file_bytes)
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=error_msg)
     try:
         ground_truth_dict = json.loads(ground_truth) if ground_truth else {}
-        preprocessed_img, original_img = preprocessor.preprocess(file_bytes)
-        traditional_engine = get_traditional_engine()
-        approach1_raw = traditional_engine.extract(preprocessed_img, original_img)
-        approach1_fields = format_dl_fields(approach1_raw)
-        approach2_fields = {k: '' for k in ['name','date_of_birth','issued_by','date_of_issue','date_of_expiry','license_number','address','blood_group','vehicle_class']}
-        if use_vlm:
-            try:
-                vlm_image = preprocessor.preprocess_for_vlm(file_bytes)
-                vlm_engine = get_vlm_engine()
-                approach2_raw = vlm_engine.extract(vlm_image)
-                approach2_fields = format_dl_fields(approach2_raw)
-            except Exception as e:
-                approach2_fields['error'] = str(e)
-        accuracy_result = {"approach1": {"accuracy_percent": 0}, "approach2": {"accuracy_percent": 0}, "comparison": {"winner": "No ground truth"}}
-        if ground_truth_dict:
-            accuracy_result = AccuracyCalculator.compare_approaches(approach1_fields, approach2_fields, ground_truth_dict)
-        processing_time_ms = int((time.time() - start_time) * 1000)
-        import cv2
-        _, buffer = cv2.imencode('.jpg', original_img)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-        result_id = await save_result_async(file.filename, approach1_fields, approach2_fields, accuracy_result, ground_truth_dict or None, processing_time_ms, file_size)
-        return {"success": True, "result_id": result_id, "image_name": file.filename, "image_base64": image_base64,
-                "approach1": {"name": "Pytesseract (Traditional)", "fields": approach1_fields},
-                "approach2": {"name": "VLM (HF API)", "fields": approach2_fields},
-                "accuracy": accuracy_result, "processing_time_ms": processing_time_ms}
+        return await process_image(file.filename, file_bytes, ground_truth_dict, use_vlm, include_image)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/batch")
+async def batch_process(files: List[UploadFile] = File(...), ground_truth: Optional[str] = Form(None),
+                        use_vlm: bool = Form(True), include_image: bool = Form(False)):
+    """
+    OCR many images (or zip archives of images) in one request.
+
+    `ground_truth` is either one field dict applied to every image or a dict
+    keyed by image name. Results stream back as NDJSON, one line per image in
+    completion order, followed by a summary line.
+    """
+    try:
+        ground_truth_dict = json.loads(ground_truth) if ground_truth else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ground_truth must be JSON")
+    per_image = bool(ground_truth_dict) and all(isinstance(v, dict) for v in ground_truth_dict.values())
+
+    # Count and size every image from the zip directories before inflating any of them
+    uploads = []
+    for upload in files:
+        data = await upload.read()
+        uploads.append((upload.filename, data, await asyncio.to_thread(list_zip_images, data)))
+    count = sum(1 if entries is None else len(entries) for _, _, entries in uploads)
+    total_bytes = sum(len(data) if entries is None else sum(info.file_size for info in entries if info.file_size <= MAX_IMAGE_BYTES)
+                      for _, data, entries in uploads)
+    if not count:
+        raise HTTPException(status_code=400, detail="No images found in the upload")
+    if count > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per batch, got {count}")
+    if total_bytes > MAX_BATCH_BYTES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_BYTES // (1024 * 1024)}MB of images per batch, "
+                                                    f"got {total_bytes // (1024 * 1024)}MB")
+    images = []
+    for name, data, entries in uploads:
+        images.extend(await asyncio.to_thread(extract_images, name, data, entries))
+
+    in_flight = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(name: str, data: bytes) -> Dict:
+        gt = ground_truth_dict.get(name, ground_truth_dict.get(os.path.basename(name), {})) if per_image else ground_truth_dict
+        try:
+            if data is None:
+                raise InvalidImage(f"File size exceeds maximum allowed ({MAX_IMAGE_BYTES // (1024 * 1024)}MB)")
+            async with in_flight:
+                return await process_image(name, data, gt, use_vlm, include_image)
+        except Exception as e:
+            return {"success": False, "image_name": name, "error": str(e)}
+
+    async def stream():
+        start_time = time.time()
+        succeeded = 0
+        for finished in asyncio.as_completed([run_one(name, data) for name, data in images]):
+            result = await finished
+            succeeded += result["success"]
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": {"images": len(images), "succeeded": succeeded, "failed": len(images) - succeeded,
+                                      "processing_time_ms": int((time.time() - start_time) * 1000)}}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/results")
 async def get_results(limit: int = Query(50), offset: int = Query(0)):
     results = await get_all_results(limit, offset)
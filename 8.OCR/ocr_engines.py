@@ -2,7 +2,8 @@
 OCR Engines for DL Text Extraction
 ====================================
 Two approaches:
-1. Traditional: Pytesseract (local, offline)
+1. Traditional: Tesseract (local, offline) - tesserocr API handles kept
+   loaded per worker, or Pytesseract if tesserocr isn't installed
 2. VLM: Vision model via Hugging Face API
 """
 
@@ -14,11 +15,14 @@ import re
 import json
 import base64
 import io
-from typing import Dict
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
 import logging
 from dotenv import load_dotenv
 import requests
-import torch
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,6 +32,26 @@ logger = logging.getLogger(__name__)
 
 # Lazy loading
 _pytesseract = None
+_tesserocr = None
+
+# Tesseract: language, threads for region OCR in this process, region cap.
+# Region threads do the parallelism, so keep Tesseract's own OpenMP single-threaded.
+# The API sizes this per worker process (processing.REGION_THREADS); a standalone
+# engine gets every core.
+TESSERACT_LANG = os.environ.get("TESSERACT_LANG", "eng")
+OCR_REGION_THREADS = int(os.environ.get("OCR_REGION_THREADS", 0)) or os.cpu_count() or 1
+MAX_TEXT_REGIONS = 64
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Florence-2 backend: torch (float32/float16), torch-int8 (dynamic int8
+# quantized Linear layers), onnx or onnx-int8 (ONNX Runtime, CPU)
+VLM_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+VLM_BACKEND = os.environ.get("VLM_BACKEND", "torch")
+VLM_THREADS = int(os.environ.get("VLM_THREADS", 0))   # intra-op threads; 0 = library default
+VLM_MODEL_ID = "microsoft/Florence-2-base"
+
+# Bump when parse_from_raw_text changes, so cached fields are re-extracted
+PARSER_VERSION = 1
 
 
 def get_pytesseract():
@@ -43,6 +67,94 @@ def get_pytesseract():
     return _pytesseract
 
 
+def get_tesserocr():
+    """Lazy load tesserocr (Tesseract C API bindings); None if it isn't installed."""
+    global _tesserocr
+    if _tesserocr is None:
+        try:
+            import tesserocr
+            _tesserocr = tesserocr
+        except ImportError:
+            _tesserocr = False
+    return _tesserocr or None
+
+
+class TesseractAPIPool:
+    """
+    Tesseract API handles that live as long as the worker process.
+
+    Each handle loads the language model once; threads borrow one per region
+    instead of starting a tesseract process per call.
+    """
+
+    def __init__(self, size: int = OCR_REGION_THREADS, lang: str = TESSERACT_LANG):
+        self.size = size
+        self.lang = lang
+        self._free = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        try:
+            api = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                self._created += create
+            if create:
+                try:
+                    tesserocr = get_tesserocr()
+                    api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM.SINGLE_BLOCK)
+                except BaseException:
+                    # Give the slot back, or waiters would block on a handle that never exists
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._free.get()
+        try:
+            yield api
+        finally:
+            self._free.put(api)
+
+
+def detect_text_regions(binary: np.ndarray, max_regions: int = MAX_TEXT_REGIONS) -> List[Tuple[int, int, int, int]]:
+    """
+    Find text blocks on a binarized page.
+
+    Ink is smeared horizontally so the characters of a line merge into one
+    blob, and each blob's bounding box becomes a region.
+
+    Returns:
+        (x, y, w, h) boxes in reading order; the whole image if nothing is found
+    """
+    height, width = binary.shape[:2]
+    # Text is dark on a light background after Otsu; make it the foreground
+    ink = cv2.bitwise_not(binary) if np.mean(binary) > 127 else binary
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 50, 9), 3))
+    blobs = cv2.dilate(ink, kernel, iterations=2)
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < 12 or h < 8:
+            continue  # specks
+        pad = 4
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        boxes.append((x0, y0, min(x + w + pad, width) - x0, min(y + h + pad, height) - y0))
+    if not boxes:
+        return [(0, 0, width, height)]
+    if len(boxes) > max_regions:
+        # Noisy photo: keep the largest blobs, the rest are mostly texture
+        boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)[:max_regions]
+
+    # Reading order: rows of roughly one line height, then left to right
+    line_height = max(int(np.median([b[3] for b in boxes])), 1)
+    return sorted(boxes, key=lambda b: ((b[1] + b[3] // 2) // line_height, b[0]))
+
+
 def parse_from_raw_text(raw_text: str) -> Dict[str, str]:
     """
     Common regex-based parsing logic for raw OCR text.
@@ -91,15 +203,21 @@ def parse_from_raw_text(raw_text: str) -> Dict[str, str]:
 
 class TraditionalOCREngine:
     """
-    Approach 1: Pytesseract - Raw image, NO preprocessing
+    Approach 1: Tesseract on the preprocessed (binarized, deskewed) image.
+    Text regions are detected first and OCR'd in parallel, each with its own confidence.
     """
     
-    def __init__(self):
+    def __init__(self, region_threads: int = OCR_REGION_THREADS):
         self.pytesseract = None
+        self.tesserocr = get_tesserocr()
+        self.backend = "tesserocr" if self.tesserocr else "pytesseract"
+        self.api_pool = TesseractAPIPool(region_threads) if self.tesserocr else None
+        self.region_pool = ThreadPoolExecutor(max_workers=region_threads, thread_name_prefix="tesseract")
+        logger.info(f"Tesseract backend: {self.backend} ({region_threads} region threads)")
     
     def extract(self, preprocessed_image: np.ndarray, original_image: np.ndarray) -> Dict[str, str]:
-        """Extract ALL text using Pytesseract on raw image."""
-        if self.pytesseract is None:
+        """Extract ALL text region by region from the preprocessed image."""
+        if self.pytesseract is None and self.tesserocr is None:
             self.pytesseract = get_pytesseract()
         
         extracted_fields = {
@@ -109,57 +227,90 @@ class TraditionalOCREngine:
         }
         
         try:
-            # Just run Tesseract on raw image - no preprocessing
-            raw_text = self.pytesseract.image_to_string(original_image)
-            logger.info(f"Tesseract raw output:\n{raw_text}")
+            boxes = detect_text_regions(preprocessed_image)
+            results = list(self.region_pool.map(lambda box: self._ocr_region(preprocessed_image, box), boxes))
+            regions = [
+                {"box": list(box), "text": text, "confidence": confidence}
+                for box, (text, confidence) in zip(boxes, results) if text
+            ]
+            raw_text = "\n".join(region["text"] for region in regions)
+            logger.info(f"Tesseract raw output ({len(regions)} regions):\n{raw_text}")
             
             # Use common parsing logic
             extracted_fields = parse_from_raw_text(raw_text)
+            extracted_fields['regions'] = regions
+            extracted_fields['confidence'] = round(
+                sum(r["confidence"] for r in regions) / len(regions), 2
+            ) if regions else 0.0
             
         except Exception as e:
             logger.error(f"Tesseract error: {e}")
             extracted_fields['error'] = str(e)
         
         return extracted_fields
+    
+    def _ocr_region(self, image: np.ndarray, box: Tuple[int, int, int, int]) -> Tuple[str, float]:
+        """OCR one region as a single text block; returns (text, mean word confidence 0-100)."""
+        x, y, w, h = box
+        crop = np.ascontiguousarray(image[y:y + h, x:x + w])
+        if self.api_pool is not None:
+            with self.api_pool.acquire() as api:
+                api.SetImageBytes(crop.tobytes(), w, h, 1, w)
+                return api.GetUTF8Text().strip(), float(api.MeanTextConf())
+        
+        data = self.pytesseract.image_to_data(
+            crop, lang=TESSERACT_LANG, config="--psm 6", output_type=self.pytesseract.Output.DICT
+        )
+        lines: Dict[Tuple[int, int, int], List[str]] = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if not word.strip() or confidence < 0:
+                continue
+            lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+            confidences.append(confidence)
+        text = "\n".join(" ".join(words) for words in lines.values())
+        return text, round(sum(confidences) / len(confidences), 2) if confidences else 0.0
 
 
 class VLMOCREngine:
     """
     Approach 2: Local VLM using Microsoft Florence-2
     Native Transformer model - fixed for _supports_sdpa error.
+    Runs on PyTorch or ONNX Runtime, picked by VLM_BACKEND.
     """
     
-    def __init__(self):
+    def __init__(self, backend: str = None):
         self.processor = None
         self.model = None
-        self.model_id = "microsoft/Florence-2-base" 
-        logger.info("Initializing Florence-2 Engine...")
+        self.model_id = VLM_MODEL_ID
+        self.backend = backend or VLM_BACKEND
+        if self.backend not in VLM_BACKENDS:
+            raise ValueError(f"Unknown VLM_BACKEND '{self.backend}', expected one of {VLM_BACKENDS}")
+        # KV cache during generation (VLM_USE_CACHE=0 disables)
+        self.use_cache = os.environ.get("VLM_USE_CACHE", "1") != "0"
+        logger.info(f"Initializing Florence-2 Engine ({self.backend})...")
         self._load_model()
 
     def _load_model(self):
-        """Load Florence-2 with eager attention to bypass errors."""
+        """Load Florence-2 on the configured backend (eager attention on torch to bypass errors)."""
         try:
-            from transformers import AutoProcessor, AutoModelForCausalLM
+            from transformers import AutoProcessor
             
             logger.info(f"Loading local model: {self.model_id}...")
             print(f"DEBUG: Starting download/load of {self.model_id}...")
             
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            dtype = torch.float16 if device == "cuda" else torch.float32
-            
-            # Use attn_implementation="eager" to fix the _supports_sdpa error
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_id, 
-                trust_remote_code=True,
-                dtype=dtype,
-                attn_implementation="eager"
-            ).to(device)
+            if self.backend.startswith("onnx"):
+                from florence_onnx import Florence2OnnxModel
+                self.model = Florence2OnnxModel(quantized=self.backend == "onnx-int8", threads=VLM_THREADS)
+            else:
+                self.model = self._load_torch_model()
             print("DEBUG: Model loaded.")
             
             self.processor = AutoProcessor.from_pretrained(self.model_id, trust_remote_code=True)
             print("DEBUG: Processor loaded.")
             
-            logger.info("Local Florence-2 model loaded successfully!")
+            logger.info(f"Local Florence-2 model loaded successfully ({self.backend})!")
         except Exception as e:
             import traceback
             error_trace = traceback.format_exc()
@@ -167,59 +318,120 @@ class VLMOCREngine:
             print(f"CRITICAL ERROR LOADING MODEL:\n{error_trace}")
             self.model = "ERROR"
 
+    def _load_torch_model(self):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if VLM_THREADS:
+            torch.set_num_threads(VLM_THREADS)
+        quantize = self.backend == "torch-int8"
+        # Dynamic int8 quantization is CPU-only
+        device = "cuda" if torch.cuda.is_available() and not quantize else "cpu"
+        dtype = torch.float16 if device == "cuda" else torch.float32
+        
+        # Use attn_implementation="eager" to fix the _supports_sdpa error
+        model = AutoModelForCausalLM.from_pretrained(
+            self.model_id, 
+            trust_remote_code=True,
+            dtype=dtype,
+            attn_implementation="eager"
+        ).to(device)
+        if quantize:
+            # Linear weights to int8, activations quantized on the fly
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model.eval()
+
     def extract(self, image: Image.Image) -> Dict[str, str]:
         """Extract text using Florence-2."""
+        return self.extract_many([image])[0]
+
+    def extract_many(self, images: List[Image.Image]) -> List[Dict[str, str]]:
+        """
+        Extract text from several images with one batched forward pass.
+
+        The processor resizes every image to the model's input size, so the
+        pixel_values stack into one batch; the (identical) prompts are padded
+        together and a single `generate` call decodes all of them with the
+        KV cache on.
+
+        Returns:
+            One parsed field dict per image, in input order
+        """
         if self.model == "ERROR" or self.model is None:
-             return self._demo_output("Model Load Failed")
+            return [self._demo_output("Model Load Failed") for _ in images]
+        if not images:
+            return []
 
         try:
             # Ensure RGB
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            
-            device = self.model.device
-            dtype = self.model.dtype
-            
+            images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+
             # Task for OCR
             task_prompt = "<OCR>"
-            
-            # Prepare inputs
-            inputs = self.processor(text=task_prompt, images=image, return_tensors="pt").to(device, dtype)
-            
-            # Config for generation
-            generated_ids = self.model.generate(
-                input_ids=inputs["input_ids"],
-                pixel_values=inputs["pixel_values"],
-                max_new_tokens=1024,
-                num_beams=1,
-                do_sample=False,
-                use_cache=False,
-                early_stopping=False
-            )
-            
-            # Decode output
-            generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-            
-            # Post-process (Florence returns task + answer, usually)
-            parsed_answer = self.processor.post_process_generation(
-                generated_text, 
-                task=task_prompt, 
-                image_size=(image.width, image.height)
-            )
-            
-            # parsed_answer for <OCR> is usually simple text or dict
-            raw_text = parsed_answer.get('<OCR>', '') if isinstance(parsed_answer, dict) else str(parsed_answer)
-            
-            logger.info(f"Florence-2 Full Output: {raw_text}")
-            
-            # Parse metrics
-            return parse_from_raw_text(raw_text)
+
+            # Prepare inputs (numpy for ONNX Runtime, tensors on the model's device for torch)
+            if self.backend.startswith("onnx"):
+                inputs = self.processor(
+                    text=[task_prompt] * len(images), images=images, return_tensors="np", padding=True
+                )
+            else:
+                inputs = self.processor(
+                    text=[task_prompt] * len(images), images=images, return_tensors="pt", padding=True
+                ).to(self.model.device, self.model.dtype)
+
+            generated_ids = self._generate(inputs)
+
+            # Decode all outputs together
+            generated_texts = self.processor.batch_decode(generated_ids, skip_special_tokens=False)
+
+            results = []
+            for image, generated_text in zip(images, generated_texts):
+                # Post-process (Florence returns task + answer, usually)
+                parsed_answer = self.processor.post_process_generation(
+                    generated_text,
+                    task=task_prompt,
+                    image_size=(image.width, image.height)
+                )
+
+                # parsed_answer for <OCR> is usually simple text or dict
+                raw_text = parsed_answer.get('<OCR>', '') if isinstance(parsed_answer, dict) else str(parsed_answer)
+                logger.info(f"Florence-2 Full Output: {raw_text}")
+
+                # Parse metrics
+                results.append(parse_from_raw_text(raw_text))
+            return results
 
         except Exception as e:
             logger.error(f"Florence-2 inference error: {e}")
             import traceback
             traceback.print_exc()
-            return self._demo_output(str(e))
+            return [self._demo_output(str(e)) for _ in images]
+
+    def _generate(self, inputs):
+        """Greedy generation with the KV cache, falling back to no cache if this transformers version rejects it."""
+        if self.backend.startswith("onnx"):
+            return self.model.generate(
+                input_ids=inputs["input_ids"],
+                pixel_values=inputs["pixel_values"],
+                attention_mask=inputs.get("attention_mask"),
+                max_new_tokens=1024
+            )
+        kwargs = dict(
+            input_ids=inputs["input_ids"],
+            pixel_values=inputs["pixel_values"],
+            max_new_tokens=1024,
+            num_beams=1,
+            do_sample=False,
+            early_stopping=False
+        )
+        if self.use_cache:
+            try:
+                return self.model.generate(**kwargs, use_cache=True)
+            except (AttributeError, TypeError, ValueError) as e:
+                # Some Florence-2 remote-code / transformers pairs break on past_key_values
+                logger.warning(f"Florence-2 generate with KV cache failed ({e}); continuing without cache")
+                self.use_cache = False
+        return self.model.generate(**kwargs, use_cache=False)
 
     def _demo_output(self, reason: str) -> Dict[str, str]:
         return {
@@ -229,15 +441,31 @@ class VLMOCREngine:
         }
 
 
+def engine_versions() -> Dict[str, str]:
+    """Version string per approach (engine, model and parser), used in OCR cache keys."""
+    try:
+        tesserocr = get_tesserocr()
+        if tesserocr:
+            tesseract = f"{tesserocr.tesseract_version().split()[1]}/tesserocr"
+        else:
+            tesseract = f"{get_pytesseract().get_tesseract_version()}/pytesseract"
+    except Exception:
+        tesseract = "unknown"
+    return {
+        "traditional": f"tesseract-{tesseract}/{TESSERACT_LANG}/regions/parser-{PARSER_VERSION}",
+        "vlm": f"{VLM_MODEL_ID}/{VLM_BACKEND}/parser-{PARSER_VERSION}",
+    }
+
+
 # Singleton instances
 _traditional_engine = None
 _vlm_engine = None
 
 
-def get_traditional_engine() -> TraditionalOCREngine:
+def get_traditional_engine(region_threads: int = OCR_REGION_THREADS) -> TraditionalOCREngine:
     global _traditional_engine
     if _traditional_engine is None:
-        _traditional_engine = TraditionalOCREngine()
+        _traditional_engine = TraditionalOCREngine(region_threads)
     return _traditional_engine
 
 
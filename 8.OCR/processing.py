@@ -0,0 +1,255 @@
+"""
+Worker Pools for DL OCR Processing
+===================================
+Keeps CPU-heavy work off the FastAPI event loop:
+
+1. Decode threads: each upload is validated and decoded exactly once
+   (utils.DecodedImage); every later step works from those pixels
+2. CPU pool: preprocessing and Tesseract in worker processes, sent only the
+   resized grayscale image rather than the upload bytes; each worker OCRs
+   the text regions of its image on REGION_THREADS threads (cores / workers)
+3. Model worker: one thread that owns the VLM, fed by a micro-batching
+   queue so concurrent uploads share one forward pass (up to
+   VLM_MAX_BATCH images, waiting at most VLM_MAX_WAIT_MS for a batch to fill)
+
+Each worker process builds its own preprocessor and Tesseract engine once
+and reuses them for every image it handles.
+"""
+
+import os
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils import MAX_OCR_WIDTH, DecodedImage, image_fingerprint, load_image
+
+logger = logging.getLogger(__name__)
+
+CPU_WORKERS = int(os.environ.get("OCR_CPU_WORKERS", os.cpu_count() or 2))
+# Tesseract threads (and API handles) per CPU worker. Sized with the pool so
+# workers x threads stays about one per core; set both to trade images in
+# parallel (more workers) against latency per image (more threads).
+REGION_THREADS = int(os.environ.get("OCR_REGION_THREADS", 0)) or max(1, (os.cpu_count() or 1) // CPU_WORKERS)
+THUMBNAIL_MAX_SIDE = int(os.environ.get("OCR_THUMBNAIL_MAX_SIDE", 1024))
+VLM_MAX_BATCH = int(os.environ.get("VLM_MAX_BATCH", 4))
+VLM_MAX_WAIT_MS = float(os.environ.get("VLM_MAX_WAIT_MS", 50))
+
+EMPTY_FIELDS = ['name', 'date_of_birth', 'issued_by', 'date_of_issue', 'date_of_expiry',
+                'license_number', 'address', 'blood_group', 'vehicle_class']
+
+# Per-process state, created lazily inside each worker
+_preprocessor = None
+
+
+def _get_preprocessor():
+    global _preprocessor
+    if _preprocessor is None:
+        from utils import ImagePreprocessor
+        _preprocessor = ImagePreprocessor()
+    return _preprocessor
+
+
+# ============================================
+# Decode threads (in the server process)
+# ============================================
+def load_upload(file_bytes: bytes) -> Tuple[Optional[DecodedImage], str, Optional[str]]:
+    """Validate and decode an upload once; returns (image or None, message, image fingerprint)."""
+    image, message = load_image(file_bytes)
+    return image, message, image_fingerprint(image) if image is not None else None
+
+
+def make_thumbnail(image: DecodedImage) -> str:
+    """Base64 JPEG of the image, scaled down to THUMBNAIL_MAX_SIDE, for the response preview."""
+    return base64.b64encode(image.resized(THUMBNAIL_MAX_SIDE).to_jpeg()).decode('utf-8')
+
+
+def prepare_inputs(image: DecodedImage, traditional: bool, vlm: bool, thumbnail: bool) -> Dict:
+    """
+    Derive what each requested step needs from the full-size image.
+
+    Returns:
+        Dict with the resized grayscale array for Tesseract ("approach1"), the
+        VLM-sized PIL image or an Exception ("approach2") and the base64
+        thumbnail ("image_base64"); none of them refers to the full-size pixels
+    """
+    inputs = {}
+    if traditional:
+        inputs["approach1"] = image.resized_to_width(MAX_OCR_WIDTH).gray
+    if vlm:
+        try:
+            inputs["approach2"] = _get_preprocessor().preprocess_for_vlm(image)
+        except Exception as e:
+            inputs["approach2"] = e
+    if thumbnail:
+        inputs["image_base64"] = make_thumbnail(image)
+    return inputs
+
+
+# ============================================
+# CPU pool tasks (run in worker processes)
+# ============================================
+def run_engine_versions() -> Dict[str, str]:
+    from ocr_engines import engine_versions
+    return engine_versions()
+
+
+def run_traditional(gray: np.ndarray, region_threads: int = REGION_THREADS) -> Dict:
+    """
+    Preprocess one (resized, grayscale) image and run Approach 1 (Tesseract) on it.
+
+    Returns:
+        Dict with the formatted `fields`, the OCR'd text `regions` (box, text,
+        confidence), their mean `confidence`, and `error` if Tesseract failed
+    """
+    from ocr_engines import get_traditional_engine
+    from utils import format_dl_fields
+
+    preprocessed_img = _get_preprocessor().preprocess_gray(gray)
+    raw = get_traditional_engine(region_threads).extract(preprocessed_img, gray)
+    result = {"fields": format_dl_fields(raw), "regions": raw.get('regions', []), "confidence": raw.get('confidence', 0.0)}
+    if 'error' in raw:
+        result["error"] = raw['error']
+    return result
+
+
+# ============================================
+# Model worker (runs on the single VLM thread)
+# ============================================
+def run_vlm_batch(images: list) -> List[Dict[str, str]]:
+    """Run Approach 2 (VLM) on a batch of PIL images; errors are reported in the fields."""
+    from ocr_engines import get_vlm_engine
+    from utils import format_dl_fields
+
+    try:
+        results = []
+        for raw in get_vlm_engine().extract_many(images):
+            fields = format_dl_fields(raw)
+            if 'note' in raw:
+                # Placeholder output from a model that failed to load or run
+                fields['error'] = raw.get('raw_text', '')
+            results.append(fields)
+        return results
+    except Exception as e:
+        return [{**{k: '' for k in EMPTY_FIELDS}, 'error': str(e)} for _ in images]
+
+
+class VLMBatcher:
+    """
+    Micro-batching queue in front of the VLM.
+
+    The first queued image opens a batch; it is sent to the model thread as
+    soon as `max_batch` images are waiting or `max_wait_ms` has passed, and
+    each caller gets its own result back.
+    """
+
+    def __init__(self, max_batch: int = VLM_MAX_BATCH, max_wait_ms: float = VLM_MAX_WAIT_MS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.images = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vlm")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    async def submit(self, image) -> Dict[str, str]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Callers that went away (client disconnected) don't need a slot
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self._executor, run_vlm_batch, [image for image, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for (_, future), fields in zip(batch, results):
+                if not future.done():
+                    future.set_result(fields)
+
+
+class OCRWorkers:
+    """Decode threads, a process pool for preprocessing + Tesseract and a micro-batched queue for the VLM."""
+
+    def __init__(self, cpu_workers: int = CPU_WORKERS, region_threads: int = REGION_THREADS):
+        self.cpu_workers = cpu_workers
+        self.region_threads = region_threads
+        self.cpu_pool: Optional[ProcessPoolExecutor] = None
+        # Bounds how many uploads are decoded/resized at once, not how many stay in memory:
+        # callers keep only the smaller prepare() outputs while they wait for the engines
+        self.decode_pool: Optional[ThreadPoolExecutor] = None
+        self.vlm_batcher = VLMBatcher()
+        self._engine_versions: Optional[Dict[str, str]] = None
+
+    def start(self):
+        self.cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        self.decode_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="decode")
+        self.vlm_batcher.start()
+        logger.info(f"OCR workers started: {self.cpu_workers} CPU processes x {self.region_threads} Tesseract threads, 1 VLM worker "
+                    f"(batches of up to {self.vlm_batcher.max_batch})")
+
+    def shutdown(self):
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(cancel_futures=True)
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown(cancel_futures=True)
+        self.vlm_batcher.stop()
+
+    async def load(self, file_bytes: bytes) -> Tuple[Optional[DecodedImage], str, Optional[str]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.decode_pool, load_upload, file_bytes)
+
+    async def prepare(self, image: DecodedImage, traditional: bool, vlm: bool, thumbnail: bool) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.decode_pool, prepare_inputs, image, traditional, vlm, thumbnail)
+
+    async def engine_versions(self) -> Dict[str, str]:
+        """Engine version per approach, looked up once in a worker (where Tesseract lives)."""
+        if self._engine_versions is None:
+            loop = asyncio.get_running_loop()
+            self._engine_versions = await loop.run_in_executor(self.cpu_pool, run_engine_versions)
+        return self._engine_versions
+
+    async def traditional(self, gray: np.ndarray) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.cpu_pool, run_traditional, gray, self.region_threads)
+
+    async def vlm(self, vlm_image) -> Dict[str, str]:
+        """Approach 2 fields for a prepared VLM image (or the Exception preparing it raised)."""
+        if isinstance(vlm_image, Exception):
+            return {**{k: '' for k in EMPTY_FIELDS}, 'error': str(vlm_image)}
+        return await self.vlm_batcher.submit(vlm_image)
@@ -0,0 +1,82 @@
+"""
+Tests for the running accuracy aggregates
+=========================================
+"""
+
+import json
+
+import pytest
+
+from database import LATENCY_BUCKETS_MS, OVERFLOW_BUCKET, _percentile, _stats_deltas, latency_bucket
+
+
+def test_percentile_empty_histogram():
+    assert _percentile({}, 0.5) is None
+    assert _percentile({100: 0}, 0.5) is None
+
+
+def test_percentile_interpolates_inside_bucket():
+    # 10 results in (0, 100] ms: the median sits halfway through the bucket
+    assert _percentile({100: 10}, 0.5) == 50.0
+    # 5 in (0, 100], 5 in (100, 250]: p90 is 4/5 of the way through the second bucket
+    assert _percentile({100: 5, 250: 5}, 0.9) == 220.0
+
+
+def test_percentile_skips_empty_buckets():
+    assert _percentile({100: 0, 1000: 4}, 0.5) == 750.0
+
+
+def test_percentile_overflow_reports_lower_edge():
+    assert _percentile({OVERFLOW_BUCKET: 3}, 0.95) == float(LATENCY_BUCKETS_MS[-1])
+
+
+def test_latency_bucket_bounds():
+    assert latency_bucket(None) == LATENCY_BUCKETS_MS[0]
+    assert latency_bucket(100) == 100
+    assert latency_bucket(101) == 250
+    assert latency_bucket(LATENCY_BUCKETS_MS[-1] + 1) == OVERFLOW_BUCKET
+
+
+RESULT = {
+    'error_message': None,
+    'approach1_accuracy': 0.8,
+    'approach2_accuracy': 0.6,
+    'winner_approach': 1,
+    'processing_time_ms': 420,
+    'timestamp': '2024-05-01T10:00:00',
+    'accuracy_details_json': json.dumps({
+        'approach1': {'per_field': {
+            'name': {'ground_truth': 'Priya Sharma', 'similarity': 0.9},
+            'blood_group': {'ground_truth': '', 'similarity': 0.0},
+        }},
+        'approach2': {'per_field': {'name': {'ground_truth': 'Priya Sharma', 'similarity': 0.7}}},
+    }),
+}
+
+
+def test_stats_deltas_insert():
+    totals, bucket, fields = _stats_deltas(RESULT, 1)
+    assert totals == (1, 0.8, 0.6, 1, 0, 0, 420)
+    assert bucket == 500
+    # Fields without a ground-truth value are not counted
+    assert sorted(fields) == [('2024-05-01', 'name', 1, 1, 0.9), ('2024-05-01', 'name', 2, 1, 0.7)]
+
+
+@pytest.mark.parametrize('winner', [0, 1, 2, None])
+def test_stats_deltas_delete_cancels_insert(winner):
+    result = {**RESULT, 'winner_approach': winner}
+    added_totals, added_bucket, added_fields = _stats_deltas(result, 1)
+    removed_totals, removed_bucket, removed_fields = _stats_deltas(result, -1)
+
+    assert removed_bucket == added_bucket
+    assert all(a + r == 0 for a, r in zip(added_totals, removed_totals))
+    for added, removed in zip(added_fields, removed_fields):
+        assert added[:3] == removed[:3]
+        assert added[3] + removed[3] == 0
+        assert added[4] + removed[4] == 0
+
+
+def test_stats_deltas_ignores_failed_results():
+    failed = {**RESULT, 'error_message': 'Invalid image format'}
+    assert _stats_deltas(failed, 1) is None
+    assert _stats_deltas(failed, -1) is None
@@ -0,0 +1,97 @@
+"""
+Tests for region detection and the Tesseract handle pool
+========================================================
+"""
+
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+import ocr_engines
+from ocr_engines import TesseractAPIPool, detect_text_regions
+
+
+def page(width: int = 800, height: int = 400) -> np.ndarray:
+    """White binarized page, as produced by Otsu thresholding."""
+    return np.full((height, width), 255, dtype=np.uint8)
+
+
+def write(binary: np.ndarray, text: str, x: int, y: int):
+    cv2.putText(binary, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+
+
+def test_blank_page_is_one_region():
+    assert detect_text_regions(page()) == [(0, 0, 800, 400)]
+
+
+def test_regions_in_reading_order():
+    binary = page()
+    write(binary, 'DRIVING LICENCE', 40, 80)
+    write(binary, 'Name', 40, 200)
+    write(binary, 'Priya Sharma', 450, 200)
+    write(binary, 'DOB 22-03-1992', 40, 320)
+
+    boxes = detect_text_regions(binary)
+
+    assert len(boxes) == 4
+    centers = [y + h // 2 for _, y, _, h in boxes]
+    # Top to bottom by line, left to right within the 'Name  Priya Sharma' line
+    assert centers[0] < min(centers[1:3]) and max(centers[1:3]) < centers[3]
+    assert boxes[1][0] < boxes[2][0]
+    for x, y, w, h in boxes:
+        assert x >= 0 and y >= 0 and w > 0 and h > 0
+        assert x + w <= 800 and y + h <= 400
+
+
+def test_dark_background_is_inverted():
+    binary = page()
+    write(binary, 'VEHICLE CLASS', 40, 200)
+    assert detect_text_regions(binary) == detect_text_regions(cv2.bitwise_not(binary))
+
+
+def test_specks_are_ignored():
+    binary = page()
+    binary[100:103, 100:103] = 0
+    assert detect_text_regions(binary) == [(0, 0, 800, 400)]
+
+
+def test_max_regions_keeps_largest():
+    binary = page(800, 800)
+    for row in range(10):
+        write(binary, 'X' * (row + 1), 20, 60 + row * 70)
+    boxes = detect_text_regions(binary, max_regions=3)
+    assert len(boxes) == 3
+    widths = sorted(w for _, _, w, _ in boxes)
+    assert widths[0] > 0.6 * max(widths)
+
+
+@pytest.fixture
+def fake_tesserocr(monkeypatch):
+    """tesserocr stand-in whose first handle fails to build."""
+    built = []
+
+    class FakeAPI:
+        def __init__(self, lang, psm):
+            if not built:
+                built.append(None)
+                raise RuntimeError('Failed to init API, possibly an invalid tessdata path')
+            built.append(self)
+
+    module = types.SimpleNamespace(PyTessBaseAPI=FakeAPI, PSM=types.SimpleNamespace(SINGLE_BLOCK=6))
+    monkeypatch.setattr(ocr_engines, 'get_tesserocr', lambda: module)
+    return built
+
+
+def test_pool_releases_slot_when_handle_fails(fake_tesserocr):
+    pool = TesseractAPIPool(size=1)
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            pass
+    # The failed build must not use up the only slot (acquire would block forever)
+    assert pool._created == 0
+    with pool.acquire() as api:
+        assert api is fake_tesserocr[-1]
+    with pool.acquire() as again:
+        assert again is api
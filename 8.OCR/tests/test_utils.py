@@ -0,0 +1,66 @@
+"""
+Tests for the shared decoded image
+==================================
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from utils import DecodedImage
+
+
+def make_image(width: int, height: int) -> DecodedImage:
+    return DecodedImage(np.zeros((height, width, 3), dtype=np.uint8))
+
+
+@pytest.mark.parametrize('width, height', [(4000, 3000), (3000, 4000), (1600, 1600), (5000, 7)])
+def test_resized_fits_max_side(width, height):
+    small = make_image(width, height).resized(1024)
+    assert max(small.width, small.height) <= 1024
+    assert min(small.width, small.height) >= 1
+
+
+def test_resized_keeps_aspect_ratio():
+    small = make_image(4000, 3000).resized(1000)
+    assert (small.width, small.height) == (1000, 750)
+
+
+@pytest.mark.parametrize('max_side', [1024, 1025, 5000])
+def test_resized_returns_self_when_small_enough(max_side):
+    image = make_image(1024, 768)
+    assert image.resized(max_side) is image
+
+
+def test_resized_is_cached_per_size():
+    image = make_image(4000, 3000)
+    assert image.resized(800) is image.resized(800)
+    assert image.resized(800) is not image.resized(400)
+
+
+def test_resized_to_width():
+    image = make_image(3000, 4000)
+    narrow = image.resized_to_width(1500)
+    assert narrow.width <= 1500
+    assert image.resized_to_width(3000) is image
+
+
+def test_rgb_is_a_view_of_bgr():
+    bgr = np.zeros((2, 2, 3), dtype=np.uint8)
+    bgr[..., 0] = 255  # blue
+    image = DecodedImage(bgr)
+    assert np.shares_memory(image.rgb, image.bgr)
+    assert image.rgb[0, 0].tolist() == [0, 0, 255]
+
+
+def test_from_bytes_rejects_garbage():
+    with pytest.raises(ValueError):
+        DecodedImage.from_bytes(b'not an image')
+
+
+def test_from_bytes_round_trip():
+    ok, png = cv2.imencode('.png', np.full((5, 7, 3), 128, dtype=np.uint8))
+    assert ok
+    image = DecodedImage.from_bytes(png.tobytes())
+    assert (image.width, image.height) == (7, 5)
+    assert image.gray.shape == (5, 7)
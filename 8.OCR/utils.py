@@ -14,9 +14,9 @@ Preprocessing Pipeline:
 import cv2
 import numpy as np
 from PIL import Image
-import io
 import difflib
-from typing import Dict, Tuple, Optional
+import hashlib
+from typing import Dict, Tuple, Optional, Union
 import Levenshtein
 import math
 import warnings
@@ -24,6 +24,75 @@ import warnings
 warnings.filterwarnings("ignore")
 
 
+MAX_OCR_WIDTH = 1920     # Tesseract input width (speed optimization, target <5s per image)
+MAX_VLM_SIDE = 1024      # VLM input size (memory optimization)
+
+
+class DecodedImage:
+    """
+    An uploaded image decoded once, shared by every step of the pipeline.
+
+    Holds the 8-bit BGR pixels from a single cv2.imdecode. Variants are
+    derived on first use and cached: the RGB variant is a view (no copy),
+    grayscale is converted once, and resized copies are only made when the
+    image is actually larger than the requested size.
+    """
+
+    def __init__(self, bgr: np.ndarray):
+        self.bgr = bgr
+        self._gray: Optional[np.ndarray] = None
+        self._resized: Dict[int, "DecodedImage"] = {}
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes) -> "DecodedImage":
+        bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError("Invalid image format - could not decode image")
+        return cls(bgr)
+
+    @property
+    def width(self) -> int:
+        return self.bgr.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.bgr.shape[0]
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """RGB view of the same pixels (channel axis reversed, nothing copied)."""
+        return self.bgr[:, :, ::-1]
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def resized(self, max_side: int) -> "DecodedImage":
+        """This image scaled down so its longer side is at most max_side (itself if already small enough)."""
+        scale = max_side / max(self.width, self.height)
+        if scale >= 1:
+            return self
+        if max_side not in self._resized:
+            size = (max(int(self.width * scale), 1), max(int(self.height * scale), 1))
+            self._resized[max_side] = DecodedImage(cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA))
+        return self._resized[max_side]
+
+    def resized_to_width(self, max_width: int) -> "DecodedImage":
+        """This image scaled down to at most max_width wide (itself if already narrow enough)."""
+        if self.width <= max_width:
+            return self
+        return self.resized(int(max(self.width, self.height) * max_width / self.width))
+
+    def to_pil(self) -> Image.Image:
+        return Image.fromarray(np.ascontiguousarray(self.rgb))
+
+    def to_jpeg(self, quality: int = 85) -> bytes:
+        _, buffer = cv2.imencode('.jpg', self.bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes()
+
+
 class ImagePreprocessor:
     """
     Handles all image preprocessing for DL images.
@@ -34,32 +103,27 @@ class ImagePreprocessor:
         # CLAHE for contrast enhancement
         self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
     
-    def preprocess(self, image_bytes: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    def preprocess(self, image: Union[bytes, DecodedImage]) -> Tuple[np.ndarray, np.ndarray]:
         """
         Main preprocessing pipeline.
         
         Args:
-            image_bytes: Raw image bytes from upload
+            image: Raw image bytes from upload, or the already decoded image
             
         Returns:
             Tuple of (preprocessed_image, original_image) as numpy arrays
         """
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        original = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if original is None:
-            raise ValueError("Invalid image format - could not decode image")
-        
-        # Create a copy for processing
-        processed = original.copy()
-        
-        # Step 1: Resize if too large (for speed optimization)
-        processed = self._resize_if_needed(processed)
+        if not isinstance(image, DecodedImage):
+            image = DecodedImage.from_bytes(image)
         
+        # Step 1: Resize if too large (for speed optimization); the original is never modified
         # Step 2: Convert to grayscale
-        gray = cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY)
+        gray = image.resized_to_width(MAX_OCR_WIDTH).gray
         
+        return self.preprocess_gray(gray), image.bgr
+    
+    def preprocess_gray(self, gray: np.ndarray) -> np.ndarray:
+        """Steps 3-7 of the pipeline on an already resized grayscale image."""
         # Step 3: Noise reduction
         denoised = cv2.GaussianBlur(gray, (3, 3), 0)
         
@@ -77,19 +141,7 @@ class ImagePreprocessor:
         kernel = np.ones((1, 1), np.uint8)
         cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
         
-        return cleaned, original
-    
-    def _resize_if_needed(self, image: np.ndarray, max_width: int = 1920) -> np.ndarray:
-        """
-        Resize image if width exceeds max_width to improve processing speed.
-        Target: <5s per image processing time.
-        """
-        height, width = image.shape[:2]
-        if width > max_width:
-            scale = max_width / width
-            new_height = int(height * scale)
-            return cv2.resize(image, (max_width, new_height), interpolation=cv2.INTER_AREA)
-        return image
+        return cleaned
     
     def _deskew(self, image: np.ndarray) -> np.ndarray:
         """
@@ -131,25 +183,16 @@ class ImagePreprocessor:
             # If deskewing fails, return original
             return image
     
-    def preprocess_for_vlm(self, image_bytes: bytes) -> Image.Image:
+    def preprocess_for_vlm(self, image: Union[bytes, DecodedImage]) -> Image.Image:
         """
         Lighter preprocessing for VLM models (OlmOCR).
         VLMs handle preprocessing internally, so we just ensure proper format.
         """
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        if not isinstance(image, DecodedImage):
+            image = DecodedImage.from_bytes(image)
         
-        # Resize if too large (VLM memory optimization)
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        return image
+        # Resize if too large (VLM memory optimization), then RGB
+        return image.resized(MAX_VLM_SIDE).to_pil()
 
 
 class AccuracyCalculator:
@@ -292,9 +335,9 @@ class AccuracyCalculator:
         }
 
 
-def validate_image(file_bytes: bytes, max_size_mb: int = 5) -> Tuple[bool, str]:
+def load_image(file_bytes: bytes, max_size_mb: int = 5) -> Tuple[Optional[DecodedImage], str]:
     """
-    Validate uploaded image file.
+    Validate an uploaded image file and decode it (once).
     
     Checks:
     - File size (max 5MB)
@@ -302,33 +345,54 @@ def validate_image(file_bytes: bytes, max_size_mb: int = 5) -> Tuple[bool, str]:
     - Minimum dimensions
     
     Returns:
-        Tuple of (is_valid, error_message)
+        Tuple of (decoded image or None if invalid, message)
     """
     # Check file size
     size_mb = len(file_bytes) / (1024 * 1024)
     if size_mb > max_size_mb:
-        return False, f"File size ({size_mb:.2f}MB) exceeds maximum allowed ({max_size_mb}MB)"
+        return None, f"File size ({size_mb:.2f}MB) exceeds maximum allowed ({max_size_mb}MB)"
     
     if size_mb < 0.001:  # Less than 1KB
-        return False, "File appears to be empty or too small"
+        return None, "File appears to be empty or too small"
     
     # Try to decode image
     try:
-        nparr = np.frombuffer(file_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return False, "Invalid image format - could not decode image"
-        
-        # Check minimum dimensions
-        height, width = image.shape[:2]
-        if width < 100 or height < 100:
-            return False, f"Image dimensions ({width}x{height}) too small"
-        
-        return True, "Valid image"
-        
+        image = DecodedImage.from_bytes(file_bytes)
+    except ValueError as e:
+        return None, str(e)
     except Exception as e:
-        return False, f"Image validation error: {str(e)}"
+        return None, f"Image validation error: {str(e)}"
+    
+    # Check minimum dimensions
+    if image.width < 100 or image.height < 100:
+        return None, f"Image dimensions ({image.width}x{image.height}) too small"
+    
+    return image, "Valid image"
+
+
+def validate_image(file_bytes: bytes, max_size_mb: int = 5) -> Tuple[bool, str]:
+    """
+    Validate uploaded image file.
+    
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    image, message = load_image(file_bytes, max_size_mb)
+    return image is not None, message
+
+
+def image_fingerprint(image: Union[bytes, DecodedImage]) -> str:
+    """
+    SHA-256 of the decoded image (8-bit BGR pixels plus shape).
+
+    Hashing pixels rather than file bytes means a re-saved copy with other
+    metadata, or the same picture losslessly converted, gets the same key.
+    """
+    if not isinstance(image, DecodedImage):
+        image = DecodedImage.from_bytes(image)
+    digest = hashlib.sha256(str(image.bgr.shape).encode())
+    digest.update(np.ascontiguousarray(image.bgr).data)
+    return digest.hexdigest()
 
 
 def format_dl_fields(extracted: Dict) -> Dict[str, str]: